@@ -0,0 +1,100 @@
+'''
+the modular arithmetic of a problem: Num objects built and time spent per problem in Problem.parse,
+Problem.to_sol and the check of the solution (tools_test.true_correct, which runs Parser.correct_cal).
+
+The problems are drawn as in generate_parallel_op15.py, with fixed seeds. Nums are counted with a profile hook:
+a call of Num.__new__ / Num.__init__, or of an arithmetic method that builds its result without them.
+The times come from a second pass without the hook.
+
+usage: python benchmarks/num_core.py [--problems 200] [--op 15]
+'''
+import os, sys, time, argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_gen.pretrain.id_gen import IdGen
+from math_gen.problem_gen import Problem, Num
+from tools.rng import Rng
+from tools import tools_test
+from const.params import test_bin
+
+STAGES = ("parse", "to_sol", "verify")
+CTORS = ("__new__", "__init__")
+ARITH = ("__add__", "__sub__", "__mul__", "__radd__")
+
+class Meter(object):
+    '''
+    time and Nums built per stage. Only the outermost call of a stage is measured.
+    '''
+    def __init__(self, count: bool):
+        self.count = count
+        self.seconds = {stage: 0. for stage in STAGES}
+        self.nums = {stage: 0 for stage in STAGES}
+        self.stage = None
+        self.arith = [] # one flag per open arithmetic call: whether it called a constructor
+
+    def profile(self, frame, event, arg):
+        if self.stage is None or event not in ("call", "return"):
+            return
+        code = frame.f_code
+        if not code.co_qualname.startswith("Num"):
+            return
+        name = code.co_name
+        if event == "call":
+            if name in CTORS:
+                self.nums[self.stage] += 1
+                if self.arith:
+                    self.arith[-1] = True
+            elif name in ARITH:
+                self.arith.append(False)
+        elif name in ARITH and self.arith:
+            if not self.arith.pop():
+                self.nums[self.stage] += 1
+
+    def wrap(self, stage: str, fn):
+        meter = self
+        def wrapped(*args, **kwargs):
+            if meter.stage is not None:
+                return fn(*args, **kwargs)
+            meter.stage = stage
+            if meter.count:
+                sys.setprofile(meter.profile)
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                meter.seconds[stage] += time.perf_counter() - t
+                sys.setprofile(None)
+                meter.stage = None
+        return wrapped
+
+def run(n: int, op: int, count: bool) -> Meter:
+    meter = Meter(count)
+    parse, to_sol, true_correct = Problem.parse, Problem.to_sol, tools_test.true_correct
+    Problem.parse = meter.wrap("parse", parse)
+    Problem.to_sol = meter.wrap("to_sol", to_sol)
+    check = meter.wrap("verify", true_correct)
+    try:
+        for seed in range(n):
+            id_gen = IdGen(max_op=op, op=op, exact_op=True, max_edge=20, perm_level=5, detail_level=0,
+                           rng=Rng.from_seed(seed))
+            id_gen.gen_prob(test_bin, p_format="pq")
+            correct, _, _ = check(id_gen.sol, id_gen.problem)
+            assert correct
+    finally:
+        Problem.parse, Problem.to_sol = parse, to_sol
+    return meter
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--problems', type=int, default=200, help='problems to generate')
+    parser.add_argument('--op', type=int, default=15, help='operations per problem')
+    args = parser.parse_args()
+
+    counted = run(args.problems, args.op, count=True)
+    timed = run(args.problems, args.op, count=False)
+    print(f"{args.problems} problems of op={args.op}, per problem:")
+    for stage in STAGES:
+        print(f"{stage:>7}: {counted.nums[stage] / args.problems:8.1f} Nums, "
+              f"{timed.seconds[stage] / args.problems * 1e6:8.1f} us")
@@ -0,0 +1,99 @@
+'''
+cold start cost of a generation worker: import time and resident memory of a fresh interpreter
+that imports what a spawned worker of generate_parallel_*.py imports.
+
+"core" is the current import graph. "legacy" additionally loads what the generation code used to load at import
+(torch, torch.distributed, pandas, transformers, the GPT-2 tokenizer, matplotlib and networkx), for comparison.
+
+usage: python benchmarks/startup.py [--runs 5] [--workers 8]
+'''
+import os, sys, json, time, argparse, statistics, subprocess
+import multiprocessing as mp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CORE = [
+    "data_gen.pretrain.id_gen",
+    "tools.tools_test",
+    "tools.parallel",
+]
+LEGACY = [
+    "torch",
+    "torch.nn.functional",
+    "torch.distributed",
+    "pandas",
+    "transformers",
+    "matplotlib.patches",
+    "matplotlib.lines",
+    "networkx",
+]
+HEAVY = ["torch", "transformers", "pandas", "matplotlib", "networkx"]
+
+PROBE = '''
+import sys, time, json, importlib, resource
+t = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+if {tokenizer!r}:
+    from tools.tools import get_tokenizer
+    get_tokenizer()
+t = time.perf_counter() - t
+print(json.dumps({{
+    "seconds": t,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+'''
+
+def probe(modules, tokenizer: bool) -> dict:
+    '''
+    import modules in a fresh interpreter and return its import time and peak RSS.
+    '''
+    code = PROBE.format(modules=modules, tokenizer=tokenizer, heavy=HEAVY)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def spawn_child(result_queue):
+    import resource
+    t = time.perf_counter()
+    for name in CORE:
+        __import__(name)
+    result_queue.put((time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+def spawn_workers(n: int) -> dict:
+    '''
+    start n spawned workers which import the core modules, as run_streams does, and wait until all of them are ready.
+    '''
+    ctx = mp.get_context("spawn")
+    result_queue = ctx.Queue()
+    t = time.perf_counter()
+    processes = [ctx.Process(target=spawn_child, args=(result_queue,)) for _ in range(n)]
+    for p in processes:
+        p.start()
+    results = [result_queue.get() for _ in range(n)]
+    ready = time.perf_counter() - t
+    for p in processes:
+        p.join()
+    return {"workers": n, "all_ready_seconds": ready, "max_rss_mb": max(rss for _, rss in results)}
+
+def summarize(name: str, runs: list):
+    seconds = [r["seconds"] for r in runs]
+    rss = [r["max_rss_mb"] for r in runs]
+    print(f"{name:>7}: import {statistics.median(seconds):.3f}s (min {min(seconds):.3f}s), "
+          f"RSS {statistics.median(rss):.0f} MB, heavy modules loaded: {runs[0]['heavy']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per configuration')
+    parser.add_argument('--workers', type=int, default=8, help='spawned workers for the pool start-up measurement')
+    parser.add_argument('--skip_legacy', action='store_true', help='do not measure the legacy import graph')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    summarize("core", [probe(CORE, False) for _ in range(args.runs)])
+    if not args.skip_legacy:
+        summarize("legacy", [probe(LEGACY + CORE, True) for _ in range(args.runs)])
+    if args.workers > 0:
+        stats = spawn_workers(args.workers)
+        print(f"  spawn: {stats['workers']} workers ready after {stats['all_ready_seconds']:.2f}s, "
+              f"max RSS per worker {stats['max_rss_mb']:.0f} MB")
@@ -15,5 +15,10 @@ test_bin = [16, 17, 18, 19, 20, 21, 22]
 lora_train_bin = train_bin
 lora_test_bin = test_bin
 all_bin = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22]
+# solution template hash split of the dataset scripts, see README: train < 17 <= test (16 is in train here, in test above)
+data_train_bin = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16]
+data_test_bin = [17, 18, 19, 20, 21, 22]
+# parameter draws before gen_prob gives up when it only accepts some of the hash bins and no max_attempts is given
+gen_try_num = 10000
 
 feasible_symbols = list(string.ascii_lowercase[:26]) + list(string.ascii_uppercase[:26])
@@ -3,12 +3,13 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-import random
+from tools.rng import Rng, get_rng
 
 # No dot (".") is allowed in the parameter names, since it will be used in the parser.
 
 class Data(object):
-    def __init__(self) -> None:
+    def __init__(self, rng: Rng=None) -> None:
+        self.rng = get_rng(rng)
         self.unique = []
         self.categ_list = [
             ["District", "Supermarket", "Product", "Ingredient"],
@@ -570,22 +571,22 @@ class Data(object):
         if not a:
             # generate sequences
             if fix_categ is None:
-                categ_list = random.choice(self.categ_list)
+                categ_list = self.rng.py.choice(self.categ_list)
             else:
                 categ_list = self.categ_list[fix_categ]
             #print(f"cate idx = {idx}, categ_list = {categ_list}")
             #categ_list = self.categ_list[2]
             #return categ_list[0:idx]
             choices = range(len(categ_list) - idx + 1)
-            choice = random.choice(choices)
+            choice = self.rng.py.choice(choices)
             return categ_list[choice : choice+idx]
         else:
             # generate items and put it into self.unique if it is unique
             item_pool = self.categ_dict[a]
             #print(item_pool)
             #print(idx)
-            item_pool = random.choice(list(item_pool.values()))
-            return random.sample(item_pool, idx)
+            item_pool = self.rng.py.choice(list(item_pool.values()))
+            return self.rng.py.sample(item_pool, idx)
 
     def self_check(self):
         '''
@@ -5,11 +5,13 @@
 
 from math_gen.problem_gen import Problem
 from data_gen.prototype.id_gen import IdGen_PT
+from tools.feasibility import FeasibilityOracle
+from tools.rng import Rng
 
 class IdGen(IdGen_PT):
-    def __init__(self, max_op=10, max_edge=15, op=None, perm_level: str = None, detail_level: str = None, be_shortest: bool=True) -> None:
-        super().__init__('light', 'light', max_op, max_edge, op, perm_level, detail_level, be_shortest)
+    def __init__(self, max_op=10, max_edge=15, op=None, perm_level: str = None, detail_level: str = None, be_shortest: bool=True, exact_op: bool=False, oracle: FeasibilityOracle=None, rng: Rng=None, early_hash: bool=False) -> None:
+        super().__init__('light', 'light', max_op, max_edge, op, perm_level, detail_level, be_shortest, exact_op, oracle, rng, early_hash)
     
-    def gen_prob(self, ava_hash, p_format: str, problem: Problem=None):
-        super().gen_prob(ava_hash, p_format, problem=problem)
+    def gen_prob(self, ava_hash, p_format: str, problem: Problem=None, max_attempts: int=None, time_budget: float=None):
+        super().gen_prob(ava_hash, p_format, problem=problem, max_attempts=max_attempts, time_budget=time_budget)
 
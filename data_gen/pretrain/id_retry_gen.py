@@ -3,7 +3,6 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-import random
 import numpy as np
 from math_gen.problem_gen import Problem
 from tools.tools import tokenizer
@@ -11,16 +10,17 @@ from const.params import retry_key_word
 from typing import List
 from torch.utils.data import Dataset
 from data_gen.prototype.id_gen import IdGen_PT
+from tools.rng import Rng
 
-retry_key_word_token = tokenizer.encode(" " + retry_key_word + ".", return_tensors='pt')[0].tolist()
+retry_key_word_token = tokenizer.encode(" " + retry_key_word + ".")
 
 class IdGen(IdGen_PT):
-    def __init__(self, max_op=10, max_edge=15, op=None, perm_level: str = None, detail_level: str = None, retry_rate: int = 0.02) -> None:
-        super().__init__('light', 'light', max_op, max_edge, op, perm_level, detail_level)
+    def __init__(self, max_op=10, max_edge=15, op=None, perm_level: str = None, detail_level: str = None, retry_rate: int = 0.02, rng: Rng=None) -> None:
+        super().__init__('light', 'light', max_op, max_edge, op, perm_level, detail_level, rng=rng)
         self.retry_rate = retry_rate
     
-    def gen_prob(self, ava_hash, p_format: str, problem: Problem=None):
-        super().gen_prob(ava_hash, p_format, problem=problem)
+    def gen_prob(self, ava_hash, p_format: str, problem: Problem=None, max_attempts: int=None, time_budget: float=None):
+        super().gen_prob(ava_hash, p_format, problem=problem, max_attempts=max_attempts, time_budget=time_budget)
     
     def insert_retry(self):
         self.sols = []
@@ -34,7 +34,7 @@ class IdGen(IdGen_PT):
         if len(self.sols) != len(self.problem.solution):
             raise ValueError(f"len(self.sols) != len(self.problem.solution):\n{len(self.sols)} != {len(self.problem.solution)}")
         
-        self.param_tokens = [tokenizer.encode(" " + self.problem.get_ntn(param), return_tensors='pt')[0].tolist() for param in self.problem.all_param]
+        self.param_tokens = [tokenizer.encode(" " + self.problem.get_ntn(param)) for param in self.problem.all_param]
         num_params = len(self.param_tokens)
         non_appear_list = list(range(num_params))
         self.labels = self.problem.lora_label(keys=["can_next"])
@@ -45,15 +45,15 @@ class IdGen(IdGen_PT):
             indices:List[int] = np.where(self.labels[i, :, 0] == 0)[0].tolist()
             indices = [idx for idx in indices if idx in non_appear_list]
             while indices:
-                if random.random() < self.retry_rate:
-                    wrng_param_index = random.choice(indices)
+                if self.rng.py.random() < self.retry_rate:
+                    wrng_param_index = self.rng.py.choice(indices)
                     indices.remove(wrng_param_index)
                     # non_appear_list.remove(wrng_param_index)
                     self.new_sols.append([2896, 500] + self.param_tokens[wrng_param_index] + [355] + retry_key_word_token)
                 else:
                     break
             
-            self.new_sols.append(tokenizer.encode(param_sol, return_tensors='pt')[0].tolist())
+            self.new_sols.append(tokenizer.encode(param_sol))
             idx = self.problem.all_param.index(self.problem.topological_order[i])
             non_appear_list.remove(idx)
         
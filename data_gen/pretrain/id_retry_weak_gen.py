@@ -3,22 +3,22 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-import random
 from math_gen.problem_gen import Problem
 from tools.tools import tokenizer
 from const.params import retry_key_word
 from data_gen.prototype.id_gen import IdGen_PT
+from tools.rng import Rng
 
-retry_key_word_token = tokenizer.encode(" " + retry_key_word + ".", return_tensors='pt')[0].tolist()
+retry_key_word_token = tokenizer.encode(" " + retry_key_word + ".")
 
 class IdGen(IdGen_PT):
-    def __init__(self, max_op=10, max_edge=15, op=None, perm_level: str = None, detail_level: str = None, retry_rate: int = 0.02, self_contain=True) -> None:
-        super().__init__('light', 'light', max_op, max_edge, op, perm_level, detail_level)
+    def __init__(self, max_op=10, max_edge=15, op=None, perm_level: str = None, detail_level: str = None, retry_rate: int = 0.02, self_contain=True, rng: Rng=None) -> None:
+        super().__init__('light', 'light', max_op, max_edge, op, perm_level, detail_level, rng=rng)
         self.retry_rate = retry_rate
         self.self_contain = self_contain
     
-    def gen_prob(self, ava_hash, p_format: str, problem: Problem=None):
-        super().gen_prob(ava_hash, p_format, problem=problem)
+    def gen_prob(self, ava_hash, p_format: str, problem: Problem=None, max_attempts: int=None, time_budget: float=None):
+        super().gen_prob(ava_hash, p_format, problem=problem, max_attempts=max_attempts, time_budget=time_budget)
     
     def insert_retry(self):
         self.sols = []
@@ -32,7 +32,7 @@ class IdGen(IdGen_PT):
         if len(self.sols) != len(self.problem.solution):
             raise ValueError(f"len(self.sols) != len(self.problem.solution):\n{len(self.sols)} != {len(self.problem.solution)}")
         
-        self.param_tokens = [tokenizer.encode(" " + self.problem.get_ntn(param), return_tensors='pt')[0].tolist() for param in self.problem.all_param]
+        self.param_tokens = [tokenizer.encode(" " + self.problem.get_ntn(param)) for param in self.problem.all_param]
         # self.labels = self.problem.lora_label(keys=["can_next"])
         
         self.new_sols = []
@@ -45,15 +45,15 @@ class IdGen(IdGen_PT):
             else:
                 indices = sol_indices[i+1:]
             while indices:
-                if random.random() < self.retry_rate:
-                    wrng_param_index = random.choice(indices)
+                if self.rng.py.random() < self.retry_rate:
+                    wrng_param_index = self.rng.py.choice(indices)
                     indices.remove(wrng_param_index)
                     # non_appear_list.remove(wrng_param_index)
                     self.new_sols.append([2896, 500] + self.param_tokens[wrng_param_index] + [355] + retry_key_word_token)
                 else:
                     break
             
-            self.new_sols.append(tokenizer.encode(param_sol, return_tensors='pt')[0].tolist())
+            self.new_sols.append(tokenizer.encode(param_sol))
         
         self.sol_token = sum(self.new_sols, start=[])
 
@@ -3,14 +3,48 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-import random
-from const.params import dot
+import time
+from const.params import dot, all_bin, gen_try_num
 from math_gen.problem_gen import Problem
-from typing import Optional
-from tools.tools import choose_from_softmax, tokenizer
+from typing import Optional, List
+from tools.tools import choose_from_softmax, get_tokenizer
+from tools import instrument
+from tools.feasibility import FeasibilityOracle
+from tools.rng import Rng, get_rng
+
+class GaveUp(RuntimeError):
+    '''
+    raised by IdGen_PT.gen_prob when its attempt or time budget runs out before a problem is accepted.
+    '''
+    def __init__(self, reason: str, attempts: int, elapsed: float, op: int):
+        super().__init__(f"gave up on op={op} after {attempts} attempts in {elapsed:.2f}s ({reason} budget)")
+        self.reason = reason # "attempts" or "time"
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.op = op
 
 class IdGen_PT(object):
-    def __init__(self, style: str, op_style: str, max_op=10, max_edge=15, op=None, perm_level: str=None, detail_level: str=None, be_shortest: bool=True) -> None:
+    # token ids of the generated text, encoded lazily from the text on first access (see __getattr__)
+    text_attrs = ("ques", "prob", "sol", "ans")
+    token_attrs = ("ques_token", "prob_token", "sol_token", "ans_token", "token_id", "prob_id")
+
+    def __init__(self, style: str, op_style: str, max_op=10, max_edge=15, op=None, perm_level: str=None, detail_level: str=None, be_shortest: bool=True, exact_op: bool=False, oracle: Optional[FeasibilityOracle]=None, rng: Optional[Rng]=None, early_hash: bool=False) -> None:
+        '''
+        exact_op: sample the parameters conditioned on the target op self.op_.
+        Since problem.n_op never exceeds s, any draw with s < self.op_ is rejected in gen_prob for sure.
+        With exact_op, s is drawn from the same style distribution restricted to s >= self.op_,
+        so the accepted problems follow the same distribution with far fewer rejected draws.
+        If op is given as well, the problems follow the op=None distribution conditioned on self.op_ == op.
+        oracle: drop the attempts it rejects before building a graph, and stop an attempt as soon as its sorted template
+        settles on another number of operations than self.op_ (see Problem.gen). Only doomed attempts are dropped,
+        so the accepted problems follow the same distribution, but a seed gives other problems than without it.
+        rng: the random generators of this generator and its problems, default the global ones (see tools.rng).
+        early_hash: check the number of operations and the solution template hash (Problem.template_hash) of an attempt
+        before its problem is shuffled and rendered, and drop it there. The accepted problems follow the same distribution,
+        but a seed gives other problems than without it, since the dropped attempts draw fewer random numbers.
+        '''
+        if exact_op and style != "light":
+            raise ValueError(f"exact_op is only implemented for the light style, but style is {style} here.")
         self.style = style
         self.op_style = op_style
         self.max_op = max_op
@@ -25,92 +59,96 @@ class IdGen_PT(object):
         self.detail_level = detail_level
 
         self.be_shortest = be_shortest
+        self.exact_op = exact_op
+        self.oracle = oracle
+        self.rng = get_rng(rng)
+        self.early_hash = early_hash
 
         self.op_ = self.gen_sol_op(op_style)
-        self.perm_level_ = random.randint(0, 6) if self.perm_level == None else self.perm_level
-        self.detail_level_ = random.randint(0, 11) if self.detail_level == None else self.detail_level
+        self.perm_level_ = self.rng.py.randint(0, 6) if self.perm_level == None else self.perm_level
+        self.detail_level_ = self.rng.py.randint(0, 11) if self.detail_level == None else self.detail_level
 
     def gen_param(self):
         gen_param = getattr(self, f"gen_param_{self.style}")
         gen_param()
 
     def gen_param_heavy(self):
-        self.p = random.random()
+        self.p = self.rng.py.random()
         '''n = random.choice(range(1, max_op))
         m = random.choice(range(n, max_op))
         s = random.choice(range(m, max_op))'''
         if self.op == None:
-            self.n = random.choice(range(1, self.max_op+1))
-            self.m = random.choice(range(self.n, self.max_op+1))
-            self.s = random.choice(range(self.m, self.max_op+1))
+            self.n = self.rng.py.choice(range(1, self.max_op+1))
+            self.m = self.rng.py.choice(range(self.n, self.max_op+1))
+            self.s = self.rng.py.choice(range(self.m, self.max_op+1))
         else:
             self.s = self.op
-            self.n = random.choice(range(1, self.s+1))
-            self.m = random.choice(range(self.n, self.s+1))
+            self.n = self.rng.py.choice(range(1, self.s+1))
+            self.m = self.rng.py.choice(range(self.n, self.s+1))
         
         relative_dist = (self.s - 1) / (self.max_edge - 1) # from 0 to 1
         temperature = 1.
         pos = [0.2, 0.5, 0.8]
         weight = [-(relative_dist - i)**2 / temperature for i in pos]
         
-        self.d = choose_from_softmax([2, 3, 4], weight=weight)
-        t0 = choose_from_softmax([2, 3, 4], weight=weight)
-        t1 = choose_from_softmax([2, 3, 4], weight=weight)
+        self.d = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t0 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t1 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
         self.w0 = min(t0, t1)
         self.w1 = max(t0, t1)
         
         # n, m, s = 12, 16, 16
-        if random.random() < 0.5:
-            self.e = random.choice(range(self.max_edge+1))
+        if self.rng.py.random() < 0.5:
+            self.e = self.rng.py.choice(range(self.max_edge+1))
         else:
-            self.e = random.choice(range(self.s, self.max_edge+1))
+            self.e = self.rng.py.choice(range(self.s, self.max_edge+1))
 
     def gen_param_uniform(self):
-        self.p = random.random()
+        self.p = self.rng.py.random()
         '''n = random.choice(range(1, max_op))
         m = random.choice(range(n, max_op))
         s = random.choice(range(m, max_op))'''
         if self.op == None:
-            self.s = random.choice(range(1, self.max_op+1))
-            self.m = random.choice(range(1, self.s+1))
-            self.n = random.choice(range(1, self.m+1))
+            self.s = self.rng.py.choice(range(1, self.max_op+1))
+            self.m = self.rng.py.choice(range(1, self.s+1))
+            self.n = self.rng.py.choice(range(1, self.m+1))
         else:
             self.s = self.op
-            self.m = random.choice(range(1, self.s+1))
-            self.n = random.choice(range(1, self.m+1))
+            self.m = self.rng.py.choice(range(1, self.s+1))
+            self.n = self.rng.py.choice(range(1, self.m+1))
         
         relative_dist = (self.s - 1) / (self.max_edge - 1) # from 0 to 1
         temperature = 1.
         pos = [0.2, 0.5, 0.8]
         weight = [-(relative_dist - i)**2 / temperature for i in pos]
         
-        self.d = choose_from_softmax([2, 3, 4], weight=weight)
-        t0 = choose_from_softmax([2, 3, 4], weight=weight)
-        t1 = choose_from_softmax([2, 3, 4], weight=weight)
+        self.d = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t0 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t1 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
         self.w0 = min(t0, t1)
         self.w1 = max(t0, t1)
         # n, m, s = 12, 16, 16
-        if random.random() < 0.5:
-            self.e = random.choice(range(self.max_edge+1))
+        if self.rng.py.random() < 0.5:
+            self.e = self.rng.py.choice(range(self.max_edge+1))
         else:
-            self.e = random.choice(range(self.s, self.max_edge+1))
+            self.e = self.rng.py.choice(range(self.s, self.max_edge+1))
 
     def gen_param_middle(self):
-        self.p = random.random()
+        self.p = self.rng.py.random()
         '''n = random.choice(range(1, max_op))
         m = random.choice(range(n, max_op))
         s = random.choice(range(m, max_op))'''
         if self.op == None:
-            t0 = random.choice(range(1, self.max_op+1))
-            t1 = random.choice(range(1, self.max_op+1))
-            t2 = random.choice(range(1, self.max_op+1))
+            t0 = self.rng.py.choice(range(1, self.max_op+1))
+            t1 = self.rng.py.choice(range(1, self.max_op+1))
+            t2 = self.rng.py.choice(range(1, self.max_op+1))
             self.s = max(t0, t1, t2)
             self.n = min(t0, t1, t2)
             self.m = t0 + t1 + t2 - self.s - self.n
         else:
             self.s = self.op
-            t0 = random.choice(range(1, self.s+1))
-            t1 = random.choice(range(1, self.s+1))
+            t0 = self.rng.py.choice(range(1, self.s+1))
+            t1 = self.rng.py.choice(range(1, self.s+1))
             self.m = max(t0, t1)
             self.n = min(t0, t1)
         
@@ -119,78 +157,120 @@ class IdGen_PT(object):
         pos = [0.2, 0.5, 0.8]
         weight = [-(relative_dist - i)**2 / temperature for i in pos]
         
-        self.d = choose_from_softmax([2, 3, 4], weight=weight)
-        t0 = choose_from_softmax([2, 3, 4], weight=weight)
-        t1 = choose_from_softmax([2, 3, 4], weight=weight)
+        self.d = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t0 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t1 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
         self.w0 = min(t0, t1)
         self.w1 = max(t0, t1)
 
         # n, m, s = 12, 16, 16
-        if random.random() < 0.5:
-            self.e = random.choice(range(self.max_edge+1))
+        if self.rng.py.random() < 0.5:
+            self.e = self.rng.py.choice(range(self.max_edge+1))
         else:
-            self.e = random.choice(range(self.s, self.max_edge+1))
+            self.e = self.rng.py.choice(range(self.s, self.max_edge+1))
 
     def gen_param_light(self):
-        if self.op == None:
-            t0 = random.choice(range(1, self.max_op+1))
-            t1 = random.choice(range(1, self.max_op+1))
+        if self.exact_op:
+            # min(t0, t1) conditioned on min(t0, t1) >= op_ is the min of two uniform draws from [op_, max_op]
+            max_op = max(self.max_op, self.op_)
+            t0 = self.rng.py.randint(self.op_, max_op)
+            t1 = self.rng.py.randint(self.op_, max_op)
             self.s = min(t0, t1)
-            t0 = random.randint(1, self.s)
-            t1 = random.randint(1, self.s)
+            t0 = self.rng.py.randint(1, self.s)
+            t1 = self.rng.py.randint(1, self.s)
             self.n = max(t0, t1)
-            self.m = random.randint(self.n, self.s)
+            self.m = self.rng.py.randint(self.n, self.s)
+        elif self.op == None:
+            t0 = self.rng.py.choice(range(1, self.max_op+1))
+            t1 = self.rng.py.choice(range(1, self.max_op+1))
+            self.s = min(t0, t1)
+            t0 = self.rng.py.randint(1, self.s)
+            t1 = self.rng.py.randint(1, self.s)
+            self.n = max(t0, t1)
+            self.m = self.rng.py.randint(self.n, self.s)
         else:
             self.s = self.op
-            t0 = random.randint(1, self.s)
-            t1 = random.randint(1, self.s)
+            t0 = self.rng.py.randint(1, self.s)
+            t1 = self.rng.py.randint(1, self.s)
             self.n = max(t0, t1)
-            self.m = random.randint(self.n, self.s)
+            self.m = self.rng.py.randint(self.n, self.s)
         
         relative_dist = (self.s - 1) / (self.max_edge - 1) # from 0 to 1
         temperature = 1.
         pos = [0.2, 0.5, 0.8]
         weight = [-(relative_dist - i)**2 / temperature for i in pos]
         
-        self.d = choose_from_softmax([2, 3, 4], weight=weight)
-        t0 = choose_from_softmax([2, 3, 4], weight=weight)
-        t1 = choose_from_softmax([2, 3, 4], weight=weight)
+        self.d = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t0 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
+        t1 = choose_from_softmax([2, 3, 4], weight=weight, rng=self.rng)
         self.w0 = min(t0, t1)
         self.w1 = max(t0, t1)
-        self.p = random.random()
+        self.p = self.rng.py.random()
         '''n = random.choice(range(1, max_op))
         m = random.choice(range(n, max_op))
         s = random.choice(range(m, max_op))'''
         # n, m, s = 12, 16, 16
         min_e = (self.d-1) * self.w0
-        t0 = random.randint(min_e, self.max_edge)
-        t1 = random.randint(min_e, self.max_edge)
+        t0 = self.rng.py.randint(min_e, self.max_edge)
+        t1 = self.rng.py.randint(min_e, self.max_edge)
         self.e = min(t0, t1)
 
     def gen_sol_op(self, style):
         if self.op != None:
             return self.op
         if style == "uniform":
-            return random.choice(range(1, self.max_op+1))
+            return self.rng.py.choice(range(1, self.max_op+1))
         if style == "heavy":
-            t0 = random.choice(range(1, self.max_op+1))
-            t1 = random.choice(range(t0, self.max_op+1))
-            t2 = random.choice(range(t1, self.max_op+1))
+            t0 = self.rng.py.choice(range(1, self.max_op+1))
+            t1 = self.rng.py.choice(range(t0, self.max_op+1))
+            t2 = self.rng.py.choice(range(t1, self.max_op+1))
             return t2
         if style == "middle":
-            t0 = random.choice(range(1, self.max_op+1))
-            t1 = random.choice(range(1, self.max_op+1))
-            t2 = random.choice(range(1, self.max_op+1))
+            t0 = self.rng.py.choice(range(1, self.max_op+1))
+            t1 = self.rng.py.choice(range(1, self.max_op+1))
+            t2 = self.rng.py.choice(range(1, self.max_op+1))
             return max(t0, t1, t2)
         if style == "light":
-            t0 = random.choice(range(1, self.max_op+1))
-            t1 = random.choice(range(1, self.max_op+1))
+            t0 = self.rng.py.choice(range(1, self.max_op+1))
+            t1 = self.rng.py.choice(range(1, self.max_op+1))
             return min(t0, t1)
 
-    def gen_prob(self, ava_hash, p_format: str, problem: Optional[Problem]=None):
+    def gen_prob(self, ava_hash, p_format: str, problem: Optional[Problem]=None, max_attempts: Optional[int]=None, time_budget: Optional[float]=None):
+        '''
+        draw parameters and generate problems until one has self.op_ operations and its solution template hash in ava_hash,
+        or take the given problem. the accepted hash is kept in self.problem.hash_val.
+        max_attempts, time_budget: raise GaveUp once that many parameter draws or seconds are spent. A time budget makes
+        the output depend on the speed of the machine; an attempt budget does not.
+        if ava_hash leaves out some hash bins and neither budget is given, max_attempts defaults to gen_try_num,
+        since the drawn op_ is kept across the attempts and may rarely or never land in ava_hash.
+        the attempts and the latency of every call are observed in the instrument histograms
+        gen_prob.attempts.op{op_} and gen_prob.latency.op{op_}, also when it gives up.
+        '''
         if not problem:
+            if max_attempts is None and time_budget is None and not set(all_bin) <= set(ava_hash):
+                max_attempts = gen_try_num
+            start = time.perf_counter()
+            deadline = None if time_budget is None else start + time_budget
+            attempts = 0
             while True:
-                self.gen_param()
+                if max_attempts is not None and attempts >= max_attempts:
+                    reason = "attempts"
+                elif deadline is not None and time.perf_counter() > deadline:
+                    reason = "time"
+                else:
+                    reason = None
+                if reason is not None:
+                    elapsed = time.perf_counter() - start
+                    instrument.count(f"gen_prob.gave_up.{reason}")
+                    instrument.observe(f"gen_prob.attempts.op{self.op_}", attempts)
+                    instrument.observe(f"gen_prob.latency.op{self.op_}", elapsed)
+                    raise GaveUp(reason, attempts, elapsed, self.op_)
+                attempts += 1
+                instrument.count("gen_prob.attempts")
+                with instrument.timer("param_sampling"):
+                    self.gen_param()
+                if self.oracle is not None and self.oracle.skip(self.d, self.w0, self.w1, self.e, self.n, self.m, self.s, self.op_):
+                    continue
 
                 # define permutation level
                 if self.perm_level_ <= 4:
@@ -233,17 +313,54 @@ class IdGen_PT(object):
                     "sol_sort": False, # not important for now.
                     "perm": perm, # make the solution's order different from problem's.
                 }
-                self.problem = Problem(self.d, self.w0, self.w1, self.e, self.p, args=args, be_shortest=self.be_shortest)
-                feasible = self.problem.gen(self.n, self.m, self.s)
+                self.problem = Problem(self.d, self.w0, self.w1, self.e, self.p, args=args, be_shortest=self.be_shortest, rng=self.rng)
+                with instrument.timer("problem.gen"):
+                    feasible = self.problem.gen(self.n, self.m, self.s, n_op=None if self.oracle is None else self.op_, deadline=deadline)
+                # cut short by the time budget, which says nothing about the graph shape
+                cut = not feasible and deadline is not None and time.perf_counter() > deadline
+                if self.oracle is not None and not cut:
+                    self.oracle.record(self.d, self.w0, self.w1, self.e, self.n, self.m, self.problem.n_op is not None)
                 if not feasible:
+                    if cut:
+                        continue
+                    if self.problem.n_op is None:
+                        instrument.count("reject.infeasible")
+                    else:
+                        instrument.count("oracle.skip.n_op")
+                        instrument.count("reject.n_op")
+                    continue
+                hash_val = None
+                if self.early_hash:
+                    if self.problem.n_op != self.op_:
+                        instrument.count("reject.n_op")
+                        continue
+                    with instrument.timer("parse"):
+                        self.problem.parse_all()
+                    with instrument.timer("template_hash"):
+                        hash_val = self.problem.template_hash()
+                    if hash_val is None:
+                        instrument.count("template_hash.names_clash")
+                    elif hash_val not in ava_hash:
+                        instrument.count("reject.hash")
+                        continue
+                with instrument.timer("to_problem"):
+                    self.problem.to_problem(parsed=self.early_hash, lazy=True)
+                if self.problem.n_op != self.op_:
+                    instrument.count("reject.n_op")
                     continue
-                self.problem.to_problem()
-                if self.problem.n_op != self.op_ or self.problem.to_hash() not in ava_hash:
-                    # if self.problem.n_op != self.op_:
-                    #     print(f"reject reason: {self.problem.n_op} != {self.op_}")
-                    # else:
-                    #     print("reject reason: not in ava_hash")
+                if hash_val is None:
+                    with instrument.timer("hash"):
+                        # the text is only rendered for the hash if the names clash
+                        hash_val = self.problem.template_hash()
+                        if hash_val is None:
+                            hash_val = self.problem.to_hash()
+                if hash_val not in ava_hash:
+                    instrument.count("reject.hash")
                     continue
+                self.problem.hash_val = hash_val
+                instrument.count("gen_prob.accepted")
+                instrument.observe(f"gen_prob.attempts.op{self.op_}", attempts)
+                instrument.observe(f"gen_prob.latency.op{self.op_}", time.perf_counter() - start)
                 break
         else:
             self.problem = problem
@@ -255,8 +372,6 @@ class IdGen_PT(object):
         ques = " " + self.problem.problem[-1]
         self.ques = ques
 
-        self.ques_token = tokenizer.encode(ques, return_tensors='pt')[0].tolist()
-
         self.prob = ""
         for char in p_format:
             if char == "p":
@@ -265,14 +380,39 @@ class IdGen_PT(object):
                 self.prob += ques
         # self.prob += f" Answer in detail level_{self.detail_level_}."
         self.sol = " " + ". ".join(self.problem.solution) + "."
+        self.ans = f" {self.problem.ans}"
+
+        # drop the tokens of the previous problem, the new ones are encoded when they are asked for
+        for name in self.token_attrs:
+            self.__dict__.pop(name, None)
+
+    def __getattr__(self, name: str):
+        '''
+        only called for missing attributes: encode the token ids of the text on first access and keep them.
+        text-only callers never pay for the BPE. Subclasses may still overwrite the tokens by assignment.
+        '''
+        if name not in IdGen_PT.token_attrs or "sol" not in self.__dict__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        if name == "token_id":
+            value = [222] + self.prob_token + [223] + self.sol_token + [224] + self.ans_token + [50256]
+        elif name == "prob_id":
+            value = [50256] + [222] + self.prob_token + [223]
+        else:
+            IdGen_PT.encode_tokens([self])
+            return self.__dict__[name]
+        self.__dict__[name] = value
+        return value
 
-        prob_token = tokenizer.encode(self.prob, return_tensors='pt')[0].tolist()
-        self.prob_token = prob_token
-        sol_token = tokenizer.encode(self.sol, return_tensors='pt')[0].tolist()
-        self.sol_token = sol_token
-        ans_ = f" {self.problem.ans}"
-        ans_token = tokenizer.encode(ans_, return_tensors='pt')[0].tolist()
-        self.ans_token = ans_token
-        self.token_id = [222] + prob_token + [223] + sol_token + [224] + ans_token + [50256]
-        self.prob_id = [50256] + [222] + prob_token + [223]
+    @staticmethod
+    def encode_tokens(id_gens: List["IdGen_PT"]):
+        '''
+        encode the missing ques/prob/sol/ans tokens of many generated problems in one batch.
+        '''
+        jobs = [(id_gen, name) for id_gen in id_gens for name in IdGen_PT.text_attrs if name + "_token" not in id_gen.__dict__]
+        if not jobs:
+            return
+        with instrument.timer("tokenize"):
+            tokens = get_tokenizer().encode_batch([getattr(id_gen, name) for id_gen, name in jobs])
+        for (id_gen, name), token in zip(jobs, tokens):
+            id_gen.__dict__[name + "_token"] = token
 
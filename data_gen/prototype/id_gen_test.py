@@ -0,0 +1,35 @@
+import pytest
+from data_gen.prototype import id_gen as id_gen_module
+from data_gen.prototype.id_gen import IdGen_PT, GaveUp
+from const.params import all_bin
+from tools import instrument
+from tools.rng import Rng
+
+def new_id_gen(seed: int) -> IdGen_PT:
+    return IdGen_PT("light", "light", max_op=15, max_edge=20, perm_level=5, detail_level=0, rng=Rng.from_seed(seed))
+
+def test_gave_up_attempts():
+    # no hash bin can be hit: the attempt budget raises and the attempts are observed
+    instrument.reset()
+    id_gen = new_id_gen(0)
+    with pytest.raises(GaveUp) as info:
+        id_gen.gen_prob([], p_format="pq", max_attempts=1)
+    assert info.value.reason == "attempts"
+    assert info.value.attempts == 1
+    assert info.value.op == id_gen.op_
+    snap = instrument.snapshot()
+    hist = snap["histograms"][f"gen_prob.attempts.op{id_gen.op_}"]
+    assert hist["count"] == 1 and hist["max"] == 1
+    assert snap["counters"]["gen_prob.gave_up.attempts"] == 1
+
+def test_gave_up_default_budget(monkeypatch):
+    # only some of the bins and no budget: gen_prob gives up after gen_try_num draws instead of looping
+    monkeypatch.setattr(id_gen_module, "gen_try_num", 3)
+    with pytest.raises(GaveUp) as info:
+        new_id_gen(1).gen_prob([], p_format="pq")
+    assert info.value.reason == "attempts"
+    assert info.value.attempts == 3
+    # all bins: no default budget
+    id_gen = new_id_gen(1)
+    id_gen.gen_prob(all_bin, p_format="pq")
+    assert id_gen.problem.hash_val in all_bin
@@ -0,0 +1,137 @@
+from data_gen.pretrain.id_gen import IdGen
+from data_gen.prototype.id_gen import GaveUp
+from tools.tools import fix_seed
+from tools.tools_test import true_correct
+import os
+import argparse
+from tqdm import tqdm
+import time
+import multiprocessing as mp
+from const.params import data_train_bin, data_test_bin
+from tools import instrument
+from tools.parallel import run_streams, print_stats
+from tools.buckets import Bucket, BucketSink, plan_streams
+from tools.feasibility import FeasibilityOracle, update_cache, load_doomed
+from tools.rng import Rng
+
+def generate_stream_sample(max_op, op, bins, doomed, max_attempts, seed):
+    # Generate med difficulty problem
+    id_gen = IdGen(
+        max_op=max_op,       # Maximum number of operations
+        op=op,               # Exact number of operations, or None for any op up to max_op
+        exact_op=True,       # Sample the parameters conditioned on the drawn op
+        max_edge=20,         # Maximum number of edges in the structure graph
+        oracle=FeasibilityOracle(doomed), # Drop the attempts which cannot reach the op before building them
+        rng=Rng.from_seed(seed), # Random generators of this sample, the same draws as seeding the global ones
+        perm_level=5,        # Random shuffle level for problem description
+        detail_level=0       # Most detailed solution format
+    )
+
+    try:
+        # Generate problem in pq format, accepting the solution templates of the stream (see plan_streams)
+        id_gen.gen_prob(bins, p_format="pq", max_attempts=max_attempts)
+
+        # Get problem, solution and answer
+        prob_text = id_gen.prob
+        sol_text = id_gen.sol
+        ans_text = id_gen.ans
+
+        # Keep only verified solutions
+        with instrument.timer("verify"):
+            correct, my_print, parser = true_correct(sol_text, id_gen.problem)
+        if not correct:
+            instrument.count("reject.verify")
+            return None
+
+        # Construct data item; operations and solution_template_hash decide the bucket
+        data = {
+            "text": f"Question:{prob_text}\nSolution:{sol_text}\nAnswer:{ans_text}\n\n",
+            "steps_required": len(sol_text.split('.')),
+            "numerical_answer": ans_text.strip(),
+            "solution_template_hash": id_gen.problem.hash_val,
+            "operations": id_gen.op_
+        }
+        instrument.count("accepted")
+        return data
+    except GaveUp as e:
+        # the attempt budget ran out, skip this seed
+        instrument.count(f"reject.gave_up.{e.reason}")
+        return None
+    except Exception as e:
+        instrument.count("reject.exception")
+        print(f"Error generating sample: {str(e)}")
+    return None
+
+def main(resume=False, skip_doomed=False):
+    # Parameters
+    num_cpus = 96  # Total number of CPUs
+    block_size = 8  # Seeds handed to a worker at a time
+    max_attempts = 10000  # Parameter draws per seed before gen_prob gives up on it
+    base_seed = 0  # Stream i draws its seeds from sample_seed(base_seed + i, attempt)
+
+    output_dir = "./output/igsm_med_pq_datasets"
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Target buckets: the le15 train set and the README eval sets
+    buckets = [
+        Bucket(os.path.join(output_dir, 'igsm_med_pq_train_le15.json'), 15, "le", data_train_bin, 50000),
+        Bucket(os.path.join(output_dir, 'igsm_med_pq_eval_le15.json'), 15, "le", data_test_bin, 4096),
+        Bucket(os.path.join(output_dir, 'igsm_med_pq_eval_e15.json'), 15, "eq", data_test_bin, 4096),
+        Bucket(os.path.join(output_dir, 'igsm_med_pq_eval_e20.json'), 20, "eq", data_test_bin, 4096),
+        Bucket(os.path.join(output_dir, 'igsm_med_pq_eval_e21.json'), 21, "eq", data_test_bin, 4096),
+        Bucket(os.path.join(output_dir, 'igsm_med_pq_eval_e22.json'), 22, "eq", data_test_bin, 4096),
+        Bucket(os.path.join(output_dir, 'igsm_med_pq_eval_e23.json'), 23, "eq", data_test_bin, 4096),
+    ]
+    plan = plan_streams(buckets)
+    # Graph shapes that never produced a template in earlier runs, frozen for this run. Off by default: the rule is
+    # empirical and drops shapes which may still succeed, only the provable op bound of the oracle is always on
+    cache_file = os.path.join(output_dir, 'feasibility_cache.json')
+    doomed = load_doomed(cache_file, skip_doomed)
+    streams = [(generate_stream_sample, (max_op, op, bins, doomed, max_attempts), base_seed + i)
+               for i, (max_op, op, bins, _) in enumerate(plan)]
+    sink = BucketSink(buckets, [stream_buckets for _, _, _, stream_buckets in plan])
+    total_samples = sum(b.quota for b in buckets)
+
+    # Print configuration
+    print(f"Generating {len(buckets)} datasets from {len(streams)} streams")
+    for max_op, op, bins, stream_buckets in plan:
+        print(f"  max_op={max_op}, op={op}: {[os.path.basename(buckets[i].output_file) for i in stream_buckets]}")
+    print(f"Using {num_cpus} CPUs")
+    print(f"Output directory: {output_dir}")
+
+    start_time = time.time()
+    pbar = tqdm(total=total_samples, desc="all buckets")
+    stats = run_streams(
+        streams, sink,
+        num_workers=num_cpus,
+        manifest_file=os.path.join(output_dir, 'igsm_med_pq_multi.manifest.json'),
+        summary_file=os.path.join(output_dir, 'igsm_med_pq_multi.summary.json'),
+        block_size=block_size,
+        progress=pbar,
+        resume=resume,
+    )
+    pbar.close()
+
+    # Print statistics
+    total_time = time.time() - start_time
+    print(f"\nGeneration completed:")
+    print(f"Total time: {total_time/60:.2f} minutes")
+    print_stats(stats)
+    update_cache(cache_file, stats["instrument"])
+    for bucket, count in zip(buckets, sink.counts):
+        print(f"{bucket.output_file}: {count}/{bucket.quota}")
+
+if __name__ == "__main__":
+    # Clear screen
+    print("\033[2J\033[H", end="")
+
+    # Set global random seed
+    fix_seed(42)
+    # Set start method for multiprocessing
+    mp.set_start_method('spawn')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help='continue from the manifest of an interrupted run')
+    parser.add_argument('--skip-doomed', action='store_true', help='skip the graph shapes which never produced a template in feasibility_cache.json')
+    args = parser.parse_args()
+    main(resume=args.resume, skip_doomed=args.skip_doomed)
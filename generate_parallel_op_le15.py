@@ -1,111 +1,87 @@
 from data_gen.pretrain.id_gen import IdGen
-from tools.tools import tokenizer, fix_seed, to_sketch, to_hash
+from data_gen.prototype.id_gen import GaveUp
+from tools.tools import fix_seed
 from tools.tools_test import true_correct
-import random
 import json
 import os
+import argparse
 from tqdm import tqdm
 import time
 import multiprocessing as mp
-import numpy as np
-import psutil
+from const.params import all_bin, data_test_bin
+from tools import instrument
+from tools.parallel import run_blocks, print_stats
+from tools.feasibility import FeasibilityOracle, update_cache, load_doomed
+from tools.rng import Rng
 
-def generate_single_sample(args):
-    op_target, seed = args
-    
-    # Set random seed for this process
-    random.seed(seed)
-    np.random.seed(seed)
-    
+def generate_single_sample(op_target, doomed, max_attempts, seed):
     # Generate med difficulty problem
     id_gen = IdGen(
         max_op=op_target,    # Target op value
+        exact_op=True,       # Sample the parameters conditioned on the drawn op
         max_edge=20,         # Maximum number of edges in the structure graph
+        oracle=FeasibilityOracle(doomed), # Drop the attempts which cannot reach the op before building them
+        rng=Rng.from_seed(seed), # Random generators of this sample, the same draws as seeding the global ones
         perm_level=5,        # Random shuffle level for problem description
         detail_level=0       # Most detailed solution format
     )
     
     try:
-        # Generate problem in pq format
-        id_gen.gen_prob([i for i in range(23)], p_format="pq")
+        # Generate problem in pq format over all hash bins
+        id_gen.gen_prob(all_bin, p_format="pq", max_attempts=max_attempts)
         
         # Check if the number of operations matches target
         if id_gen.op_ > op_target:
+            instrument.count("reject.op")
+            return None
+        
+        # Solution template hash, only test split solution templates are kept. The split is applied here and not
+        # in gen_prob, which would retry the drawn op until the hash fits and so change the op mix of the dataset
+        hash_val = id_gen.problem.hash_val
+        if hash_val not in data_test_bin:
+            instrument.count("reject.hash")
             return None
         
         # Get problem, solution and answer
-        prob_text = tokenizer.decode(id_gen.prob_token)
-        sol_text = tokenizer.decode(id_gen.sol_token)
-        ans_text = tokenizer.decode(id_gen.ans_token)
+        prob_text = id_gen.prob
+        sol_text = id_gen.sol
+        ans_text = id_gen.ans
         
         # 添加解决方案验证
-        correct, my_print, parser = true_correct(sol_text, id_gen.problem)
+        with instrument.timer("verify"):
+            correct, my_print, parser = true_correct(sol_text, id_gen.problem)
         
         # 只保留验证通过的问题
         if not correct:
+            instrument.count("reject.verify")
             return None
         
-        # Calculate solution template hash
-        sketch = to_sketch(id_gen.problem, prob=None, sol=sol_text)
-        hash_val = to_hash(sketch['sol'], mod_num=23)
-        
-        if hash_val >= 17:
-            # Construct data item
-            data = {
-                "text": f"Question:{prob_text}\nSolution:{sol_text}\nAnswer:{ans_text}\n\n",
-                "steps_required": len(sol_text.split('.')),
-                "numerical_answer": ans_text.strip(),
-                "solution_template_hash": hash_val,
-                "operations": op_target
-            }
-            return data
+        # Construct data item
+        data = {
+            "text": f"Question:{prob_text}\nSolution:{sol_text}\nAnswer:{ans_text}\n\n",
+            "steps_required": len(sol_text.split('.')),
+            "numerical_answer": ans_text.strip(),
+            "solution_template_hash": hash_val,
+            "operations": op_target
+        }
+        instrument.count("accepted")
+        return data
+    except GaveUp as e:
+        # the attempt budget ran out, skip this seed
+        instrument.count(f"reject.gave_up.{e.reason}")
+        return None
     except Exception as e:
+        instrument.count("reject.exception")
         print(f"Error generating sample: {str(e)}")
     return None
 
-def worker_process(cpu_id, op_value, samples_per_cpu, output_dir):
-    # Set CPU affinity
-    try:
-        proc = psutil.Process()
-        proc.cpu_affinity([cpu_id])
-    except Exception as e:
-        print(f"Failed to set CPU affinity for CPU {cpu_id}: {e}")
-    
-    # Create unique base seed for this CPU
-    base_seed = op_value * 1000000 + cpu_id * 10000
-    
-    valid_samples = []
-    attempts = 0
-    
-    # Create progress bar for this worker
-    pbar = tqdm(total=samples_per_cpu, 
-                desc=f"CPU {cpu_id:02d}",
-                position=cpu_id)
-    
-    while len(valid_samples) < samples_per_cpu:
-        seed = base_seed + attempts
-        result = generate_single_sample((op_value, seed))
-        if result is not None:
-            valid_samples.append(result)
-            pbar.update(1)
-        attempts += 1
-    
-    pbar.close()
-    
-    # Save results to temporary file
-    temp_file = os.path.join(output_dir, f'temp_cpu_{cpu_id:02d}.json')
-    with open(temp_file, 'w') as f:
-        for sample in valid_samples:
-            f.write(json.dumps(sample) + '\n')
-    
-    return len(valid_samples)
-
-def main():
+def main(resume=False, skip_doomed=False):
     # Parameters
     op_value = 15  # Target op value
     num_cpus = 96  # Total number of CPUs
     total_samples = 4096  # Total required samples
-    samples_per_cpu = (total_samples + num_cpus - 1) // num_cpus  # Ceiling division
+    block_size = 8  # Seeds handed to a worker at a time
+    max_attempts = 10000  # Parameter draws per seed before gen_prob gives up on it
     
     # Create output directory specific to this op value
     output_dir = f"./output/igsm_med_pq_datasets_op_le{op_value}"
@@ -114,49 +90,35 @@ def main():
     # Print configuration
     print(f"Generating dataset for op={op_value}")
     print(f"Using {num_cpus} CPUs")
-    print(f"Each CPU will generate {samples_per_cpu} samples")
-    print(f"Total expected samples: {samples_per_cpu * num_cpus}")
+    print(f"Each CPU pulls blocks of {block_size} seeds until {total_samples} samples are collected")
     print(f"Output directory: {output_dir}")
     
-    # Create and start processes
-    processes = []
-    start_time = time.time()
-    
-    for cpu_id in range(num_cpus):
-        p = mp.Process(
-            target=worker_process,
-            args=(cpu_id, op_value, samples_per_cpu, output_dir)
-        )
-        p.start()
-        processes.append(p)
-    
-    # Wait for all processes to complete
-    for p in processes:
-        p.join()
-    
-    # Combine all temporary files
-    all_samples = []
-    for cpu_id in range(num_cpus):
-        temp_file = os.path.join(output_dir, f'temp_cpu_{cpu_id:02d}.json')
-        if os.path.exists(temp_file):
-            with open(temp_file, 'r') as f:
-                for line in f:
-                    all_samples.append(json.loads(line))
-            # Remove temporary file
-            os.remove(temp_file)
-    
-    # Save final results
+    # Workers pull seed blocks from a shared queue; samples are appended to the final file in seed order
     final_file = os.path.join(output_dir, f'igsm_med_pq_eval_le{op_value}.json')
-    with open(final_file, 'w') as f:
-        for sample in all_samples[:total_samples]:
-            f.write(json.dumps(sample) + '\n')
+    # Graph shapes that never produced a template in earlier runs, frozen for this run. Off by default: the rule is
+    # empirical and drops shapes which may still succeed, only the provable op bound of the oracle is always on
+    cache_file = os.path.join(output_dir, 'feasibility_cache.json')
+    doomed = load_doomed(cache_file, skip_doomed)
+    start_time = time.time()
+    pbar = tqdm(total=total_samples, desc=f"op={op_value}")
+    stats = run_blocks(
+        generate_single_sample, (op_value, doomed, max_attempts),
+        total_samples=total_samples,
+        num_workers=num_cpus,
+        output_file=final_file,
+        base_seed=op_value * 1000000,
+        block_size=block_size,
+        progress=pbar,
+        resume=resume,
+    )
+    pbar.close()
     
     # Print statistics
     total_time = time.time() - start_time
     print(f"\nGeneration completed:")
     print(f"Total time: {total_time/60:.2f} minutes")
-    print(f"Total samples generated: {len(all_samples)}")
-    print(f"Samples kept: {total_samples}")
+    print_stats(stats)
+    update_cache(cache_file, stats["instrument"])
     print(f"Output saved to: {final_file}")
 
 if __name__ == "__main__":
@@ -167,4 +129,9 @@ if __name__ == "__main__":
     fix_seed(42)
     # Set start method for multiprocessing
     mp.set_start_method('spawn')
-    main()
\ No newline at end of file
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help='continue from the manifest of an interrupted run')
+    parser.add_argument('--skip-doomed', action='store_true', help='skip the graph shapes which never produced a template in feasibility_cache.json')
+    args = parser.parse_args()
+    main(resume=args.resume, skip_doomed=args.skip_doomed)
\ No newline at end of file
@@ -1,13 +1,17 @@
 from data_gen.pretrain.id_gen import IdGen
-from tools.tools import tokenizer, fix_seed, to_sketch, to_hash
+from tools.tools import fix_seed
 from tools.tools_test import true_correct
+from tools import instrument
+from tools.checkpoint import manifest_path, load_manifest, commit_output, open_output, get_rng_state, set_rng_state
+from const.params import all_bin, data_train_bin
 import random
 import json
 import os
 from tqdm import tqdm
 import time
+import argparse
 
-def generate_igsm_med_dataset(num_samples=500, seed=42):
+def generate_igsm_med_dataset(num_samples=500, seed=42, resume=False):
     # Set random seed
     fix_seed(seed)
     
@@ -24,11 +28,24 @@ def generate_igsm_med_dataset(num_samples=500, seed=42):
     
     file_path = os.path.join(output_dir, 'igsm_med_pq_train_le15.json')
     
+    # Checkpoint the output length, the counters and the RNG state every batch_size samples
+    checkpoint_file = manifest_path(file_path)
+    config = {"num_samples": num_samples, "seed": seed}
+    manifest = load_manifest(checkpoint_file, config) if resume else None
+    f = open_output(file_path, None if manifest is None else manifest["offset"])
+    if manifest is None:
+        manifest = {"config": config, "offset": 0}
+    else:
+        count = manifest["count"]
+        attempts = manifest["attempts"]
+        set_rng_state(manifest["rng_state"])
+    
     # Create progress bar
-    pbar = tqdm(total=num_samples, desc="Generating samples")
+    pbar = tqdm(total=num_samples, initial=count, desc="Generating samples")
     start_time = time.time()
+    start_count = count
     
-    with open(file_path, 'w') as f:
+    with f:
         while count < num_samples:
             attempts += 1
             # Generate med difficulty problem
@@ -39,57 +56,64 @@ def generate_igsm_med_dataset(num_samples=500, seed=42):
                 detail_level=0    # Most detailed solution format
             )
             
-            # Generate problem in pq format (problem first)
-            id_gen.gen_prob([i for i in range(23)], p_format="pq")
+            # Generate problem in pq format (problem first) over all hash bins
+            id_gen.gen_prob(all_bin, p_format="pq")
+            
+            # Solution template hash, only train split solution templates are kept. The split is applied here and not
+            # in gen_prob, which would retry the drawn op until the hash fits and so change the op mix of the dataset
+            hash_val = id_gen.problem.hash_val
+            if hash_val not in data_train_bin:
+                instrument.count("reject.hash")
+                continue
             
             # Get problem, solution and answer
-            prob_text = tokenizer.decode(id_gen.prob_token)
-            sol_text = tokenizer.decode(id_gen.sol_token)
-            ans_text = tokenizer.decode(id_gen.ans_token)
+            prob_text = id_gen.prob
+            sol_text = id_gen.sol
+            ans_text = id_gen.ans
             
             # 添加解决方案验证
-            correct, my_print, parser = true_correct(sol_text, id_gen.problem)
+            with instrument.timer("verify"):
+                correct, my_print, parser = true_correct(sol_text, id_gen.problem)
             
             # 只保留验证通过的问题
             if not correct:
+                instrument.count("reject.verify")
                 continue
             
-            # Calculate solution template hash
-            sketch = to_sketch(id_gen.problem, prob=None, sol=sol_text)
-            hash_val = to_hash(sketch['sol'], mod_num=23)
+            # Construct complete text
+            full_text = f"Question:{prob_text}\nSolution:{sol_text}\nAnswer:{ans_text}\n\n"
             
-            # Check if hash value meets requirement (< 17)
-            if hash_val < 17:
-                # Construct complete text
-                full_text = f"Question:{prob_text}\nSolution:{sol_text}\nAnswer:{ans_text}\n\n"
-                
-                # Construct data item
-                data = {
-                    "text": full_text,
-                    "steps_required": len(sol_text.split('.')), # Number of solution steps
-                    "numerical_answer": ans_text.strip(),
-                    "solution_template_hash": hash_val
-                }
-                
-                # Write to file
-                f.write(json.dumps(data) + '\n')
-                
-                count += 1
-                pbar.update(1)
+            # Construct data item
+            data = {
+                "text": full_text,
+                "steps_required": len(sol_text.split('.')), # Number of solution steps
+                "numerical_answer": ans_text.strip(),
+                "solution_template_hash": hash_val
+            }
+            
+            # Write to file
+            f.write(json.dumps(data) + '\n')
+            
+            count += 1
+            pbar.update(1)
+            
+            if count % batch_size == 0 or count == num_samples:
+                manifest.update(count=count, attempts=attempts, rng_state=get_rng_state())
+                commit_output(f, manifest, checkpoint_file)
+            
+            # Update progress bar description, show success rate and estimated time remaining
+            if count % 100 == 0:
+                elapsed_time = time.time() - start_time
+                success_rate = count / attempts * 100
+                avg_time_per_sample = elapsed_time / max(count - start_count, 1)
+                remaining_samples = num_samples - count
+                eta = remaining_samples * avg_time_per_sample
                 
-                # Update progress bar description, show success rate and estimated time remaining
-                if count % 100 == 0:
-                    elapsed_time = time.time() - start_time
-                    success_rate = count / attempts * 100
-                    avg_time_per_sample = elapsed_time / count
-                    remaining_samples = num_samples - count
-                    eta = remaining_samples * avg_time_per_sample
-                    
-                    pbar.set_description(
-                        f"Generated: {count}/{num_samples} | "
-                        f"Success rate: {success_rate:.2f}% | "
-                        f"ETA: {eta/60:.2f}min"
-                    )
+                pbar.set_description(
+                    f"Generated: {count}/{num_samples} | "
+                    f"Success rate: {success_rate:.2f}% | "
+                    f"ETA: {eta/60:.2f}min"
+                )
     
     # Close progress bar
     pbar.close()
@@ -102,8 +126,14 @@ def generate_igsm_med_dataset(num_samples=500, seed=42):
     print(f"Total attempts: {attempts}")
     print(f"Success rate: {final_success_rate:.2f}%")
     print(f"Total time: {total_time/60:.2f} minutes")
-    print(f"Average time per sample: {total_time/count:.2f} seconds")
+    print(f"Average time per sample: {total_time/max(count - start_count, 1):.2f} seconds")
     print(f"Output saved to: {file_path}")
+    print("Stages and rejections:")
+    instrument.print_snapshot(instrument.snapshot())
+    instrument.write_summary(file_path + ".summary.json", {"samples": count - start_count, "attempts": attempts, "wall_time": total_time, "instrument": instrument.snapshot()})
 
 # Generate dataset
-generate_igsm_med_dataset()
\ No newline at end of file
+parser = argparse.ArgumentParser()
+parser.add_argument('--resume', action='store_true', help='continue from the manifest of an interrupted run')
+args = parser.parse_args()
+generate_igsm_med_dataset(resume=args.resume)
@@ -3,16 +3,174 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-from matplotlib.patches import ArrowStyle
-from typing import Dict, Callable, Any, Tuple
+from typing import Dict, Callable, Any, List, Tuple
 import numpy as np
-import random, copy
-import networkx as nx
+import random, copy, bisect
 from tools.tools import random_topological_sort
-from matplotlib.lines import Line2D
+from tools.dag import DAG
+from tools.rng import Rng, get_rng
+from math_gen.structure import Structure
+
+SCAN_LIMIT = 32 # OrderedSet: below this length a linear scan beats bisection
+
+class OrderedSet(list):
+    '''
+    distinct hashable items in a list, with an index on the side: membership is a set lookup, and remove / restore
+    find the position of an item by bisection on its append order instead of scanning the list.
+
+    the items stay in the order they were appended. restore puts a removed item back at its old place,
+    so the list is always sorted by append order. It is still a plain list for reading,
+    so random.choice / random.sample draw exactly the same items as from a list with the same content.
+    Only append / extend / remove / restore / pop change it.
+    '''
+    def __init__(self, items=()):
+        super().__init__()
+        self.members = set()
+        self.rank = {} # item -> append order, kept after the item is removed
+        self.n_rank = 0
+        self.extend(items)
+
+    def __contains__(self, item):
+        return item in self.members
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),), {"rank": self.rank, "n_rank": self.n_rank})
+
+    def copy(self):
+        new = self.__class__.__new__(self.__class__)
+        list.extend(new, self)
+        new.members = set(self.members)
+        new.rank = dict(self.rank)
+        new.n_rank = self.n_rank
+        return new
+
+    def append(self, item):
+        self.rank[item] = self.n_rank
+        self.n_rank += 1
+        list.append(self, item)
+        self.members.add(item)
+
+    def extend(self, items):
+        items = list(items)
+        self.rank.update(zip(items, range(self.n_rank, self.n_rank + len(items))))
+        self.n_rank += len(items)
+        list.extend(self, items)
+        self.members.update(items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def index(self, item):
+        if item not in self.members:
+            raise ValueError(f"{item} is not in list")
+        return self._position(item)
+
+    def _position(self, item):
+        # the position of a member, or the place where restore puts it back.
+        # a short list is scanned in C faster than the bisection calls its key.
+        if len(self) < SCAN_LIMIT and item in self.members:
+            return list.index(self, item)
+        return bisect.bisect_left(self, self.rank[item], key=self.rank.__getitem__)
+
+    def remove(self, item):
+        if item not in self.members:
+            raise ValueError(f"{item} is not in list")
+        list.__delitem__(self, self._position(item))
+        self.members.discard(item)
+
+    def restore(self, item):
+        list.insert(self, self._position(item), item)
+        self.members.add(item)
+
+    def pop(self, index=-1):
+        item = list.pop(self, index)
+        self.members.discard(item)
+        return item
+
+    def _unsupported(self, *args, **kwargs):
+        raise TypeError("OrderedSet only changes through append, extend, remove, restore and pop")
+
+    insert = __setitem__ = __delitem__ = __imul__ = sort = reverse = clear = _unsupported
+
+def pairwise_sum(a) -> float:
+    '''
+    the sum of a list of floats with the pairwise summation of numpy, so it is bit-identical to np.array(a).sum().
+    checked against numpy 2.4.6 (blocks of 128 with 8 partial sums, the same since numpy 1.9), see test_pairwise_sum.
+    '''
+    n = len(a)
+    if n < 8:
+        res = 0.
+        for x in a:
+            res += x
+        return res
+    if n <= 128:
+        r = a[:8]
+        for i in range(8, n - n % 8, 8):
+            r[0] += a[i]; r[1] += a[i+1]; r[2] += a[i+2]; r[3] += a[i+3]
+            r[4] += a[i+4]; r[5] += a[i+5]; r[6] += a[i+6]; r[7] += a[i+7]
+        res = ((r[0] + r[1]) + (r[2] + r[3])) + ((r[4] + r[5]) + (r[6] + r[7]))
+        for x in a[n - n % 8:]:
+            res += x
+        return res
+    n2 = n // 2
+    n2 -= n2 % 8
+    return pairwise_sum(a[:n2]) + pairwise_sum(a[n2:])
+
+def softmax_choice(pool: list, stack, values: list, exp_cache: dict, rng: Rng=None):
+    '''
+    draw from pool in the way of Graph.reasonable_sort: a parameter has the value values[1 * internal + 2 * not in stack],
+    and is drawn with the softmax of the values.
+
+    the result is the same parameter as rng.np.choice(len(pool), p=softmax(values)) for the same numpy random state:
+    the float operations of numpy (exp of the value minus the max, pairwise sum, cumsum, normalization, searchsorted)
+    are done on a few python floats instead of arrays. exp_cache maps the max value to the 4 exponentials.
+    checked against numpy 2.4.6, see test_softmax_choice in tools/tools_test.py.
+    '''
+    if not pool:
+        raise ValueError("a must be greater than 0 unless no samples are taken")
+    codes = [(param[0] == 1) + 2 * (param not in stack) for param in pool]
+    v_max = max(values[c] for c in set(codes))
+    e = exp_cache.get(v_max)
+    if e is None:
+        e = exp_cache[v_max] = [float(np.exp(v - v_max)) for v in values]
+    w = [e[c] for c in codes]
+    total = pairwise_sum(w)
+    cdf = []
+    acc = 0.
+    for x in w:
+        acc += x / total
+        cdf.append(acc)
+    last = cdf[-1]
+    cdf = [c / last for c in cdf]
+    return pool[bisect.bisect_right(cdf, get_rng(rng).np.random_sample())]
+
+class LayerShape(object):
+    '''
+    what Graph.init derives from the layer sizes l alone: the candidate edges (i, j, k) of the structure graph
+    and the internal parameters (i, j, k) in the order init lists them, and the structure graph without edges.
+    With d, w0, w1 in {2, 3, 4} there are at most 117 shapes; layer_shape builds each once per process.
+    '''
+    def __init__(self, l: Tuple[int, ...]):
+        d = len(l)
+        self.l = l
+        self.eoc = [(i, j, k) for i in range(d-1) for j in range(l[i]) for k in range(l[i+1])]
+        self.inter = OrderedSet((i, j, k) for i in range(d-1) for j in range(l[i]) for k in range(i+1, d))
+        self.graph = DAG(unique=False)
+        for i in range(d):
+            for j in range(l[i]):
+                self.graph.add_node((i, j))
+
+SHAPES: Dict[Tuple[int, ...], LayerShape] = {}
+
+def layer_shape(l: Tuple[int, ...]) -> LayerShape:
+    shape = SHAPES.get(l)
+    if shape is None:
+        shape = SHAPES[l] = LayerShape(l)
+    return shape
 
 class Graph():
-    def __init__(self, d, w0, w1, e, p, perm=True, dist: Dict[str, Callable[[], Any]]=None) -> None:
+    def __init__(self, d, w0, w1, e, p, perm=True, dist: Dict[str, Callable[[], Any]]=None, rng: Rng=None) -> None:
         '''
         d is the generator for depth
         w0, w1 is the min and max width
@@ -20,6 +178,7 @@ class Graph():
         p is the probability of adding vertex when it's possible
         if e does not satisfy: (d-1) * w1 ** 2 >= e >= (d-1) * w0,
         choose the feasible e closest to the original e.
+        rng: the random generators, default the global ones (see tools.rng).
         '''
         if (d-1) * w1 ** 2 < e:
             # print(f"(d-1) * w1 ** 2 < e, d={d}, w1={w1}, e={e}. e={(d-1) * w1 ** 2} now.")
@@ -35,14 +194,27 @@ class Graph():
         self.perm = perm
         self.record = {}
         self.rand = (-1, 0, 0, 0)
+        self.rng = get_rng(rng)
         if dist is None:
             self.dist = {}
         else:
             self.dist = dist
 
-    def init(self):
+    def init(self, structure: Structure=None):
+        '''
+        draw the structure graph and reset the records.
+        structure: take the layer sizes and the edges from this view of a StructureBatch instead of drawing them.
+        It must have been drawn with self.d, self.w0, self.w1, self.e, self.p, otherwise a ValueError is raised.
+        '''
         self.topological_order = None
         self.problem_order = None
+        if structure is not None:
+            if structure.params() != (self.d, self.w0, self.w1, self.e, self.p):
+                raise ValueError(f"the structure was drawn with (d, w0, w1, e, p) = {structure.params()}, "
+                                 f"but the graph has {(self.d, self.w0, self.w1, self.e, self.p)}.")
+            self.l = structure.l
+            self.init_records(*structure.edges(), G=structure.G)
+            return
         # construct self.l: layer list
         self.l = np.ones(self.d, dtype=int) * self.w0
         while True:
@@ -50,54 +222,61 @@ class Graph():
                 _ = self.add_vertex()
             elif self.valid == "stop":
                 break
-            elif random.random() < self.p:
+            elif self.rng.py.random() < self.p:
                 is_full = self.add_vertex()
                 if is_full:
                     break
             else:
                 break
 
+        # every node of layer i+1 gets a random parent in layer i, then the other edges are sampled from the rest.
+        # randint draws the same numbers as np.random.choice(self.l[i]) for each node in turn.
+        edges = []
+        for i in range(self.d - 1):
+            parents = self.rng.np.randint(0, self.l[i], size=self.l[i+1]).tolist()
+            edges += [(i, j, k) for k, j in enumerate(parents)]
+        taken = set(edges)
+        eoc = [edge for edge in layer_shape(tuple(self.l.tolist())).eoc if edge not in taken] # edges of the complement graph
+        n_remain = self.e - len(edges)
+        eor = self.rng.py.sample(eoc, n_remain) # edge of remaining
+        self.init_records(edges, eor)
+
+    def init_records(self, edges: List[Tuple[int, int, int]], eor: List[Tuple[int, int, int]], G: List[np.ndarray]=None):
+        '''
+        set up the records of init from the layer sizes self.l and the edges, drawn in the order edges then eor.
+        G: the edge matrices if they are built already.
+        '''
         # TODO: select some nodes to be unique
         self.unique = []
 
         # define the remaining items, internal parameters and the chosen parameters
-        eoc = [(i, j, k) for i in range(self.d-1) for j in range(self.l[i]) for k in range(self.l[i+1])] # edges of the complement graph
-        self.record['remain'] = [] # add elements later
-        self.record['inter'] = [(i, j, k) for i in range(self.d-1) for j in range(self.l[i]) for k in range(i+1, self.d)]
+        shape = layer_shape(tuple(self.l.tolist()))
+        # ordered sets: same order (so the same random draws) as plain lists, without scans for membership and removal
+        self.record['inter'] = shape.inter.copy()
         self.record['chosen'] = [] # 4-tuple
-
-        # construct self.G: graph matrices list
-        self.G = []
-        n_exist = 0
-        for i in range(self.d - 1):
-            self.G.append(np.zeros((self.l[i], self.l[i+1]), dtype=bool))
-            for k in range(self.l[i+1]):
-                j = np.random.choice(self.l[i])
-                self.G[i][j, k] = True
-                eoc.remove((i, j, k))
-                self.record['remain'].append((i, j, k))
-            n_exist += self.l[i + 1]
-        n_remain = self.e - n_exist
-        eor = random.sample(eoc, n_remain) # edge of remaining
+        self.record['remain'] = OrderedSet(edges)
         self.record['remain'] += eor
-        for i, j, k in eor:
-            self.G[i][j, k] = True
+        edges = sorted(edges + eor)
 
-        self.graph = nx.DiGraph()
-        for i in range(self.d):
-            for j in range(self.l[i]):
-                self.graph.add_node((i, j), unique=False)
-        
-        for i in range(self.d-1):
-            for j in range(self.l[i]):
-                for k in range(self.l[i+1]):
-                    if self.G[i][j, k]:
-                        self.graph.add_edge((i, j), (i+1, k), chosen=False)
+        # construct self.G: graph matrices list, and self.children[i][j]: the sorted k with an edge (i, j) -> (i+1, k).
+        # self.G does not change after init.
+        if G is None:
+            G = [np.zeros((self.l[i], self.l[i+1]), dtype=bool) for i in range(self.d - 1)]
+            for i, j, k in edges:
+                G[i][j, k] = True
+        self.G = G
+        self.children = [[[] for _ in range(self.l[i])] for i in range(self.d - 1)]
+        # the structure graph; an edge (i, j) -> (i+1, k) is chosen once its parameter (0, i, j, k) is in the problem
+        self.graph = shape.graph.copy()
+        for i, j, k in edges:
+            self.children[i][j].append(k)
+            self.graph.add_edge((i, j), (i+1, k))
+        self.chosen_edges = set() # (i, j, k)
         
         self.total = len(self.record['remain'])
         for i in range(self.d-1):
             for j in range(self.l[i]):
-                count = self.G[i][j, :].sum()
+                count = len(self.children[i][j])
                 count_multi = max(2 * count - 1, 0)
                 if count > 1:
                     count -= 1
@@ -125,7 +304,7 @@ class Graph():
     def add_vertex(self):
         pool = [i for i, x in enumerate(self.l) if x < self.w1]
         if pool:
-            index = random.choice(pool)
+            index = self.rng.py.choice(pool)
             self.l[index] += 1
             return False
         else:
@@ -158,40 +337,85 @@ class Graph():
             return "ok"
     
     def try_inter(self, inter_p, start=True):
+        '''
+        tentatively choose the internal parameter inter_p and the parameters it needs, directly in self.record.
+        every change is logged in self.journal, so the attempt can be rolled back with self.undo(self.journal)
+        in time proportional to the change, instead of working on a deepcopy of the record.
+        return the number of operations of the chosen parameters.
+        '''
         i, j, k = inter_p
         if start:
-            self.temp_record = copy.deepcopy(self.record)
-        # print("remove: ", inter_p, self.temp_record['inter'])
-        self.temp_record['inter'].remove(inter_p)
-        self.temp_record['chosen'].append((1, i, j, k))
+            self.journal = []
+        # print("remove: ", inter_p, self.record['inter'])
+        self.record_remove('inter', inter_p)
+        self.record_choose((1, i, j, k))
         count = 0
+        off_springs = self.children[i][j]
+        n_off_spring = len(off_springs)
+        remain = self.record['remain'].members
         if i + 1 == k:
-            n_off_spring = 0
-            for x in range(self.l[i+1]):
-                if self.G[i][j, x]:
-                    n_off_spring += 1
-                    if (i, j, x) in self.temp_record['remain']:
-                        count += 1
-                        self.temp_record['remain'].remove((i, j, x))
-                        self.temp_record['chosen'].append((0, i, j, x))
+            for x in off_springs:
+                if (i, j, x) in remain:
+                    count += 1
+                    self.record_remove('remain', (i, j, x))
+                    self.record_choose((0, i, j, x))
             if n_off_spring > 1:
                 n_off_spring -= 1
             else:
                 n_off_spring = 1
             return count + n_off_spring
         else:
-            n_off_spring = 0
-            for x in range(self.l[i+1]):
-                if self.G[i][j, x]:
-                    n_off_spring += 1
-                    if (i+1, x, k) in self.temp_record['inter']:
-                        count += self.try_inter((i+1, x, k), False)
-                    if (i, j, x) in self.temp_record['remain']:
-                        count += 1
-                        self.temp_record['remain'].remove((i, j, x))
-                        self.temp_record['chosen'].append((0, i, j, x))
+            for x in off_springs:
+                if (i+1, x, k) in self.record['inter'].members:
+                    count += self.try_inter((i+1, x, k), False)
+                if (i, j, x) in remain:
+                    count += 1
+                    self.record_remove('remain', (i, j, x))
+                    self.record_choose((0, i, j, x))
             return count + max(2 * n_off_spring - 1, 1)
 
+    def record_remove(self, key, item):
+        self.record[key].remove(item)
+        self.journal.append((key, item))
+
+    def record_choose(self, param):
+        self.record['chosen'].append(param)
+        self.journal.append(('chosen', param))
+
+    def undo(self, journal):
+        '''
+        roll back the changes of journal, the removed items go back to their original positions.
+        '''
+        for key, item in reversed(journal):
+            if key == 'chosen':
+                self.record['chosen'].pop()
+            else:
+                self.record[key].restore(item)
+
+    def redo(self, journal):
+        for key, item in journal:
+            if key == 'chosen':
+                self.record['chosen'].append(item)
+            else:
+                self.record[key].remove(item)
+
+    def switch_record(self, src, dst):
+        '''
+        turn self.record from state src into state dst.
+        a state is (parent state, journal applied on top of the parent, depth); the root is the record at the
+        start of choose_param. The journals up to the common ancestor are undone, then the ones down to dst redone.
+        '''
+        path = []
+        while src is not dst:
+            if src[2] >= dst[2]:
+                self.undo(src[1])
+                src = src[0]
+            else:
+                path.append(dst[1])
+                dst = dst[0]
+        for journal in reversed(path):
+            self.redo(journal)
+
     def choose_param(self, n, m):
         '''
         n: params related to internal parameters
@@ -203,7 +427,10 @@ class Graph():
             n = self.total
         self.n_inter = n
         n_fix = m - n
-        previous_record = self.record
+        # states of self.record, see switch_record. Every attempt of try_inter is rolled back unless it is chosen;
+        # previous is the last attempt kept as a candidate, it may be taken later.
+        current = (None, [], 0)
+        previous = current
         previous_count = 0
         lowest = 1
         highest = self.d - 1
@@ -216,13 +443,15 @@ class Graph():
                     elif diff == highest:
                         highest -= 1
                 if try_set:
-                    i, j, k = random.choice(try_set)
+                    i, j, k = self.rng.py.choice(try_set)
                     count = self.try_inter((i, j, k))
+                    tried = (current, self.journal, current[2] + 1)
                     # print(f"Try diff={diff}, lowest={lowest}, highest={highest}, (i, j, k)={i, j, k}, n={n}, count={count}.")
                     if diff == lowest and count > n:
+                        self.undo(self.journal)
                         self.n_inter -= n
                         n_fix_v2 = min(n + n_fix, len(self.record['remain']))
-                        fix = random.sample(self.record['remain'], n_fix_v2)
+                        fix = self.rng.py.sample(self.record['remain'], n_fix_v2)
                         for i, j, k in fix:
                             self.record['chosen'].append((0, i, j, k))
                             self.record['remain'].remove((i, j, k))
@@ -230,21 +459,24 @@ class Graph():
                         return
                     if count <= n:
                         if diff < highest:
-                            previous_record = self.temp_record
+                            self.undo(self.journal)
+                            previous = tried
                             previous_count = count
                             previous_choose = (i, j, k)
                         else:
-                            self.record = self.temp_record
+                            current = tried
                             # print(f"Choose {i, j, k}. n={n}, count={count}.")
                             n -= count
                             break
                     else:
-                        self.record = previous_record
+                        self.undo(self.journal)
+                        self.switch_record(current, previous)
+                        current = previous
                         # print(f"Choose {previous_choose}. n={n}, count={previous_count}.")
                         n -= previous_count
                         break
         n_fix_v2 = min(n_fix, len(self.record['remain']))
-        fix = random.sample(self.record['remain'], n_fix_v2)
+        fix = self.rng.py.sample(self.record['remain'], n_fix_v2)
         for i, j, k in fix:
             self.record['chosen'].append((0, i, j, k))
             self.record['remain'].remove((i, j, k))
@@ -257,23 +489,23 @@ class Graph():
         if 'p0' in self.dist:
             p0: float = self.dist['p0']()
         else:
-            p0 = random.random() # the probability of quoting existing parameters
+            p0 = self.rng.py.random() # the probability of quoting existing parameters
         
         if 'p1p2' in self.dist:
             pair: Tuple[float, float] = self.dist['p1p2']()
             p1, p2 = pair
         else:
-            p1 = abs(np.random.randn()) # bias on prefered parameters
+            p1 = abs(self.rng.np.randn()) # bias on prefered parameters
             p2 = p1
         # Step 1: Compute the out-degree for each vertex
-        out_degree = dict(self.template.out_degree())
+        out_degree = self.template.out_degrees()
 
         # Step 1: Add vertices with out-degree 0 to the set
+        values = [0., p1, p2, p1 + p2] # value of a parameter: 1 * internal + 2 * not in stack
+        exp_cache = {}
         zero_out_degree = [v for v, d in out_degree.items() if d == 0]
         stack = []
-        remain = list(self.template.nodes())
-        if self.rand in remain:
-            remain.remove(self.rand)
+        remain = [v for v in self.template.nodes() if v != self.rand]
 
         # Step 2: While the set is not empty
         topological_order = []
@@ -290,27 +522,15 @@ class Graph():
                     zero_out_degree.append(v)
             if param in stack:
                 stack.remove(param)
-            need_to_pick = True
-            for i in stack:
-                if i in zero_out_degree:
-                    need_to_pick = False
+            need_to_pick = not any(i in zero_out_degree for i in stack)
             if param[0] == 0 and (param[1]+1, param[3]) not in self.unique:
                 # Randomly choose a param from 'remain' list. Bias on its in-degree and if it is internal parameter.
-                if (random.random() < p0 or need_to_pick) and remain:
+                if (self.rng.py.random() < p0 or need_to_pick) and remain:
                     if need_to_pick:
                         pool_temp = zero_out_degree
                     else:
                         pool_temp = remain
-                    values = np.zeros(len(pool_temp))
-                    for i, ele in enumerate(pool_temp):
-                        if ele[0] == 1:
-                            values[i] += p1
-                        if ele not in stack:
-                            values[i] += p2
-                    e_x = np.exp(values - np.max(values))
-                    probabilities = e_x / e_x.sum()
-                    random_index = np.random.choice(len(pool_temp), p=probabilities)
-                    random_element = pool_temp[random_index]
+                    random_element = softmax_choice(pool_temp, stack, values, exp_cache, self.rng)
                     self.template.add_edge(random_element, param)
                     # print(f"add edge from {random_element} to {param}.")
                     if random_element not in stack:
@@ -338,7 +558,7 @@ class Graph():
             print(stack)'''
             if not pool:
                 return False
-            picked = random.choice(pool)
+            picked = self.rng.py.choice(pool)
             topological_order.append(picked)
             # print(f"from {pool} pick {picked}. Out degree is {out_degree[picked]}")
             choose_param(param=picked)
@@ -346,29 +566,40 @@ class Graph():
         self.topological_order.reverse()
         return True
 
-    def design(self, s, max_param=4):
+    def extra_capacity(self, max_param=4):
         '''
-        s is the number of deduction steps.
+        the most extra operations design can give to each parameter of self.topological_order.
         '''
-        self.n_op = max(self.n_op_min, s)
         max_extra = []
-        addable = []
-        self.extra = []
         for i, param in enumerate(self.topological_order):
             max_extra.append(0)
-            self.extra.append(0)
             if param[0] == 0 and (param[1]+1, param[3]) not in self.unique:
                 if max_param is not None:
                     max_extra[-1] += max(min(i + 1, max_param) - 2, 0) # if max_param <= 2, then no addable params.
                 else:
                     max_extra[-1] = max(i - 1, 0)
-                if max_extra[-1] > 0:
-                    addable.append(i)
-        
-        self.n_op = min(self.n_op - self.n_op_min, sum(max_extra)) + self.n_op_min
+        return max_extra
+
+    def count_n_op(self, s, max_param=4, max_extra=None):
+        '''
+        the number of operations design(s, max_param) settles on. It only depends on the sorted template,
+        so it is known right after reasonable_sort, before any random draw of design.
+        '''
+        if max_extra is None:
+            max_extra = self.extra_capacity(max_param)
+        return min(max(self.n_op_min, s) - self.n_op_min, sum(max_extra)) + self.n_op_min
+
+    def design(self, s, max_param=4):
+        '''
+        s is the number of deduction steps.
+        '''
+        max_extra = self.extra_capacity(max_param)
+        addable = [i for i, x in enumerate(max_extra) if x > 0]
+        self.extra = [0] * len(max_extra)
+        self.n_op = self.count_n_op(s, max_param, max_extra)
         n_fix = self.n_op - self.n_op_min
         while n_fix > 0:
-            index = random.choice(addable)
+            index = self.rng.py.choice(addable)
             n_fix -= 1
             self.extra[index] += 1
             if self.extra[index] == max_extra[index]:
@@ -377,25 +608,24 @@ class Graph():
         # print(max_extra)
         # print(self.extra)
 
-        self.template.add_node(self.rand)
-        self.template.nodes[self.rand]['type'] = -1
+        self.template.add_node(self.rand, type=-1)
         
         for i, param in enumerate(self.topological_order):
             '''
             if max_extra[i] == 0: if it is not pointed from a previous node, you can assign it one with some probability
             if max_extra[i] > 0: randomly select max_extra[i] or max_extra[i] + 1 previous nodes. If only max_extra[i] nodes, please also add random node.
             '''
-            self.template.nodes[param]['type'] = 0
+            self.template.set(param, 'type', 0)
             l_, i_, j_, k_ = param
             if l_ == 0:
-                self.graph.edges[(i_, j_), (i_+1, k_)]['chosen'] = True
+                self.chosen_edges.add((i_, j_, k_))
                 if (i_+1, k_) in self.unique:
                     continue
                 pool = [self.rand] + self.topological_order[:i]
 
                 # determine the number of parameters
                 if self.extra[i] == 0:
-                    n_sample = 1 if random.random() < 0.5 else 2
+                    n_sample = 1 if self.rng.py.random() < 0.5 else 2
                 elif self.extra[i] > 0:
                     n_sample = self.extra[i] + 2
                 if max_param is not None:
@@ -410,14 +640,14 @@ class Graph():
                         pool.remove(v)
                         n_sample -= 1
                     # print("1", n_sample, len(pool))
-                    if random.random() < 0.5 and n_sample > 0:
+                    if self.rng.py.random() < 0.5 and n_sample > 0:
                         n_sample -= 1
                         self.template.add_edge(self.rand, param)
                         pool.remove(self.rand)
                     # print("2", n_sample, len(pool))
-                    pool = random.sample(pool, n_sample)
+                    pool = self.rng.py.sample(pool, n_sample)
                 for v in pool:
-                    if v not in self.template.predecessors(param):
+                    if not self.template.has_edge(v, param):
                         self.template.add_edge(v, param)
 
     def design_unused(self, max_param=4):
@@ -426,10 +656,10 @@ class Graph():
         self.problem_order only contains parameters appeared in the problem in a proper order,
         self.record['chosen'] does not contain order information and it also contains internal parameters that can be derived now.
         '''
-        self.problem_order = copy.deepcopy(self.topological_order)
+        self.problem_order = OrderedSet(self.topological_order) # add_param tests membership while it grows
         self.independent = []
         while self.record['remain']:
-            i, j, k = random.choice(self.record['remain'])
+            i, j, k = self.rng.py.choice(self.record['remain'])
             param = (0, i, j, k)
             self.template.add_node(param)
             if (i+1, k) in self.unique:
@@ -437,13 +667,13 @@ class Graph():
                 self.record['chosen'].append(param)
                 self.independent.append(param)
                 self.problem_order.append(param)
-                self.template.nodes[param]['type'] = 2
+                self.template.set(param, 'type', 2)
                 continue
             if 'p3' in self.dist:
                 p3: float = self.dist['p3']()
             else:
                 p3 = 0.5
-            if random.random() < p3:
+            if self.rng.py.random() < p3:
                 independent = True
             else:
                 independent = False
@@ -458,26 +688,26 @@ class Graph():
             else:
                 max_sample = max_sample_
             while n_sample < max_sample:
-                if random.random() > 0.5:
+                if self.rng.py.random() > 0.5:
                     n_sample += 1
                 else:
                     break
             
-            self.template.nodes[param]['type'] = 2
+            self.template.set(param, 'type', 2)
             if n_sample == max_sample_:
                 self.template.add_edge(self.rand, param)
             else:
-                if random.random() < 0.5:
+                if self.rng.py.random() < 0.5:
                     self.template.add_edge(self.rand, param)
                     n_sample -= 1
-                pool = random.sample(pool, n_sample)
+                pool = self.rng.py.sample(pool, n_sample)
             for v in pool:
                 self.template.add_edge(v, param)
                 self.add_param(v)
-                # print("before", param, v, self.template.nodes[param]['type'], self.template.nodes[v]['type'])
-                if self.template.nodes[v]['type'] in [0, 1]:
-                    self.template.nodes[param]['type'] = 1
-                # print("after", param, v, self.template.nodes[param]['type'], self.template.nodes[v]['type'])
+                # print("before", param, v, self.template.get(param, 'type'), self.template.get(v, 'type'))
+                if self.template.get(v, 'type') in [0, 1]:
+                    self.template.set(param, 'type', 1)
+                # print("after", param, v, self.template.get(param, 'type'), self.template.get(v, 'type'))
             self.record['remain'].remove((i, j, k))
             self.record['chosen'].append(param)
             self.fill_chosen(param) # add internal paramters that can be added now
@@ -485,6 +715,7 @@ class Graph():
                 self.independent.append(param)
                 self.problem_order.append(param)
             else: self.problem_order.append(param)
+        self.problem_order = list(self.problem_order) # later steps shuffle it in place
 
     def gen_debug(self, n, m, s, first=-1, max_param=4):
         '''
@@ -508,7 +739,7 @@ class Graph():
                 self.ques_idx = self.topological_order[-1]
                 self.design_unused(max_param=max_param)
                 if self.perm:
-                    self.problem_order = random_topological_sort(self.template)
+                    self.problem_order = random_topological_sort(self.template, self.rng)
                 return
 
     def fill_all(self):
@@ -516,9 +747,8 @@ class Graph():
         for upper in range(self.d-1):
             lower = upper + 1
             for j in range(self.l[upper]):
-                off_springs = [o for o in range(self.l[upper+1]) if self.G[upper][j, o]]
-                out_edge = self.graph.out_edges((upper, j), data=True)
-                degree_now = sum(1 for edge in out_edge if edge[2]['chosen'])
+                off_springs = self.children[upper][j]
+                degree_now = sum(1 for x in off_springs if (upper, j, x) in self.chosen_edges)
                 if len(off_springs) == degree_now:
                     if (upper, j, lower) in self.record['inter']:
                         self.record['inter'].remove((upper, j, lower))
@@ -528,7 +758,7 @@ class Graph():
             for lower in range(upper+2, self.d):
                 for j in range(self.l[upper]):
                     if (upper, j, upper+1) not in self.record['inter']:
-                        off_springs = [o for o in range(self.l[upper+1]) if self.G[upper][j, o]]
+                        off_springs = self.children[upper][j]
                         for off_spring in off_springs:
                             if (upper+1, off_spring, lower) in self.record['inter']:
                                 stamp = True
@@ -544,11 +774,10 @@ class Graph():
         add internal parameter to chosen set based on the current chosen set.
         '''
         _, i, j, k = param
-        self.graph.edges[(i, j), (i+1, k)]['chosen'] = True
-        off_springs = [o for o in range(self.l[i+1]) if self.G[i][j, o]]
+        self.chosen_edges.add((i, j, k))
+        off_springs = self.children[i][j]
         degree = len(off_springs)
-        out_edge = self.graph.out_edges((i, j), data=True)
-        degree_now = sum(1 for edge in out_edge if edge[2]['chosen'])
+        degree_now = sum(1 for x in off_springs if (i, j, x) in self.chosen_edges)
         if degree == degree_now:
             self.record['inter'].remove((i, j, i+1))
             # print("remove0", param, (i, j, i+1))
@@ -578,7 +807,7 @@ class Graph():
                 for lower in range(i+1, self.d):
                     for j in range(self.l[upper]):
                         if (upper, j, upper+1) not in self.record['inter']:
-                            off_springs = [o for o in range(self.l[upper+1]) if self.G[upper][j, o]]
+                            off_springs = self.children[upper][j]
                             for off_spring in off_springs:
                                 if (upper+1, off_spring, lower) in self.record['inter']:
                                     stamp = True
@@ -597,24 +826,24 @@ class Graph():
         '''
         l, i, j, k = param
         if l == 1 and param not in self.problem_order:
-            self.template.nodes[param]['type'] = 2
+            self.template.set(param, 'type', 2)
             if i+1 == k:
-                for off_spring in [o for o in range(self.l[i+1]) if self.G[i][j, o]]:
+                for off_spring in self.children[i][j]:
                     self.template.add_edge((0, i, j, off_spring), param)
-                    if self.template.nodes[(0, i, j, off_spring)]['type'] in [0, 1]:
-                        self.template.nodes[param]['type'] = 1
+                    if self.template.get((0, i, j, off_spring), 'type') in [0, 1]:
+                        self.template.set(param, 'type', 1)
                 self.problem_order.append(param)
                 return
             else:
-                for off_spring in [o for o in range(self.l[i+1]) if self.G[i][j, o]]:
+                for off_spring in self.children[i][j]:
                     self.template.add_edge((0, i, j, off_spring), param)
-                    if self.template.nodes[(0, i, j, off_spring)]['type'] in [0, 1]:
-                        self.template.nodes[param]['type'] = 1
+                    if self.template.get((0, i, j, off_spring), 'type') in [0, 1]:
+                        self.template.set(param, 'type', 1)
                     self.template.add_edge((1, i+1, off_spring, k), param)
                     if (1, i+1, off_spring, k) not in self.problem_order:
                         self.add_param((1, i+1, off_spring, k))
-                    if self.template.nodes[(1, i+1, off_spring, k)]['type'] in [0, 1]:
-                        self.template.nodes[param]['type'] = 1
+                    if self.template.get((1, i+1, off_spring, k), 'type') in [0, 1]:
+                        self.template.set(param, 'type', 1)
                 self.problem_order.append(param)
                 return
 
@@ -624,9 +853,9 @@ class Graph():
         just for debugging
         '''
         for v in self.graph.nodes():
-            if random.random() < 0.:
+            if self.rng.py.random() < 0.:
                 self.unique.append(v)
-                self.graph.nodes[v]['unique'] = True
+                self.graph.set(v, 'unique', True)
 
     def op_num(self, params):
         '''
@@ -634,7 +863,7 @@ class Graph():
         '''
         n_op = 0
         for param in params:
-            op = self.template.in_degree[param]
+            op = self.template.in_degree(param)
             if op <= 2:
                 n_op += 1
             else:
@@ -643,7 +872,11 @@ class Graph():
 
     def draw_template(self, ax=None, labels=False, rotate_seed = None):
         import matplotlib.patches as mpatches
+        from matplotlib.patches import ArrowStyle
+        from matplotlib.lines import Line2D
         from tools.tools import wrap_label
+        import networkx as nx
+        template = self.template.to_networkx()
         # define color map:
         color = {
             -1: "#E6E6FA", # Lavender
@@ -669,9 +902,10 @@ class Graph():
                 sorted_param.remove(self.rand)
             for order, node in enumerate(sorted_param):
                 pos[node] = (np.sin(2*np.pi*(order+1)/len(sorted_param)), np.cos(2*np.pi*(order+1)/len(sorted_param)))
-            nx.draw_networkx_nodes(self.partial_template, pos, ax=ax)
-            nx.draw_networkx_edges(self.partial_template, pos, ax=ax)
-            nx.draw_networkx_labels(self.partial_template, pos, font_size=8, ax=ax)  # set font_size here
+            partial_template = self.partial_template.to_networkx()
+            nx.draw_networkx_nodes(partial_template, pos, ax=ax)
+            nx.draw_networkx_edges(partial_template, pos, ax=ax)
+            nx.draw_networkx_labels(partial_template, pos, font_size=8, ax=ax)  # set font_size here
             return
         elif self.problem_order:
             #handles.append(mpatches.Patch(color="#E6E6FA", label='random paramter'))
@@ -694,7 +928,7 @@ class Graph():
                 for order, node in enumerate(sorted_param):
                     pos[node] = (np.sin(2*np.pi*(order)/(self.n_param)), np.cos(2*np.pi*(order)/(self.n_param)))
                 node_colors = []
-                for node in self.template.nodes(data=True):
+                for node in template.nodes(data=True):
                     if node[0] == self.ques_idx:
                         node_colors.append("#00BFFF") # Deep Sky Blue
                     else:
@@ -706,12 +940,12 @@ class Graph():
                     pos[node] = (np.sin(np.pi*(order+0.5)/used), np.cos(np.pi*(order+0.5)/used))
                 for order, node in enumerate(self.problem_order[used:]):
                     pos[node] = (np.sin(np.pi+np.pi*(order+0.5)/unused), np.cos(np.pi+np.pi*(order+0.5)/unused))
-                node_colors = [color[node[1]['type']] for node in self.template.nodes(data=True)]
-            node_alphas = [alpha(node) for node in self.template.nodes()] # so^>v<dph8
+                node_colors = [color[node[1]['type']] for node in template.nodes(data=True)]
+            node_alphas = [alpha(node) for node in template.nodes()] # so^>v<dph8
         else:
             if self.topological_order:
                 sorted_param = self.topological_order
-            else: sorted_param = random_topological_sort(self.template)
+            else: sorted_param = random_topological_sort(self.template, self.rng)
             if self.rand in sorted_param:
                 sorted_param.remove(self.rand)
             for order, node in enumerate(sorted_param):
@@ -721,19 +955,19 @@ class Graph():
             node_alphas = 1 # so^>v<dph8
         
         edge_color = []
-        for edge in self.template.edges():
+        for edge in template.edges():
             # print(edge)
             if edge[1][0] == 1:
                 edge_color.append("red")
             else:
                 edge_color.append("black")
 
-        #nx.draw_networkx_nodes(self.template, pos, ax=ax, node_color=node_colors, alpha=node_alphas)
+        #nx.draw_networkx_nodes(template, pos, ax=ax, node_color=node_colors, alpha=node_alphas)
         for c, shape in zip(list(color.values())+["#00BFFF"], ['o', 'o' ,'^' ,'^' ,'*']):
-            cur_nodes = [node[0] for node in self.template.nodes(data=True) if color[node[1]['type']] == c and node[0] != self.ques_idx or node[0] == self.ques_idx and c=="#00BFFF"]
+            cur_nodes = [node[0] for node in template.nodes(data=True) if color[node[1]['type']] == c and node[0] != self.ques_idx or node[0] == self.ques_idx and c=="#00BFFF"]
             #print(cur_nodes)
-            nx.draw_networkx_nodes(self.template, pos, ax=ax, nodelist=cur_nodes, node_color=c, node_shape=shape, node_size=180 if c != color[-1] else 560)
-        nx.draw_networkx_edges(self.template, pos, ax=ax, edge_color=edge_color, min_target_margin=15, min_source_margin=0, arrowstyle=ArrowStyle.Fancy(head_length=.5, head_width=.5, tail_width=.2))
+            nx.draw_networkx_nodes(template, pos, ax=ax, nodelist=cur_nodes, node_color=c, node_shape=shape, node_size=180 if c != color[-1] else 560)
+        nx.draw_networkx_edges(template, pos, ax=ax, edge_color=edge_color, min_target_margin=15, min_source_margin=0, arrowstyle=ArrowStyle.Fancy(head_length=.5, head_width=.5, tail_width=.2))
         if labels:
             max_chars_per_line = 12
             labels = {}
@@ -744,9 +978,9 @@ class Graph():
                     param_name = self.get_ntn(param)
                     labels[param] = wrap_label(param_name, max_chars_per_line)
             
-            nx.draw_networkx_labels(self.template, pos, labels=labels, font_size=8, font_family="Arial", ax=ax)  # set font_size here
+            nx.draw_networkx_labels(template, pos, labels=labels, font_size=8, font_family="Arial", ax=ax)  # set font_size here
         else:
-            nx.draw_networkx_labels(self.template, pos, font_size=8, ax=ax)  # set font_size here
+            nx.draw_networkx_labels(template, pos, font_size=8, ax=ax)  # set font_size here
 
         from matplotlib.legend_handler import HandlerPatch
         # Define a custom handler for the arrow
@@ -773,6 +1007,8 @@ class Graph():
 
     def draw_structure(self, ax=None):
         import matplotlib.patches as mpatches
+        import networkx as nx
+        graph = self.graph.to_networkx()
         # define color map:
         color = {
             False: "#1f78b4",
@@ -782,7 +1018,7 @@ class Graph():
         for i in range(self.d):
             for j in range(self.l[i]):
                 pos[(i, j)] = (j, self.d-1-i)
-        node_colors = [color[node[1]['unique']] for node in self.graph.nodes(data=True)]
+        node_colors = [color[node[1]['unique']] for node in graph.nodes(data=True)]
         if hasattr(self, "partial_inst_param"):
             print("Has")
             selected = set()
@@ -791,11 +1027,11 @@ class Graph():
                     selected.add((i, j))
                     selected.add((i+1, k))
             map_to_color = {True: 1, False: 0.2}
-            node_alphas = [map_to_color[node in selected] for node in self.graph.nodes()]
+            node_alphas = [map_to_color[node in selected] for node in graph.nodes()]
         else:
             node_alphas = 1
 
-        nx.draw(self.graph, pos, node_color=node_colors, with_labels=True, font_weight='bold', ax=ax, alpha=node_alphas)
+        nx.draw(graph, pos, node_color=node_colors, with_labels=True, font_weight='bold', ax=ax, alpha=node_alphas)
 
         # create legend:
         unique_patch = mpatches.Patch(color='#228B22', label='unique item')
@@ -833,20 +1069,18 @@ class Graph():
         '''
         Given self.record['chosen'], construct the smallest disgram for all chosen parameters.
         '''
-        self.template = nx.DiGraph()
+        self.template = DAG(type=None) # type: -1 random, 0 necessary, 1 depends on a necessary one, 2 unused
         for param in self.record['chosen']:
             self.template.add_node(param)
         # self.template.add_node(self.rand)
         
         for l, i, j, k in self.record['chosen']:
             if l == 1:
-                for x in range(self.l[i+1]):
-                    if self.G[i][j, x]:
-                        self.template.add_edge((0, i, j, x), (1, i, j, k))
+                for x in self.children[i][j]:
+                    self.template.add_edge((0, i, j, x), (1, i, j, k))
                 if k - i > 1:
-                    for x in range(self.l[i+1]):
-                        if self.G[i][j, x]:
-                            self.template.add_edge((1, i+1, x, k), (1, i, j, k))
+                    for x in self.children[i][j]:
+                        self.template.add_edge((1, i+1, x, k), (1, i, j, k))
 
 
 
@@ -921,7 +1155,7 @@ if __name__ == "__main__":
             graph.setup_template()
             # print("finished")
             valid = graph.reasonable_sort(first=-1)
-            if not nx.is_directed_acyclic_graph(graph.template):
+            if not graph.template.is_acyclic():
                 print(False)
                 break
             if valid:
@@ -0,0 +1,31 @@
+import numpy as np
+from math_gen.graph_gen import pairwise_sum, softmax_choice
+from tools.rng import Rng
+
+def test_pairwise_sum():
+    # bit-identical to the pairwise summation of numpy, also past the 128 element blocks
+    rs = np.random.RandomState(0)
+    for n in list(range(300)) + [511, 1000, 1031]:
+        a = list(rs.random_sample(n) * rs.choice([1e-8, 1., 1e8]))
+        assert pairwise_sum(list(a)) == np.array(a, dtype=float).sum()
+
+def test_softmax_choice():
+    # the same parameter and the same random state afterwards as the np.random.choice of Graph.reasonable_sort
+    rs = np.random.RandomState(1)
+    for trial in range(2000):
+        pool = [(int(rs.randint(2)), trial, i, 0) for i in range(rs.choice([1, 2, 7, 8, 9, 64, 129, 300]))]
+        stack = [param for param in pool if rs.random_sample() < 0.5]
+        p1, p2 = abs(rs.randn()), abs(rs.randn())
+        values = np.zeros(len(pool))
+        for i, param in enumerate(pool):
+            if param[0] == 1:
+                values[i] += p1
+            if param not in stack:
+                values[i] += p2
+        e_x = np.exp(values - np.max(values))
+        seed = int(rs.randint(2 ** 31))
+        ref_rs = np.random.RandomState(seed)
+        expected = pool[ref_rs.choice(len(pool), p=e_x / e_x.sum())]
+        rng = Rng(None, np.random.RandomState(seed))
+        assert softmax_choice(pool, stack, [0., p1, p2, p1 + p2], {}, rng=rng) == expected
+        assert rng.np.random_sample() == ref_rs.random_sample()
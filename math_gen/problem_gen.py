@@ -5,55 +5,90 @@
 
 from data_gen.categ import Data
 from math_gen.graph_gen import Graph
-from tools.tools import random_topological_sort, to_sketch, to_hash, wrap_label
-import random, copy, math, hashlib, string
-import networkx as nx
+from math_gen.structure import Structure
+from tools.tools import random_topological_sort, to_sketch, to_hash, rename_symbols, wrap_label
+from tools.dag import DAG
+from tools import instrument
+from tools.rng import Rng, get_rng
+import random, copy, math, hashlib, string, time
 import numpy as np
 from heapq import heappush, heappop
 from itertools import count, product
-from typing import List, Dict, Union, Callable, Any
+from typing import List, Dict, Union, Callable, Any, Iterator
 from const.params import mod, try_num, feasible_symbols
 
 class Num(object):
-    def __init__(self, a: Union[int, str]=None, mod=mod, mul=False) -> None:
-        self.mod = mod
-        if a == None:
-            if mul:
-                self.a = random.randint(1, self.mod - 1)
-            else:
-                self.a = random.randint(0, self.mod - 1)
+    '''
+    an integer modulo mod. The modulus is shared by the class, so a Num is a single slot a in [0, mod);
+    Num(a, mod=other) gives an instance of a subclass for the other modulus (see num_class).
+    Nums are immutable and the arithmetic returns new ones. The hot paths of Problem work on the ints .a instead.
+    '''
+    __slots__ = ("a",)
+    mod = mod
+
+    def __new__(cls, a: Union[int, str]=None, mod=None, mul=False, rng: Rng=None) -> "Num":
+        if mod is not None and mod != cls.mod:
+            cls = num_class(mod)
+        self = object.__new__(cls)
+        if a is None:
+            self.a = get_rng(rng).py.randint(1 if mul else 0, cls.mod - 1)
         elif isinstance(a, str):
-            self.a = int(a) % self.mod
-        else: self.a = a % self.mod
-    
-    def __add__(self, other):
-        if isinstance(other, Num):
-            return Num(self.a + other.a, self.mod)
+            self.a = int(a) % cls.mod
         else:
-            return Num(self.a + other, self.mod)
-    
+            self.a = a % cls.mod
+        return self
+
+    def __reduce__(self):
+        return (Num, (self.a, self.mod))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __add__(self, other):
+        num = object.__new__(self.__class__)
+        num.a = (self.a + (other.a if isinstance(other, Num) else other)) % self.mod
+        return num
+
     def __sub__(self, other):
-        if isinstance(other, Num):
-            return Num(self.a - other.a, self.mod)
-        else:
-            return Num(self.a - other, self.mod)
-    
+        num = object.__new__(self.__class__)
+        num.a = (self.a - (other.a if isinstance(other, Num) else other)) % self.mod
+        return num
+
     def __mul__(self, other):
-        if isinstance(other, Num):
-            return Num(self.a * other.a, self.mod)
-        else:
-            return Num(self.a * other, self.mod)
-    
+        num = object.__new__(self.__class__)
+        num.a = (self.a * (other.a if isinstance(other, Num) else other)) % self.mod
+        return num
+
     def __eq__(self, other: Union['Num', int]) -> bool:
         if isinstance(other, int):
             return self.a == other
         else:
             return self.a == other.a
-    
+
+    __hash__ = None
+
     def __str__(self) -> str:
         return str(self.a)
 
+NUM_CLASSES: Dict[int, type] = {mod: Num}
+
+def num_class(m: int) -> type:
+    '''
+    the Num class of the modulus m.
+    '''
+    cls = NUM_CLASSES.get(m)
+    if cls is None:
+        cls = NUM_CLASSES[m] = type(f"Num{m}", (Num,), {"__slots__": (), "mod": m})
+    return cls
+
 class Expression(object):
+    __slots__ = ("kind", "value", "param_list", "op", "param")
+    VALUE = 0 # the value is known: a number, a parameter taken as it is, or a value set with set_value
+    OP = 1 # the value is op of the values of param_list
+
     def __init__(self, value: Union[List['Expression'], Num, int]=None, op: str=None, param: tuple=None, set_value: Union[Num, int]=None) -> None:
         '''
         Three cases:
@@ -61,24 +96,27 @@ class Expression(object):
         2. it is an intermidiate variable that is defined by other things: value=list(...), op=..., param=None
         3. it is just a number: value=value, op=None, param=None
         '''
-
         if isinstance(value, list):
             self.param_list = value
             if set_value != None:
-                self.value = set_value if isinstance(set_value, Num) else Num(set_value)
+                value = set_value if isinstance(set_value, Num) else Num(set_value)
+            else:
+                value = None
         else:
             if isinstance(value, int):
-                self.value = Num(value)
-            elif isinstance(value, Num):
-                self.value = value
+                value = Num(value)
+            elif not isinstance(value, Num):
+                value = None
             self.param_list = []
+        self.value = value
+        self.kind = Expression.OP if value is None else Expression.VALUE
 
         self.op = op
         self.param = param
 
     @property
     def get_value(self):
-        if hasattr(self, "value"):
+        if self.kind == Expression.VALUE:
             return self.value
         iterable = [param.get_value for param in self.param_list]
         if self.op == "diff":
@@ -86,64 +124,49 @@ class Expression(object):
         if self.op == "mul":
             return iterable[0] * iterable[1]
 
-        return sum(iterable, start=Num(0))
+        return Num(sum([num.a for num in iterable]))
 
     def simplify(self):
-        if len(self.param_list) == 1:
-            if self.param == None:
-                if hasattr(self.param_list[0], "value"):
-                    self.value = self.param_list[0].value
-                self.op = self.param_list[0].op
-                self.param = self.param_list[0].param
-                self.param_list = self.param_list[0].param_list
-                self.simplify()
-                return
-            
-            elif self.param_list[0].param == None:
-                if hasattr(self.param_list[0], "value"):
-                    self.value = self.param_list[0].value
-                self.op = self.param_list[0].op
-                self.param_list = self.param_list[0].param_list
-                self.simplify()
-                return
-
-        for param in self.param_list:
-            param.simplify()
+        '''
+        merge every node which has a single child into it, keeping the parameter of the two if there is one.
+        done with a stack instead of recursion: a node is merged first, then its children.
+        '''
+        stack = [self]
+        while stack:
+            exp = stack.pop()
+            while len(exp.param_list) == 1:
+                child = exp.param_list[0]
+                if exp.param != None and child.param != None:
+                    break
+                if child.kind == Expression.VALUE:
+                    exp.value = child.value
+                    exp.kind = Expression.VALUE
+                exp.op = child.op
+                if exp.param == None:
+                    exp.param = child.param
+                exp.param_list = child.param_list
+            stack.extend(exp.param_list)
 
     def binarify(self):
-        for param in self.param_list:
-            param.binarify()
-        '''n = len(self.param_list)
-        pool = self.param_list
-        now = self
-        if n > 2:
-            while n > 2:
-                now.param_list = [pool.pop(0), Expression(value=[], op="add")]
-                now = now.param_list[1]
-                n -= 1
-
-            now.param_list = pool'''
-        if len(self.param_list) > 2:
-            self = self.make_bi(self.param_list)
-    
-    def make_bi(self, lst: list) -> 'Expression':
-        if len(lst) == 2:
-            return Expression(value=lst, op="add")
-        else:
-            # exp0, exp1 = random.sample(lst, 2)
-            exp0, exp1 = lst[0], lst[1]
-            lst.remove(exp0)
-            lst.remove(exp1)
-            exp = Expression(value=[exp0, exp1], op="add")
-            # lst.append(exp)
-            lst.insert(0, exp)
-            return self.make_bi(lst=lst)
-            
+        '''
+        turn every node with n > 2 children e0, ..., e(n-1) into [add(...add(add(e0, e1), e2)..., e(n-2)), e(n-1)],
+        in place and in linear time.
+        '''
+        stack = [self]
+        while stack:
+            exp = stack.pop()
+            lst = exp.param_list
+            stack.extend(lst)
+            if len(lst) > 2:
+                acc = Expression(value=lst[:2], op="add")
+                for param in lst[2:-1]:
+                    acc = Expression(value=[acc, param], op="add")
+                lst[:] = [acc, lst[-1]]
 
     def display(self, level=0, scale=4):
         space = " " * (4*level)
         op = " -" + self.op if self.op != None else ""
-        if hasattr(self, "value"):
+        if self.kind == Expression.VALUE:
             if self.param == None:
                 n = "rand"
             else:
@@ -169,7 +192,7 @@ class Problem(Graph):
     dot: str
     symbol_method: str
     sol_sort: bool
-    def __init__(self, d, w0, w1, e, p, args: dict, dist: Dict[str, Callable[[], Any]]=None, be_shortest: bool=True) -> None:
+    def __init__(self, d, w0, w1, e, p, args: dict, dist: Dict[str, Callable[[], Any]]=None, be_shortest: bool=True, rng: Rng=None) -> None:
         '''
         Only define_detail=True is verified. When using False case, please print out to see if the output is correct.
 
@@ -182,8 +205,9 @@ class Problem(Graph):
         p is the probability of adding vertex when it's possible
         if e does not satisfy: (d-1) * w1 ** 2 >= e >= (d-1) * w0,
         choose the feasible e closest to the original e.
+        rng: the random generators, default the global ones (see tools.rng).
         '''
-        super().__init__(d, w0, w1, e, p, args['perm'], dist=dist)
+        super().__init__(d, w0, w1, e, p, args['perm'], dist=dist, rng=rng)
         self.args = args
         for key, val in args.items():
             setattr(self, key, val)
@@ -191,7 +215,12 @@ class Problem(Graph):
         self.lookup:Dict[tuple, Num] = {} # map from parameter to its value
         self.name_dict:Dict[tuple, str] = {} # map from parameter to param_name (symbol)
         self.prob_dict:Dict[tuple, str] = {} # map from parameter to its problem
+        self.prob_spec:Dict[tuple, tuple] = {} # map from parameter to what its problem sentence says, see prob_sentence
         self.sketch:Dict[tuple, Expression] = {} # map from parameter to (op0, op1, val) pair. to expression instance
+        self.sketch_cache:Dict[str, tuple] = {} # map from 'prob' or 'sol' to the (text, sketch) pair of the last to_hash call
+        self.template_solution:List[str] = None # the solution sketch before its symbols are renamed, see template_sketch
+        self.hash_val:int = None # the solution template hash IdGen_PT.gen_prob accepted this problem with
+        self.pending:Dict[str, tuple] = {} # the render methods a lazy to_problem left for later, with their arguments
         self.problem:List[str] = []
         self.question = []
         self.solution:List[str] = []
@@ -201,51 +230,66 @@ class Problem(Graph):
         self.perm_level_ = -1
         self.detail_level_ = -1
 
-    def gen(self, n, m, s, first=-1, max_param=4, fix_categ: Union[None, int]=None):
+    def gen(self, n, m, s, first=-1, max_param=4, fix_categ: Union[None, int]=None, n_op: Union[None, int]=None, deadline: Union[None, float]=None, structures: Iterator[Structure]=None):
         '''
         n is the operation needed for internal parameters
         m is the total number of minimal required operations
         s is the total number of operations
         first determine the type of the final question
         max_param determine the maximal number of parametered can appear in a single sentence
+        n_op: the number of operations wanted, if any. It is settled as soon as a template is sorted (see count_n_op);
+        if it is another one, gen stops there and returns False with self.n_op set. self.n_op is None if no template could be sorted.
+        deadline: a time.perf_counter() value. Once it has passed, gen stops retrying and returns False.
+        structures: views of a StructureBatch drawn with the parameters of this problem, e.g. iter(batch).
+        Every try takes the next structure instead of drawing one, and draws its own once they run out.
         '''
-        count = 0
+        self.n_op = None
         for i in range(try_num):
-            self.init()
-            data = Data()
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            with instrument.timer("graph.init"):
+                self.init(structure=None if structures is None else next(structures, None))
+            data = Data(rng=self.rng)
             self.ln = data(None, self.d, fix_categ=fix_categ) # layer name
             self.N = [] # Nodes' name
             for i in range(self.d):
                 self.N.append(data(self.ln[i], self.l[i]))
             self.unique_name = data.unique
             self.assign_unique()
-            self.choose_param(n, m)
+            with instrument.timer("choose_param"):
+                self.choose_param(n, m)
             self.setup_template()
             # print("finished")
-            valid = self.reasonable_sort(first=first)
-            count += 1
+            with instrument.timer("reasonable_sort"):
+                valid = self.reasonable_sort(first=first)
             if valid:
-                # print(f"count: {count}")
-                self.design(s, max_param=max_param)
+                if n_op is not None:
+                    self.n_op = self.count_n_op(s, max_param=max_param)
+                    if self.n_op != n_op:
+                        return False
+                with instrument.timer("design"):
+                    self.design(s, max_param=max_param)
                 self.fill_all()
                 self.ques_pos = len(self.topological_order)
                 self.ques_idx = self.topological_order[-1]
-                self.design_unused(max_param=max_param)
+                with instrument.timer("design_unused"):
+                    self.design_unused(max_param=max_param)
 
                 # print([n for n in self.template.nodes])
 
                 self.ori_order = copy.deepcopy(self.problem_order)
                 if self.perm:
-                    self.problem_order = random_topological_sort(self.template)
+                    self.problem_order = random_topological_sort(self.template, self.rng)
                 
                 if not self.be_shortest:
-                    random_solution_order = random_topological_sort(self.template)
+                    random_solution_order = random_topological_sort(self.template, self.rng)
                     random_solution_order.remove(self.rand)
                     query_idx = random_solution_order.index(self.ques_idx)
                     self.random_solution_order = random_solution_order[:query_idx+1]
                     self.ques_pos = len(self.random_solution_order)
                     
                 return True
+            instrument.count("reject.sort")
         return False
 
     def assign_unique(self):
@@ -256,18 +300,20 @@ class Problem(Graph):
             for j, name in enumerate(self.N[i]):
                 if name in self.unique_name:
                     self.unique.append((i, j))
-                    self.graph.nodes[(i, j)]['unique'] = True
+                    self.graph.set((i, j), 'unique', True)
 
-    def to_problem(self):
+    def to_problem(self, parsed: bool=False, lazy: bool=False):
         '''
         Suppose we've already used self.gen to generate a problem.
         Now we can use this method to translate the abstract template to discrete problems using self.ln and self.N.
+        parsed: self.parse_all() has been called already (e.g. for self.template_hash()).
+        lazy: only solve the problem: draw the numbers, the shuffle and the symbols (self.sol_symbols), and set self.ans.
+        The text is rendered when it is first read: self.problem and self.prob_dict, self.solution and self.name_dict,
+        self.whole_template and self.all_param (see __getattr__). It is the same text as without lazy,
+        but an attempt which is rejected on n_op or on self.template_hash() never builds it.
         '''
-        for param in self.problem_order:
-            self.parse(param)
-            '''if param[0] != -1:
-                exp = self.sketch[param]
-                exp.display()'''
+        if not parsed:
+            self.parse_all()
         
         l, i, j, k = self.ques_idx
         if l == 0:
@@ -277,31 +323,179 @@ class Problem(Graph):
 
         self.shuffle()
 
-        # generate problem and solution
-        for param in self.problem_order:
-            if param[0] == 0:
-                self.problem.append(self.prob_dict[param])
-        self.problem.append(ques)
-
         # self.draw()
         
         '''if self.sol_sort:
-            self.sol_template = nx.DiGraph()'''
+            self.sol_template = DAG()'''
+        # draw the symbols in the order decode would, the sketch of the solution comes with them
         my_queue = self.topological_order if self.be_shortest else self.random_solution_order
+        self.sol_symbols = []
+        names = {}
+        solution = []
+        draw = self.draw_symbols(self.sol_symbols)
         for param in my_queue:
-            self.decode(param)
-        
+            exp = self.sketch[param]
+            exp.simplify()
+            exp.binarify()
+            self.sketch_sol(exp, names, draw, solution)
+        self.template_solution = solution
+        self.ques = ques
         self.ans = self.lookup[self.ques_idx].a
 
-        self.set_whole_template()
-        # self.solution.append(f"The answer is {self.lookup[self.ques_idx].a}.")
+        self.defer_render()
+        if not lazy:
+            # generate problem and solution
+            for render in list(self.pending):
+                getattr(self, render)(*self.pending.pop(render))
+            # self.solution.append(f"The answer is {self.lookup[self.ques_idx].a}.")
+
+    def defer_render(self):
+        '''
+        leave the text of the solved problem to be rendered when it is read.
+        '''
+        my_queue = self.topological_order if self.be_shortest else self.random_solution_order
+        problem_order = list(self.problem_order)
+        d = self.__dict__
+        self.pending = {
+            "render_problem": (problem_order, self.ques, d.pop("problem"), d.pop("prob_dict")),
+            "render_solution": (my_queue, self.sol_symbols, d.pop("solution"), d.pop("name_dict")),
+            "set_whole_template": (problem_order,),
+        }
+
+    # the attributes a lazy to_problem leaves out, and the method which sets them
+    lazy_attrs = {
+        "problem": "render_problem", "prob_dict": "render_problem",
+        "solution": "render_solution", "name_dict": "render_solution",
+        "whole_template": "set_whole_template", "all_param": "set_whole_template",
+    }
+
+    def __getattr__(self, name: str):
+        '''
+        only called for missing attributes: render the text of a lazy to_problem on first access.
+        '''
+        pending = self.__dict__.get("pending")
+        render = Problem.lazy_attrs.get(name)
+        if not pending or render not in pending:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        getattr(self, render)(*pending.pop(render))
+        return self.__dict__[name]
+
+    def render_problem(self, problem_order: list, ques: str, problem: List[str], prob_dict: Dict[tuple, str]):
+        '''
+        the sentences of the parameters (self.prob_dict) and the problem text (self.problem) in the given order.
+        '''
+        for param in self.prob_spec:
+            prob_dict[param] = self.prob_sentence(param)
+        self.prob_dict = prob_dict
+        for param in problem_order:
+            if param[0] == 0:
+                problem.append(prob_dict[param])
+        problem.append(ques)
+        self.problem = problem
+
+    def render_solution(self, my_queue: list, symbols: List[str], solution: List[str], name_dict: Dict[tuple, str]):
+        '''
+        decode the solution in the given order with the symbols drawn for it.
+        '''
+        self.solution = solution
+        self.name_dict = name_dict
+        symbols = iter(symbols)
+        for param in my_queue:
+            exp = self.sketch[param]
+            exp.simplify()
+            exp.binarify()
+            self.to_sol(exp, symbols=symbols)
+
+    def draw_symbols(self, drawn: List[str]) -> Iterator[str]:
+        '''
+        self.get_symbol() for ever, the symbols are kept in drawn.
+        '''
+        while True:
+            drawn.append(self.get_symbol())
+            yield drawn[-1]
+
+    def redraw(self, n: int, rng: Rng=None) -> List["Problem"]:
+        '''
+        n copies of this problem with other numbers: every Num() and Num(mul=True) which parse drew is drawn again,
+        and the values of all parameters of the n copies are computed together with numpy, in parse order.
+        A copy shares the template, the names, the problem order and the solution with its symbols with this problem;
+        its self.prob_spec, self.lookup, self.sketch and self.ans are its own, and its text is rendered when it is read
+        (see to_problem). The solution template hash is the same for all of them; with few numbers, copies may repeat.
+        use after self.to_problem(). rng: default self.rng, only its numpy generator is drawn from.
+        '''
+        rng = self.rng if rng is None else rng
+        params = [param for param in self.parse_order if param[0] != -1]
+        drawn = [param for param in params if param[0] == 0 and self.prob_spec[param][0] in ("equals", "add", "mul")]
+        nums = {}
+        if drawn:
+            low = np.array([[1 if self.prob_spec[param][0] == "mul" else 0] for param in drawn])
+            nums = dict(zip(drawn, rng.np.randint(low, mod, size=(len(drawn), n))))
+
+        values = {}
+        for param in params:
+            l, i, j, k = param
+            value = np.zeros(n, dtype=int)
+            if l == 0:
+                op0, _, op1, pre = self.prob_spec[param]
+                if op0 == "has":
+                    value += 1
+                elif op0 == "equals":
+                    value += nums[param]
+                else:
+                    if op1 == "diff":
+                        value += values[pre[0]] - values[pre[1]]
+                    else:
+                        for param_ in pre:
+                            value += values[param_]
+                    if op0 == "add":
+                        value += nums[param]
+                    elif op0 == "mul":
+                        value *= nums[param]
+            elif i+1 == k:
+                for param_ in self.template.predecessors(param):
+                    value += values[param_]
+            else:
+                for k_ in self.children[i][j]:
+                    value += values[(0, i, j, k_)] * values[(1, i+1, k_, k)]
+            values[param] = value % mod
+
+        problems = []
+        lookups = [dict(zip(params, [Num(a) for a in column])) for column in np.stack([values[param] for param in params], axis=1).tolist()]
+        for b, lookup in enumerate(lookups):
+            problem = copy.copy(self)
+            problem.prob_spec = dict(self.prob_spec)
+            for param in drawn:
+                op0, _, op1, pre = self.prob_spec[param]
+                problem.prob_spec[param] = (op0, int(nums[param][b]), op1, pre)
+            problem.lookup = lookup
+            problem.sketch = {param: problem.param_sketch(param) for param in params}
+            problem.ans = lookup[self.ques_idx].a
+            problem.sketch_cache = {}
+            problem.problem, problem.prob_dict, problem.solution, problem.name_dict = [], {}, [], {}
+            problem.__dict__.pop("whole_template", None)
+            problem.__dict__.pop("all_param", None)
+            problem.defer_render()
+            problems.append(problem)
+        return problems
+
+    def parse_all(self):
+        '''
+        draw the numbers and operators of every parameter, in problem order (self.parse_order): self.lookup, self.sketch and self.prob_spec.
+        the first step of self.to_problem().
+        '''
+        self.parse_order = list(self.problem_order)
+        for param in self.parse_order:
+            self.parse(param)
+            '''if param[0] != -1:
+                exp = self.sketch[param]
+                exp.display()'''
 
     def to_partial_problem(self, partial=None):
         # choose params in original problem
         self.partial_problem = []
         self.valid_prob_param = [param for param in self.problem_order if param[0] == 0]
         if partial == None:
-            partial = random.randint(1, len(self.valid_prob_param))
+            partial = self.rng.py.randint(1, len(self.valid_prob_param))
         elif isinstance(partial, float):
             partial = math.ceil(partial * len(self.valid_prob_param))
         elif isinstance(partial, int):
@@ -313,15 +507,15 @@ class Problem(Graph):
             self.partial_problem.append(self.prob_dict[param])
         
         # new partial template
-        self.partial_template = nx.DiGraph()
+        self.partial_template = DAG()
         self.partial_inter = []
         for param in self.valid_prob_param[:partial]:
-            if param not in self.partial_template.nodes():
+            if param not in self.partial_template:
                 self.partial_template.add_node(param)
             for dep_param in self.template.predecessors(param):
                 if dep_param[0] == 1:
                     self.partial_inter.append(dep_param)
-                if dep_param not in self.partial_template.nodes():
+                if dep_param not in self.partial_template:
                     self.partial_template.add_node(dep_param)
                 self.partial_template.add_edge(dep_param, param)
         
@@ -333,17 +527,148 @@ class Problem(Graph):
             param = self.partial_inter.pop()
             self.add_partial_param(param)
 
+    def get_sketch(self, method='sol'):
+        '''
+        return the sketch of the problem (method='prob') or of the solution (method='sol')
+        use after self.to_problem()
+        only the requested part is computed, and it is cached until the text changes.
+        '''
+        if method == 'prob':
+            text = " " + ". ".join(self.problem)
+        elif method == 'sol':
+            text = " " + ". ".join(self.solution) + "."
+        else:
+            raise ValueError(f"method ({method}) must be in list ['prob', 'sol']")
+        cached = self.sketch_cache.get(method)
+        if cached is None or cached[0] != text:
+            with instrument.timer("sketch"):
+                sketch = to_sketch(self, **{method: text})
+            cached = (text, sketch[method])
+            self.sketch_cache[method] = cached
+        return cached[1]
+
     def to_hash(self, mod_num=mod, method='sol'):
         '''
         return a hash value in [0, 1, ..., mod-1]
         use after self.to_problem()
         '''
-        problem = " " + ". ".join(self.problem)
-        solution = " " + ". ".join(self.solution) + "."
-        sketch = to_sketch(self, prob=problem, sol=solution)
-        hash_val = to_hash(sketch[method], mod_num=mod_num)
+        hash_val = to_hash(self.get_sketch(method), mod_num=mod_num)
         return hash_val
 
+    def template_sketch(self) -> str:
+        '''
+        the solution sketch of get_sketch('sol'), rendered from the parsed template: the expressions in self.sketch,
+        the solution order and the args. Parameters are written as Inst/Inter, numbers as 0, symbols as the ones to_sketch
+        renames them to. Neither symbols nor random numbers are drawn.
+        use after self.parse_all(); a lazy self.to_problem() renders it on the way and keeps it in self.template_solution.
+        '''
+        if self.template_solution is None:
+            names = {} # as self.name_dict
+            symbols = iter(self.all_symbols) # distinct ones, as many as get_symbol hands out
+            solution = []
+            my_queue = self.topological_order if self.be_shortest else self.random_solution_order
+            for param in my_queue:
+                exp = self.sketch[param]
+                exp.simplify()
+                exp.binarify()
+                self.sketch_sol(exp, names, symbols, solution)
+            self.template_solution = solution
+        return rename_symbols(" " + ". ".join(self.template_solution) + ".", self.all_symbols)
+
+    def sketch_sol(self, exp: Expression, names: dict, symbols: Iterator[str], solution: List[str], append=True):
+        '''
+        self.to_sol with the names and the numbers of the sketch.
+        '''
+        if exp.param != None and exp.param in names:
+            return [], names[exp.param]
+        if exp.param == None and not exp.param_list:
+            return [], "0"
+        def_part, hint_part, cal_part, res_part = None, None, None, "0"
+        n_num = 0
+        name_list = []
+        output_whole_lst = []
+        if not exp.param_list:
+            if exp.kind == Expression.VALUE:
+                n_num = 1
+        else:
+            for param in exp.param_list:
+                output_lst, name_ = self.sketch_sol(param, names, symbols, solution, append=False)
+                output_whole_lst += output_lst
+                name_list.append(name_)
+            n_num = len(name_list)
+
+        if exp.op == "diff":
+            sign = " - "
+        elif exp.op == "mul":
+            sign = " * "
+        else: # add, sum or None
+            sign = " + "
+
+        if not self.name_omit and name_list:
+            hint_part = sign.join(name_list)
+
+        if not self.cal_omit and n_num > 1:
+            cal_part = sign.join(["0"] * n_num)
+
+        if exp.param is not None:
+            ntn = "Inst" if exp.param[0] == 0 else "Inter"
+            if not self.define_var:
+                def_part = ntn
+                name = def_part
+            elif self.define_detail:
+                name = next(symbols, '...')
+                def_part = f"Define {ntn} as {name}"
+            else:
+                name = next(symbols, '...')
+                def_part = f"Define {name}"
+            names[exp.param] = name
+        else:
+            def_part = next(symbols, '...')
+            name = def_part
+
+        output_lst = [part for part in [def_part, hint_part, cal_part, res_part] if part is not None]
+        output = " = ".join(output_lst)
+
+        if append:
+            current_sentence = [def_part] + output_whole_lst
+            post_output_lst = [part for part in [f"so {name}", hint_part, cal_part, res_part] if part is not None]
+            current_sentence.append(" = ".join(post_output_lst))
+            solution.append("; ".join(current_sentence))
+            return [], name
+        else:
+            output_whole_lst.append(output)
+            return output_whole_lst, name
+
+    def names_clash(self) -> bool:
+        '''
+        whether to_sketch may replace a parameter name inside another one. A name "P's Q" can only be found across the dot
+        of another name "P2's Q2" if P and P2 end alike and Q and Q2 start alike, so the names clash if two owners
+        (self.N[:-1]) end with one another, if two items or categories (self.N[1:], self.ln) start with one another,
+        or if a name has the dot in it. Then the sketch of the rendered solution depends on the names.
+        '''
+        owners = [name for names in self.N[:-1] for name in names]
+        owned = [name for names in self.N[1:] for name in names] + list(self.ln)
+        for name in owners + owned:
+            if self.dot in name:
+                return True
+        # in sorted order, a name which starts another one is followed by one it starts
+        for names in ([name[::-1] for name in owners], owned):
+            names = sorted(names)
+            for a in range(len(names) - 1):
+                if names[a+1].startswith(names[a]):
+                    return True
+        return False
+
+    def template_hash(self, mod_num=mod):
+        '''
+        to_hash(mod_num, method='sol') of the problem self.to_problem() would render, from self.template_sketch(),
+        or None if the names clash (see names_clash) and only the rendered solution gives it.
+        use after self.parse_all(): a problem in the wrong bin can be dropped before it is shuffled and rendered.
+        '''
+        if self.names_clash():
+            return None
+        return to_hash(self.template_sketch(), mod_num=mod_num)
+
     def add_partial_param(self, param):
         _, i, j, k = param
         if i+1 == k:
@@ -370,106 +695,129 @@ class Problem(Graph):
                 return
             pre = list(self.template.predecessors(param))
             if not pre:
-                self.prob_dict[param] = f"{self.get_name((i, j))} has {self.get_name((i+1, k))}"
+                self.prob_spec[param] = ("has", None, None, pre)
                 self.lookup[param] = Num(1)
-                self.sketch[param] = Expression(1, param=param)
+                self.sketch[param] = self.param_sketch(param)
                 return
 
-            txt = [f"The number of {self.get_param(param)} equals"]
-            rand = None
-            exp0 = Expression(param=param)
+            op0, num0, op1 = None, None, None
             if self.rand in pre:
                 pre.remove(self.rand)
                 if len(pre) == 0:
-                    rand = Num()
-                    num0 = rand
-                    exp0.param_list.append(Expression(rand))
-                    txt.append(f"{rand.a}")
-                    self.prob_dict[param] = " ".join(txt)
-                    self.sketch[param] = exp0
-                    self.lookup[param] = rand
-                    return
-                if random.random() < 0.5:
+                    op0 = "equals"
+                    num0 = Num(rng=self.rng).a
+                elif self.rng.py.random() < 0.5:
                     op0 = "add"
-                    rand = Num()
-                    num0 = rand
-                    exp0.param_list.append(Expression(rand))
-                    txt.append(f"{rand.a} more than")
-                    exp0.op = "add"
-                    exp1 = Expression()
-                    exp0.param_list.append(exp1)
+                    num0 = Num(rng=self.rng).a
                 else:
                     op0 = "mul"
-                    rand = Num(mul=True)
-                    num0 = rand
-                    exp0.param_list.append(Expression(rand))
-                    txt.append(f"{rand.a} times as much as")
-                    exp0.op = "mul"
-                    exp1 = Expression()
-                    exp0.param_list.append(exp1)
-            else:
-                op0 = None
-                exp1 = exp0
-
-            n_param = len(pre)
-            num1 = Num(0)
-            if n_param == 1:
-                num1 += self.lookup[pre[0]]
-                txt.append(self.get_param(param=pre[0]))
-                exp1.param_list.append(Expression(self.lookup[pre[0]], param=pre[0]))
-            elif n_param == 2:
-                if random.random() < 0.5:
-                    txt.append(f"the sum of {self.get_param(param=pre[0])} and {self.get_param(param=pre[1])}")
-                    num1 += self.lookup[pre[0]] + self.lookup[pre[1]]
-                    exp1.op = "sum"
-                    exp1.param_list.append(Expression(self.lookup[pre[0]], param=pre[0]))
-                    exp1.param_list.append(Expression(self.lookup[pre[1]], param=pre[1]))
-                else:
-                    txt.append(f"the difference of {self.get_param(param=pre[0])} and {self.get_param(param=pre[1])}")
-                    num1 += self.lookup[pre[0]] - self.lookup[pre[1]]
-                    exp1.op = "diff"
-                    exp1.param_list.append(Expression(self.lookup[pre[0]], param=pre[0]))
-                    exp1.param_list.append(Expression(self.lookup[pre[1]], param=pre[1]))
+                    num0 = Num(mul=True, rng=self.rng).a
+            if len(pre) == 2:
+                op1 = "sum" if self.rng.py.random() < 0.5 else "diff"
+            elif len(pre) >= 3:
+                op1 = "sum"
+            self.prob_spec[param] = (op0, num0, op1, pre)
+            self.sketch[param] = self.param_sketch(param)
+
+            # the values are summed as ints, only the result becomes a Num
+            lookup = self.lookup
+            if op0 == "equals":
+                lookup[param] = Num(num0)
+                return
+            if op1 == "diff":
+                num1 = lookup[pre[0]].a - lookup[pre[1]].a
             else:
-                exp1.op = "sum"
-                # len(pre) >= 3
-                txt.append("the sum of")
-                for i, param_ in enumerate(pre):
-                    if i == len(pre) - 1:
-                        txt.append(f"and {self.get_param(param=param_)}")
-                    elif i == len(pre) - 2:
-                        txt.append(f"{self.get_param(param=param_)}")
-                    else:
-                        txt.append(f"{self.get_param(param=param_)},")
-
-                    num1 += self.lookup[param_]
-                    exp1.param_list.append(Expression(value=self.lookup[param_], param=param_))
-            
-            self.sketch[param] = exp0
-            self.prob_dict[param] = " ".join(txt)
+                num1 = 0
+                for param_ in pre:
+                    num1 += lookup[param_].a
             if op0 == None:
-                self.lookup[param] = num1
+                lookup[param] = Num(num1)
             elif op0 == "add":
-                self.lookup[param] = num0 + num1
+                lookup[param] = Num(num0 + num1)
             elif op0 == "mul":
-                self.lookup[param] = num0 * num1
+                lookup[param] = Num(num0 * num1)
             return
         elif l == 1:
             '''only need to complete the lookup table'''
-            num = Num(0)
-            exp0 = Expression(op="sum", param=param)
+            lookup = self.lookup
+            num = 0
             if i+1 == k:
                 for param_ in self.template.predecessors(param):
-                    num += self.lookup[param_]
-                    exp0.param_list.append(Expression(value=self.lookup[param_], param=param_))
+                    num += lookup[param_].a
             else:
-                for k_ in [idx for idx in range(self.l[i+1]) if self.G[i][j, idx]]:
-                    num += self.lookup[(0, i, j, k_)] * self.lookup[(1, i+1, k_, k)]
-                    param0 = Expression(value=self.lookup[(0, i, j, k_)], param=(0, i, j, k_))
-                    param1 = Expression(value=self.lookup[(1, i+1, k_, k)], param=(1, i+1, k_, k))
-                    exp0.param_list.append(Expression(value=[param0, param1], op="mul"))
-            self.lookup[param] = num
-            self.sketch[param] = exp0
+                for k_ in self.children[i][j]:
+                    num += lookup[(0, i, j, k_)].a * lookup[(1, i+1, k_, k)].a
+            lookup[param] = Num(num)
+            self.sketch[param] = self.param_sketch(param)
+
+    def param_sketch(self, param) -> Expression:
+        '''
+        the expression of a parameter for self.sketch: from its self.prob_spec entry (an instance parameter) or the template
+        (an abstract one), with the values of its predecessors in self.lookup.
+        '''
+        l, i, j, k = param
+        lookup = self.lookup
+        if l == 0:
+            op0, num0, op1, pre = self.prob_spec[param]
+            if op0 == "has":
+                return Expression(1, param=param)
+            exp0 = Expression(param=param)
+            if op0 == "equals":
+                exp0.param_list.append(Expression(Num(num0)))
+                return exp0
+            if op0 == None:
+                exp1 = exp0
+            else:
+                exp0.param_list.append(Expression(Num(num0)))
+                exp0.op = op0
+                exp1 = Expression()
+                exp0.param_list.append(exp1)
+            exp1.op = op1
+            for param_ in pre:
+                exp1.param_list.append(Expression(value=lookup[param_], param=param_))
+            return exp0
+        exp0 = Expression(op="sum", param=param)
+        if i+1 == k:
+            for param_ in self.template.predecessors(param):
+                exp0.param_list.append(Expression(value=lookup[param_], param=param_))
+        else:
+            for k_ in self.children[i][j]:
+                param0 = Expression(value=lookup[(0, i, j, k_)], param=(0, i, j, k_))
+                param1 = Expression(value=lookup[(1, i+1, k_, k)], param=(1, i+1, k_, k))
+                exp0.param_list.append(Expression(value=[param0, param1], op="mul"))
+        return exp0
+
+    def prob_sentence(self, param) -> str:
+        '''
+        the sentence of an instance parameter, from its self.prob_spec entry (kind, number, op, predecessors)
+        '''
+        l, i, j, k = param
+        kind, num, op, pre = self.prob_spec[param]
+        if kind == "has":
+            return f"{self.get_name((i, j))} has {self.get_name((i+1, k))}"
+        txt = [f"The number of {self.get_param(param)} equals"]
+        if kind == "equals":
+            txt.append(f"{num}")
+            return " ".join(txt)
+        if kind == "add":
+            txt.append(f"{num} more than")
+        elif kind == "mul":
+            txt.append(f"{num} times as much as")
+        if len(pre) == 1:
+            txt.append(self.get_param(param=pre[0]))
+        elif len(pre) == 2:
+            which = "sum" if op == "sum" else "difference"
+            txt.append(f"the {which} of {self.get_param(param=pre[0])} and {self.get_param(param=pre[1])}")
+        else:
+            txt.append("the sum of")
+            for i, param_ in enumerate(pre):
+                if i == len(pre) - 1:
+                    txt.append(f"and {self.get_param(param=param_)}")
+                elif i == len(pre) - 2:
+                    txt.append(f"{self.get_param(param=param_)}")
+                else:
+                    txt.append(f"{self.get_param(param=param_)},")
+        return " ".join(txt)
 
     def decode(self, param):
         '''
@@ -499,11 +847,11 @@ class Problem(Graph):
             # print('Shuffle Level: mild', num)
             idxs = []
             for i in range(self.n_param):
-                idxs.append((i+random.randint(0, num), i))
+                idxs.append((i+self.rng.py.randint(0, num), i))
             sorted_idxs = []
             for i in range(self.n_param + num):
                 pool = [k for j, k in idxs if j == i]
-                random.shuffle(pool)
+                self.rng.py.shuffle(pool)
                 for idx in pool:
                     sorted_idxs.append(idx)
             
@@ -513,7 +861,7 @@ class Problem(Graph):
             
         if args[0] == "hard":
             # print('Shuffle Level: totally random')
-            random.shuffle(self.problem_order)
+            self.rng.py.shuffle(self.problem_order)
             return
 
     def get_param(self, param):
@@ -559,16 +907,17 @@ class Problem(Graph):
         if not self.symbols:
             return '...'
         if self.symbol_method == 'rand':
-            a = random.choice(self.symbols)
+            a = self.rng.py.choice(self.symbols)
             self.symbols.remove(a)
             return a
         elif self.symbol_method == 'seq':
             a = self.symbols.pop(0)
             return a
 
-    def to_sol(self, exp: Expression, append=True):
+    def to_sol(self, exp: Expression, append=True, symbols: Iterator[str]=None):
         '''
         def_part, hint_part, cal_part, res_part
+        symbols: the symbols to use, default drawn with self.get_symbol()
         '''
         if exp.param != None and exp.param in self.name_dict:
             return [], self.lookup[exp.param], self.name_dict[exp.param]
@@ -579,12 +928,12 @@ class Problem(Graph):
         name_list = []
         output_whole_lst = []
         if not exp.param_list:
-            if hasattr(exp, "value"):
+            if exp.kind == Expression.VALUE:
                 num_list = [exp.value]
                 name_list = []
         else:
             for param in exp.param_list:
-                output_lst, num_, name_ = self.to_sol(param, append=False)
+                output_lst, num_, name_ = self.to_sol(param, append=False, symbols=symbols)
                 output_whole_lst += output_lst
                 num_list.append(num_)
                 name_list.append(name_)
@@ -604,11 +953,11 @@ class Problem(Graph):
             cal_part = sign.join(cal_lst)
 
         if exp.op == "diff":
-            ans = num_list[0] - num_list[1]
+            ans = Num(num_list[0].a - num_list[1].a)
         elif exp.op == "mul":
-            ans = num_list[0] * num_list[1]
+            ans = Num(num_list[0].a * num_list[1].a)
         else:
-            ans = sum(num_list, start=Num(0))
+            ans = Num(sum([num_.a for num_ in num_list]))
         res_part = str(ans.a)
 
         if exp.param is not None:
@@ -616,13 +965,13 @@ class Problem(Graph):
                 def_part = self.get_ntn(exp.param)
                 name = def_part
             elif self.define_detail:
-                name = self.get_symbol()
+                name = self.get_symbol() if symbols is None else next(symbols)
                 def_part = f"Define {self.get_ntn(exp.param)} as {name}"
             else:
-                name = self.get_symbol()
+                name = self.get_symbol() if symbols is None else next(symbols)
                 def_part = f"Define {name}"
         else:
-            def_part = self.get_symbol()
+            def_part = self.get_symbol() if symbols is None else next(symbols)
             name = def_part
 
         if exp.param is not None:
@@ -659,6 +1008,8 @@ class Problem(Graph):
 
     def draw_structure(self, ax=None):
         import matplotlib.patches as mpatches
+        import networkx as nx
+        graph = self.graph.to_networkx()
         # define color map:
         color = {
             False: "#1f78b4",
@@ -671,7 +1022,7 @@ class Problem(Graph):
                     selected.add((i, j))
                     selected.add((i+1, k))
             map_to_color = {True: 1, False: 0.5}
-            node_alphas = [map_to_color[node in selected] for node in self.graph.nodes()]
+            node_alphas = [map_to_color[node in selected] for node in graph.nodes()]
         else:
             node_alphas = 1
         pos = {}
@@ -682,7 +1033,7 @@ class Problem(Graph):
             for j in range(self.l[i]):
                 pos[(i, j)] = (j, self.d-1-i)
                 labels[(i, j)] = self.N[i][j] # .replace("/", "\n")
-        node_colors = [color[node[1]['unique']] for node in self.graph.nodes(data=True)]
+        node_colors = [color[node[1]['unique']] for node in graph.nodes(data=True)]
         # newly added on 12-21
         max_chars_per_line = 12  # Set the max number of chars per line in the label
         for node, label in labels.items():
@@ -692,7 +1043,7 @@ class Problem(Graph):
         #nx.draw_networkx_nodes(self.graph, pos, ax=ax, node_color=node_colors, label=labels, alpha=node_alphas, bbox=dict(facecolor="skyblue", edgecolor='black', boxstyle='round,pad=0.2'))
         #nx.draw_networkx_edges(self.graph, pos, ax=ax)
         #nx.draw_networkx_labels(self.graph, pos, labels=labels, ax=ax, font_family="monospace")
-        nx.draw(self.graph, pos, node_color=node_colors,font_size=10, node_size=1, with_labels=True, ax=ax, labels=labels, bbox=dict(facecolor="skyblue", edgecolor='black', boxstyle='round,pad=0.1'), margins=(0.25,0.1)) #, min_target_margin=25,   alpha=node_alphas, 
+        nx.draw(graph, pos, node_color=node_colors,font_size=10, node_size=1, with_labels=True, ax=ax, labels=labels, bbox=dict(facecolor="skyblue", edgecolor='black', boxstyle='round,pad=0.1'), margins=(0.25,0.1)) #, min_target_margin=25,   alpha=node_alphas, 
 
         # create legend:
         unique_patch = mpatches.Patch(color='#228B22', label='unique item')
@@ -700,25 +1051,27 @@ class Problem(Graph):
 
         # ax.legend(handles=[unique_patch, duplicate_patch], loc='upper center', bbox_to_anchor=(0.5, -0.), ncol=2)
 
-    def set_whole_template(self):
-        whole_template = copy.deepcopy(self.template)
+    def set_whole_template(self, problem_order: list=None):
+        '''
+        problem_order: the parameters of the problem, default self.problem_order
+        '''
+        in_problem = set(self.problem_order if problem_order is None else problem_order)
+        whole_template = self.template.copy()
         self.all_param = [(0, i, j, k) for i in range(self.d-1) for j in range(self.l[i]) for k in range(self.l[i+1])]
         self.all_param += [(1, i, j, k) for i in range(self.d-1) for j in range(self.l[i]) for k in range(i+1, self.d)]
         for param in self.all_param:
-            if param not in self.problem_order:
+            if param not in in_problem:
                 whole_template.add_node(param)
         
         for l, i, j, k in self.all_param:
-            if (l, i, j, k) not in self.problem_order and l == 1:
-                for x in range(self.l[i+1]):
-                    if self.G[i][j, x]:
-                        whole_template.add_edge((0, i, j, x), (1, i, j, k))
-                        # print(f"add {(0, i, j, x)} -> {(1, i, j, k)}")
+            if (l, i, j, k) not in in_problem and l == 1:
+                for x in self.children[i][j]:
+                    whole_template.add_edge((0, i, j, x), (1, i, j, k))
+                    # print(f"add {(0, i, j, x)} -> {(1, i, j, k)}")
                 if k - i > 1:
-                    for x in range(self.l[i+1]):
-                        if self.G[i][j, x]:
-                            whole_template.add_edge((1, i+1, x, k), (1, i, j, k))
-                            # print(f"add {(1, i+1, x, k)} -> {(1, i, j, k)}")
+                    for x in self.children[i][j]:
+                        whole_template.add_edge((1, i+1, x, k), (1, i, j, k))
+                        # print(f"add {(1, i+1, x, k)} -> {(1, i, j, k)}")
         
         # gen labels
         self.whole_template = whole_template
@@ -732,7 +1085,7 @@ class Problem(Graph):
             return None
         labels = np.zeros((1 + len(self.topological_order), len(self.all_param), len(keys)), dtype=int)
 
-        in_degree = dict(self.whole_template.in_degree())
+        in_degree = self.whole_template.in_degrees()
         zero_in_degree = [v for v, d in in_degree.items() if d == 0]
         for i_, param in enumerate([(-1, 0, 0, 0)] + self.topological_order):
             zero_in_degree.remove(param)
@@ -782,13 +1135,13 @@ class Problem(Graph):
         labels = np.zeros((n, n), dtype=int)
         
         if key in ['dep', 'dep_nece', 'dep_unnece']:
-            tc = nx.transitive_closure_dag(self.whole_template)
+            edges = self.whole_template.closure_edges()
         elif key in ['neighbor']:
-            tc = self.whole_template
+            edges = self.whole_template.edges()
         else:
             raise ValueError(f"key ({key}) must be in list ['dep', 'dep_nece', 'dep_unnece', 'neighbor']")
 
-        for (node_i, node_j) in tc.edges():
+        for (node_i, node_j) in edges:
             if node_i != (-1, 0, 0, 0):
                 i = index_dict[node_i]
                 j = index_dict[node_j]
@@ -801,7 +1154,7 @@ class Problem(Graph):
         used for partial
         '''
         # all parameters
-        partial_template = copy.deepcopy(self.partial_template)
+        partial_template = self.partial_template.copy()
         structure_nodes = []
         for l, i, j, k in self.partial_param:
             if l == 0:
@@ -839,9 +1192,7 @@ class Problem(Graph):
         n = len(self.all_partial_param)
         labels = np.zeros((n, n), dtype=int)
         
-        tc = nx.transitive_closure_dag(partial_template)
-
-        for (node_i, node_j) in tc.edges():
+        for (node_i, node_j) in partial_template.closure_edges():
             if node_i != (-1, 0, 0, 0):
                 i = index_dict[node_i]
                 j = index_dict[node_j]
@@ -866,7 +1217,7 @@ class Problem(Graph):
             node0 = self.topological_order[i]
             for j in range(len1):
                 node1 = self.all_param[j]
-                if (node1, node0) in self.whole_template.edges():
+                if self.whole_template.has_edge(node1, node0):
                     labels[i, j] = 1
         
         return labels
@@ -890,7 +1241,7 @@ class Problem(Graph):
     def replace_names(self):
         problem2 = copy.deepcopy(self)
 
-        data = Data()
+        data = Data(rng=self.rng)
         problem2.ln = data(None, self.d) # layer name
         problem2.N = [] # Nodes' name
         problem2.unique = []
@@ -0,0 +1,57 @@
+import random
+import hashlib
+import numpy as np
+from data_gen.prototype.id_gen import IdGen_PT
+from const.params import all_bin
+from tools.rng import Rng
+from tools.tools import fix_seed
+from tools.tools_test import true_correct
+
+def test_template_hash():
+    # the hash of the parsed template is the hash of the rendered solution, unless the names clash (None)
+    n_hash = 0
+    for seed in range(120):
+        id_gen = IdGen_PT("light", "light", max_op=15, max_edge=20, perm_level=None, detail_level=None,
+                          be_shortest=bool(seed % 2), rng=Rng.from_seed(seed), early_hash=seed % 3 == 0)
+        id_gen.gen_prob(all_bin, p_format="pq")
+        hash_val = id_gen.problem.template_hash()
+        if hash_val is not None:
+            assert hash_val == id_gen.problem.to_hash()
+            n_hash += 1
+    assert n_hash >= 100
+
+def test_golden_output():
+    # fixed seeds on the global random states give the texts and the random states afterwards of the original generator
+    digest = hashlib.sha256()
+    for seed in range(40):
+        fix_seed(seed)
+        style = ("light", "middle", "uniform", "heavy")[seed % 4]
+        max_op = 23 if seed % 3 == 0 else 15
+        id_gen = IdGen_PT(style, style, max_op=max_op, max_edge=max_op + 5, perm_level=None, detail_level=None, be_shortest=bool(seed % 2))
+        id_gen.gen_prob(all_bin, p_format="pq")
+        digest.update((id_gen.prob + id_gen.sol + str(id_gen.problem.ans)).encode())
+        digest.update(repr(random.getstate()).encode())
+        digest.update(repr(np.random.get_state()[1:]).encode())
+    assert digest.hexdigest() == "c894182fc53e126f3cd7fa8b9883fb0e6b1b146f8d5eccacd3b4cb5c92febc20"
+
+def test_redraw():
+    # copies with other numbers keep the template, the orders and the hash, and their solutions still check out
+    new_numbers = 0
+    for seed in range(30):
+        id_gen = IdGen_PT("light", "light", max_op=15, max_edge=20, perm_level=5, detail_level=0,
+                          be_shortest=bool(seed % 2), rng=Rng.from_seed(seed))
+        id_gen.gen_prob(all_bin, p_format="pq")
+        problem = id_gen.problem
+        hash_val = problem.to_hash()
+        assert true_correct(id_gen.sol, problem)[0]
+        for variant in problem.redraw(5, rng=Rng.from_seed(seed + 1000)):
+            id_gen.gen_prob(all_bin, p_format="pq", problem=variant)
+            assert variant.template is problem.template
+            assert variant.problem_order == problem.problem_order
+            assert variant.topological_order == problem.topological_order
+            assert variant.to_hash() == hash_val
+            assert variant.template_hash() in (None, hash_val)
+            assert variant.ans == variant.lookup[variant.ques_idx].a
+            assert true_correct(id_gen.sol, variant)[0]
+            new_numbers += variant.prob_spec != problem.prob_spec
+    assert new_numbers >= 140
@@ -0,0 +1,123 @@
+'''
+structure graphs drawn in batches: StructureBatch draws the layer sizes and edges of many structures at once,
+as stacked numpy arrays, with the distribution of Graph.init; batch[b] is a view of structure b for Graph.init.
+
+    batch = StructureBatch(d, w0, w1, e, p, size=1024, rng=rng) # d, w0, w1, e, p: scalars or arrays of size
+    graph.init(structure=batch[b])
+
+A batch draws other numbers than Graph.init: a seed gives other structures, from the same distribution.
+Structures of different d are padded to the largest d and w1 of the batch.
+'''
+import numpy as np
+from typing import Iterator, List, Tuple
+from tools.rng import Rng, get_rng
+
+class StructureBatch(object):
+    '''
+    size structures, structure b has
+    l[b, :d[b]]: the layer sizes,
+    G[b, i, :l[b, i], :l[b, i+1]]: the edges (i, j) -> (i+1, k), as in Graph.G,
+    parents[b, i, k]: the parent j of node (i+1, k) which init connects first,
+    other[b, :n_other[b]]: the other edges, as cell indices i * w1 * w1 + j * w1 + k of G[b], in the order init samples them.
+    '''
+    def __init__(self, d, w0, w1, e, p, size: int=None, rng: Rng=None):
+        '''
+        d, w0, w1, e, p as in Graph, each a scalar or an array of size structures.
+        '''
+        rng = get_rng(rng).np
+        d, w0, w1, e, p = np.broadcast_arrays(*[np.asarray(x) for x in (d, w0, w1, e, p)])
+        if size is not None and d.ndim == 0:
+            d, w0, w1, e, p = [np.full(size, x) for x in (d, w0, w1, e, p)]
+        d, w0, w1, e = [x.astype(int) for x in (d, w0, w1, e)]
+        e = np.clip(e, (d-1) * w0, (d-1) * w1 ** 2)
+        self.size = n = len(d)
+        self.d, self.w0, self.w1, self.e, self.p = d, w0, w1, e, p
+        D = int(d.max())
+        W = int(w1.max())
+        self.width = W
+        rows = np.arange(n)
+
+        # layer sizes: add vertices while the edges do not fit, then one more with probability p at a time
+        layer = np.arange(D) < d[:, None]
+        l = np.where(layer, w0[:, None], 0)
+        active = np.ones(n, dtype=bool)
+        while active.any():
+            max_v = (l[:, :-1] * l[:, 1:]).sum(1)
+            min_v = l[:, 1:].sum(1)
+            force = active & (max_v < e)
+            grow = force | (active & (min_v != e) & (rng.random_sample(n) < p))
+            # a uniform layer among the ones below w1
+            keys = rng.random_sample((n, D))
+            keys[~layer | (l >= w1[:, None])] = -1.
+            index = keys.argmax(1)
+            add = grow & (keys[rows, index] >= 0.)
+            l[rows[add], index[add]] += 1
+            active = add
+        self.l = l
+
+        # the first parent of every node below the first layer, then n_other edges out of the rest
+        self.G = np.zeros((n, max(D-1, 1), W, W), dtype=bool)
+        if D > 1:
+            parents = (rng.random_sample((n, D-1, W)) * l[:, :-1, None]).astype(int)
+            parents = np.minimum(parents, np.maximum(l[:, :-1, None] - 1, 0))
+            node = np.arange(W) < l[:, 1:, None] # (b, i, k): node (i+1, k) exists
+            b, i, k = np.nonzero(node)
+            self.G[b, i, parents[b, i, k], k] = True
+            self.parents = parents
+            cell = (np.arange(W)[:, None] < l[:, :-1, None, None]) & node[:, :, None, :]
+            self.n_other = e - l[:, 1:].sum(1)
+            keys = rng.random_sample(cell.shape)
+            keys[~cell | self.G] = 2.
+            # the n_other smallest keys: a uniform sample without replacement, in a uniform order
+            order = np.argsort(keys.reshape(n, -1), axis=1, kind='stable')[:, :max(int(self.n_other.max()), 0)]
+            taken = np.arange(order.shape[1]) < self.n_other[:, None]
+            self.G.reshape(n, -1)[np.nonzero(taken)[0], order[taken]] = True
+            self.other = order
+        else:
+            self.parents = np.zeros((n, 0, W), dtype=int)
+            self.n_other = np.zeros(n, dtype=int)
+            self.other = np.zeros((n, 0), dtype=int)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, b: int) -> "Structure":
+        return Structure(self, b)
+
+    def __iter__(self) -> Iterator["Structure"]:
+        return (Structure(self, b) for b in range(self.size))
+
+class Structure(object):
+    '''
+    a view of structure b of a StructureBatch. Its lists are built when they are asked for.
+    '''
+    def __init__(self, batch: StructureBatch, b: int):
+        self.batch = batch
+        self.b = b
+        self.d = int(batch.d[b])
+        self.l = batch.l[b, :self.d]
+
+    def params(self) -> Tuple[int, int, int, int, float]:
+        '''
+        the (d, w0, w1, e, p) structure b was drawn with, e clipped as in Graph.
+        '''
+        batch, b = self.batch, self.b
+        return int(batch.d[b]), int(batch.w0[b]), int(batch.w1[b]), int(batch.e[b]), float(batch.p[b])
+
+    @property
+    def G(self) -> List[np.ndarray]:
+        '''
+        the edge matrices as views into the batch, do not change them.
+        '''
+        l, G = self.l, self.batch.G[self.b]
+        return [G[i, :l[i], :l[i+1]] for i in range(self.d - 1)]
+
+    def edges(self) -> Tuple[List[Tuple[int, int, int]], List[Tuple[int, int, int]]]:
+        '''
+        the edges (i, j, k) in the order Graph.init draws them: the first parents of the nodes, then the other edges.
+        '''
+        batch, b, W = self.batch, self.b, self.batch.width
+        parents = batch.parents[b].tolist()
+        first = [(i, parents[i][k], k) for i in range(self.d - 1) for k in range(int(self.l[i+1]))]
+        other = [(c // (W * W), c // W % W, c % W) for c in batch.other[b, :batch.n_other[b]].tolist()]
+        return first, other
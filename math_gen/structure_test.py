@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from math_gen.graph_gen import Graph
+from math_gen.structure import StructureBatch
+from tools.rng import Rng
+
+def stats(structures) -> np.ndarray:
+    # per structure: the layer widths, then the edges between every pair of adjacent layers
+    return np.array([list(l) + [G.sum() for G in Gs] for l, Gs in structures], dtype=float)
+
+@pytest.mark.parametrize("d, w0, w1, e, p", [(2, 2, 4, 6, 0.5), (3, 2, 3, 9, 0.3), (4, 2, 4, 12, 0.7), (3, 3, 4, 30, 0.5)])
+def test_structure_batch_distribution(d, w0, w1, e, p):
+    # the batch follows the distribution of the looped Graph.init: mean widths and edges per layer pair agree
+    n = 3000
+    batch = StructureBatch(d, w0, w1, e, p, size=n, rng=Rng.from_seed(0))
+    graph = Graph(d, w0, w1, e, p, rng=Rng.from_seed(1))
+    looped = []
+    for _ in range(n):
+        graph.init()
+        looped.append((list(graph.l), [G.copy() for G in graph.G]))
+    drawn = stats((structure.l, structure.G) for structure in batch)
+    looped = stats(looped)
+    # every structure has all the e edges Graph keeps after clipping
+    assert (drawn[:, d:].sum(1) == graph.e).all() and (looped[:, d:].sum(1) == graph.e).all()
+    assert np.abs(drawn.mean(0) - looped.mean(0)).max() < 0.06
+    assert np.abs(drawn.std(0) - looped.std(0)).max() < 0.06
+
+def test_init_checks_structure():
+    batch = StructureBatch(3, 2, 3, 9, 0.3, size=2, rng=Rng.from_seed(0))
+    graph = Graph(3, 2, 3, 9, 0.3, rng=Rng.from_seed(0))
+    graph.init(structure=batch[1])
+    assert list(graph.l) == list(batch.l[1, :3])
+    with pytest.raises(ValueError):
+        Graph(3, 2, 3, 9, 0.5, rng=Rng.from_seed(0)).init(structure=batch[0])
+    with pytest.raises(ValueError):
+        Graph(3, 2, 4, 9, 0.3, rng=Rng.from_seed(0)).init(structure=batch[0])
@@ -0,0 +1,116 @@
+import os, json
+from typing import Any, Dict, List, Tuple
+from tools.checkpoint import open_output, sync_output
+from const.params import all_bin
+
+class Bucket(object):
+    '''
+    one target dataset: quota samples whose op is equal to (match="eq") or at most (match="le") op,
+    and whose solution template hash is in bins, written to output_file.
+    The samples are generated with IdGen(max_op=max_op), max_op defaults to op.
+    '''
+    def __init__(self, output_file: str, op: int, match: str, bins: List[int], quota: int, max_op: int=None):
+        if match not in ("eq", "le"):
+            raise ValueError(f"match should be 'eq' or 'le', but got {match}.")
+        self.output_file = output_file
+        self.op = op
+        self.match = match
+        self.bins = sorted(bins)
+        self.quota = quota
+        self.max_op = op if max_op is None else max_op
+        if self.op > self.max_op:
+            raise ValueError(f"op={op} can never be reached with max_op={max_op}.")
+
+    def config(self) -> Dict[str, Any]:
+        return {"output_file": os.path.abspath(self.output_file), "op": self.op, "match": self.match, "bins": self.bins,
+                "quota": self.quota, "max_op": self.max_op}
+
+    def accepts(self, op: int, hash_val: int) -> bool:
+        if self.match == "eq" and op != self.op:
+            return False
+        if self.match == "le" and op > self.op:
+            return False
+        return hash_val in self.bins
+
+def plan_streams(buckets: List[Bucket]) -> List[Tuple[int, int, List[int], List[int]]]:
+    '''
+    the generator streams needed to fill buckets, as (max_op, op, bins, bucket ids).
+
+    IdGen(max_op=M) with op=None serves every bucket of max_op M: a sample with op_=T follows the distribution of
+    IdGen(max_op=M, op=T), so it also fits the "eq" buckets. IdGen(max_op=M, op=T) only serves the "eq" buckets of T.
+    The op=None stream accepts all hash bins in gen_prob and the buckets drop the other bins afterwards, since gen_prob
+    retries the drawn op until the hash fits: a "le" bucket gets the op mix of IdGen(max_op=M) among the samples
+    in its bins, as the single bucket scripts (e.g. generate_parallel_op_le15.py). The op=T streams only accept
+    the bins of their buckets, the op is fixed there.
+    The bucket ids of a stream are in routing order: a sample goes to the first bucket which accepts it and is not full.
+    Broader buckets come first ("le" before "eq", larger op first), so a sample is only taken away from a bucket
+    by a bucket which accepts all its samples, and every bucket receives an unbiased subsequence of its stream.
+    This needs the bins of two buckets with the same max_op to be either equal or disjoint.
+    '''
+    for i, a in enumerate(buckets):
+        for b in buckets[i+1:]:
+            if a.max_op == b.max_op and a.bins != b.bins and set(a.bins) & set(b.bins):
+                raise ValueError(f"buckets {a.output_file} and {b.output_file} have overlapping but different bins.")
+
+    streams = []
+    for max_op in sorted(set(b.max_op for b in buckets)):
+        group = [i for i, b in enumerate(buckets) if b.max_op == max_op]
+        group.sort(key=lambda i: (buckets[i].match == "eq", -buckets[i].op))
+        if any(buckets[i].match == "le" for i in group):
+            streams.append((max_op, None, list(all_bin), group))
+        for op in sorted(set(buckets[i].op for i in group if buckets[i].match == "eq")):
+            eq_group = [i for i in group if buckets[i].match == "eq" and buckets[i].op == op]
+            streams.append((max_op, op, sorted(set(h for i in eq_group for h in buckets[i].bins)), eq_group))
+    return streams
+
+class BucketSink(object):
+    '''
+    the sink of run_streams for several buckets: every record of a stream goes to the first of its buckets
+    which accepts the "operations" and "solution_template_hash" of the record and is not full yet.
+    '''
+    def __init__(self, buckets: List[Bucket], stream_buckets: List[List[int]]):
+        self.buckets = buckets
+        self.stream_buckets = stream_buckets
+        self.counts = [0] * len(buckets)
+        self.written = 0
+        self.files = []
+
+    def config(self) -> Dict[str, Any]:
+        return {"buckets": [b.config() for b in self.buckets], "stream_buckets": self.stream_buckets}
+
+    def open(self, state: Dict[str, Any]=None):
+        if state is not None:
+            self.counts = list(state["counts"])
+            self.written = sum(self.counts)
+        self.files = [open_output(b.output_file, None if state is None else state["offsets"][i])
+                      for i, b in enumerate(self.buckets)]
+
+    def state(self) -> Dict[str, Any]:
+        return {"counts": self.counts, "offsets": [sync_output(f) for f in self.files]}
+
+    def bucket_full(self, i: int) -> bool:
+        return self.counts[i] >= self.buckets[i].quota
+
+    def full(self) -> bool:
+        return all(self.bucket_full(i) for i in range(len(self.buckets)))
+
+    def needs(self, stream_id: int) -> bool:
+        return not all(self.bucket_full(i) for i in self.stream_buckets[stream_id])
+
+    def write(self, stream_id: int, lines: List[str]):
+        for line in lines:
+            record = json.loads(line)
+            for i in self.stream_buckets[stream_id]:
+                if not self.bucket_full(i) and self.buckets[i].accepts(record["operations"], record["solution_template_hash"]):
+                    self.files[i].write(line)
+                    self.counts[i] += 1
+                    self.written += 1
+                    break
+
+    def flush(self):
+        for f in self.files:
+            f.flush()
+
+    def close(self):
+        for f in self.files:
+            f.close()
@@ -0,0 +1,54 @@
+import json
+import pytest
+from tools.buckets import Bucket, BucketSink, plan_streams
+from const.params import all_bin, data_train_bin, data_test_bin
+
+def record(op: int, hash_val: int) -> str:
+    return json.dumps({"operations": op, "solution_template_hash": hash_val}) + '\n'
+
+def read(path) -> list:
+    with open(path) as f:
+        return [(r["operations"], r["solution_template_hash"]) for r in map(json.loads, f)]
+
+def test_plan_streams():
+    buckets = [
+        Bucket("eval_e15.json", 15, "eq", data_test_bin, 1),
+        Bucket("train_le15.json", 15, "le", data_train_bin, 1),
+        Bucket("eval_le15.json", 15, "le", data_test_bin, 1),
+        Bucket("eval_e20.json", 20, "eq", data_test_bin, 1),
+    ]
+    # the op=None stream draws over all bins and routes to the "le" buckets before the "eq" ones
+    assert plan_streams(buckets) == [
+        (15, None, all_bin, [1, 2, 0]),
+        (15, 15, data_test_bin, [0]),
+        (20, 20, data_test_bin, [3]),
+    ]
+    with pytest.raises(ValueError):
+        plan_streams([Bucket("a.json", 15, "le", [1, 2], 1), Bucket("b.json", 15, "eq", [2, 3], 1)])
+
+def test_bucket_sink(tmp_path):
+    buckets = [
+        Bucket(str(tmp_path / "train_le15.json"), 15, "le", data_train_bin, 3),
+        Bucket(str(tmp_path / "eval_le15.json"), 15, "le", data_test_bin, 2),
+        Bucket(str(tmp_path / "eval_e15.json"), 15, "eq", data_test_bin, 2),
+        Bucket(str(tmp_path / "eval_e20.json"), 20, "eq", data_test_bin, 1),
+    ]
+    plan = plan_streams(buckets)
+    sink = BucketSink(buckets, [stream_buckets for _, _, _, stream_buckets in plan])
+    sink.open()
+    # op=None stream of max_op 15: 16 is a train bin, 17 a test bin, op 16 fits no bucket
+    sink.write(0, [record(3, 16), record(15, 17), record(16, 2), record(15, 22), record(15, 20), record(4, 0)])
+    # op=20 stream
+    sink.write(2, [record(20, 18), record(20, 19)])
+    assert not sink.full()
+    assert sink.needs(0) and sink.needs(1) and not sink.needs(2)
+    # op=15 stream
+    sink.write(1, [record(15, 21), record(15, 17)])
+    sink.write(0, [record(2, 5), record(7, 9)])
+    sink.close()
+    assert read(buckets[0].output_file) == [(3, 16), (4, 0), (2, 5)]
+    assert read(buckets[1].output_file) == [(15, 17), (15, 22)]
+    assert read(buckets[2].output_file) == [(15, 20), (15, 21)]
+    assert read(buckets[3].output_file) == [(20, 18)]
+    assert sink.counts == [3, 2, 2, 1] and sink.written == 8
+    assert sink.full()
@@ -0,0 +1,77 @@
+import os, json, random
+import numpy as np
+from typing import Any, Dict, Optional
+
+def manifest_path(output_file: str) -> str:
+    '''
+    the manifest lives next to the output file.
+    '''
+    return output_file + ".manifest.json"
+
+def save_manifest(path: str, manifest: Dict[str, Any]):
+    '''
+    write the manifest atomically: a preempted run leaves either the old or the new manifest, never a torn one.
+    '''
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_manifest(path: str, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    '''
+    return the manifest of an earlier run, or None if there is none.
+    the run must have been started with the same config, otherwise resuming would mix two different seed sequences.
+    '''
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    if manifest["config"] != config:
+        raise ValueError(f"{path} was written with config {manifest['config']}, not {config}")
+    return manifest
+
+def sync_output(f) -> int:
+    '''
+    make everything written to f durable and return its length.
+    '''
+    f.flush()
+    os.fsync(f.fileno())
+    return f.tell()
+
+def commit_output(f, manifest: Dict[str, Any], path: str):
+    '''
+    make everything written to f durable, then record its length in the manifest.
+    on resume, the output is truncated back to this length, which drops records that were written after the last commit.
+    '''
+    manifest["offset"] = sync_output(f)
+    save_manifest(path, manifest)
+
+def open_output(output_file: str, offset: Optional[int]=None):
+    '''
+    open the output file for writing: from scratch, or truncated to the committed length offset.
+    '''
+    if offset is None:
+        return open(output_file, 'w')
+    f = open(output_file, 'r+')
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+def get_rng_state() -> Dict[str, Any]:
+    '''
+    the state of the global random and np.random generators, as JSON.
+    '''
+    version, state, gauss = random.getstate()
+    np_state = np.random.get_state()
+    return {
+        "random": [version, list(state), gauss],
+        "numpy": [np_state[0], np_state[1].tolist(), int(np_state[2]), int(np_state[3]), float(np_state[4])],
+    }
+
+def set_rng_state(rng_state: Dict[str, Any]):
+    version, state, gauss = rng_state["random"]
+    random.setstate((version, tuple(state), gauss))
+    name, keys, pos, has_gauss, cached_gaussian = rng_state["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
@@ -0,0 +1,23 @@
+import pytest
+from tools.checkpoint import load_manifest, save_manifest, open_output, sync_output
+
+def test_load_manifest_config(tmp_path):
+    # a manifest only resumes the run with its own config
+    path = str(tmp_path / "out.jsonl.manifest.json")
+    assert load_manifest(path, {"seed": 1}) is None
+    save_manifest(path, {"config": {"seed": 1}, "offset": 3})
+    assert load_manifest(path, {"seed": 1})["offset"] == 3
+    with pytest.raises(ValueError):
+        load_manifest(path, {"seed": 2})
+
+def test_open_output(tmp_path):
+    # reopening at the committed offset drops what was written after it
+    path = str(tmp_path / "out.jsonl")
+    with open_output(path) as f:
+        f.write("a\n")
+        offset = sync_output(f)
+        f.write("b\n")
+    with open_output(path, offset) as f:
+        f.write("c\n")
+    with open(path) as f:
+        assert f.read() == "a\nc\n"
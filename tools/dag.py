@@ -0,0 +1,196 @@
+'''
+a small directed graph for the templates of math_gen, in place of networkx.DiGraph on the generation path.
+
+Nodes are hashable keys (the 4-tuple parameters, or (layer, index) in the structure graph) with integer ids
+in insertion order. Adjacency is kept as id lists in edge insertion order, plus one bitset of successors per node
+for edge tests and reachability. Node attributes are columns indexed by id, declared with their default
+on construction, e.g. DAG(type=None).
+
+Nodes, predecessors and successors come out in the same order as from networkx.DiGraph, so the random choices
+made over them do not change. to_networkx() exports the graph, e.g. for drawing.
+'''
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
+
+class DAG(object):
+    def __init__(self, **attrs):
+        self.attrs = attrs # attribute name -> default value
+        self.columns: Dict[str, List[Any]] = {name: [] for name in attrs}
+        self.keys: List[Hashable] = [] # id -> key
+        self.ids: Dict[Hashable, int] = {} # key -> id
+        self.pred: List[List[int]] = [] # id -> predecessor ids, in edge insertion order
+        self.succ: List[List[int]] = [] # id -> successor ids, in edge insertion order
+        self.succ_bits: List[int] = [] # id -> bitset of successor ids
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.keys)
+
+    def add_node(self, key, **attrs) -> int:
+        '''
+        add key if it is new, set the given attributes, and return its id.
+        '''
+        i = self.ids.get(key)
+        if i is None:
+            i = len(self.keys)
+            self.ids[key] = i
+            self.keys.append(key)
+            self.pred.append([])
+            self.succ.append([])
+            self.succ_bits.append(0)
+            for name, default in self.attrs.items():
+                self.columns[name].append(default)
+        for name, value in attrs.items():
+            self.columns[name][i] = value
+        return i
+
+    def add_edge(self, u, v):
+        '''
+        add the edge u -> v and the nodes which are new. Adding an existing edge does nothing.
+        '''
+        i = self.ids.get(u)
+        if i is None:
+            i = self.add_node(u)
+        j = self.ids.get(v)
+        if j is None:
+            j = self.add_node(v)
+        if not self.succ_bits[i] >> j & 1:
+            self.succ_bits[i] |= 1 << j
+            self.succ[i].append(j)
+            self.pred[j].append(i)
+
+    def has_node(self, key) -> bool:
+        return key in self.ids
+
+    def has_edge(self, u, v) -> bool:
+        i = self.ids.get(u)
+        j = self.ids.get(v)
+        return i is not None and j is not None and bool(self.succ_bits[i] >> j & 1)
+
+    def get(self, key, name: str):
+        return self.columns[name][self.ids[key]]
+
+    def set(self, key, name: str, value):
+        self.columns[name][self.ids[key]] = value
+
+    def nodes(self) -> List[Hashable]:
+        return list(self.keys)
+
+    def edges(self) -> List[Tuple[Hashable, Hashable]]:
+        keys = self.keys
+        return [(keys[i], keys[j]) for i in range(len(keys)) for j in self.succ[i]]
+
+    def predecessors(self, key) -> List[Hashable]:
+        keys = self.keys
+        return [keys[i] for i in self.pred[self.ids[key]]]
+
+    def successors(self, key) -> List[Hashable]:
+        keys = self.keys
+        return [keys[j] for j in self.succ[self.ids[key]]]
+
+    def in_degree(self, key) -> int:
+        return len(self.pred[self.ids[key]])
+
+    def out_degree(self, key) -> int:
+        return len(self.succ[self.ids[key]])
+
+    def in_degrees(self) -> Dict[Hashable, int]:
+        '''
+        key -> in-degree of every node, in node order (as dict(G.in_degree()) in networkx).
+        '''
+        return {key: len(pred) for key, pred in zip(self.keys, self.pred)}
+
+    def out_degrees(self) -> Dict[Hashable, int]:
+        return {key: len(succ) for key, succ in zip(self.keys, self.succ)}
+
+    def copy(self) -> "DAG":
+        dag = DAG.__new__(DAG)
+        dag.attrs = self.attrs
+        dag.columns = {name: list(column) for name, column in self.columns.items()}
+        dag.keys = list(self.keys)
+        dag.ids = dict(self.ids)
+        dag.pred = [list(pred) for pred in self.pred]
+        dag.succ = [list(succ) for succ in self.succ]
+        dag.succ_bits = list(self.succ_bits)
+        return dag
+
+    def subgraph(self, keys: List[Hashable]) -> "DAG":
+        '''
+        the subgraph induced by keys, with the nodes in the order of keys.
+        predecessors and successors keep their order in self.
+        '''
+        ids = [self.ids[key] for key in keys]
+        new_id = {i: n for n, i in enumerate(ids)}
+        dag = DAG(**self.attrs)
+        dag.keys = list(keys)
+        dag.ids = {key: n for n, key in enumerate(keys)}
+        dag.columns = {name: [column[i] for i in ids] for name, column in self.columns.items()}
+        dag.pred = [[new_id[p] for p in self.pred[i] if p in new_id] for i in ids]
+        dag.succ = [[new_id[s] for s in self.succ[i] if s in new_id] for i in ids]
+        dag.succ_bits = [sum(1 << s for s in succ) for succ in dag.succ]
+        return dag
+
+    def topological_ids(self) -> List[int]:
+        '''
+        the ids in a topological order (Kahn's algorithm). On a cycle, the nodes on or after it are missing.
+        '''
+        in_degree = [len(pred) for pred in self.pred]
+        order = [i for i, d in enumerate(in_degree) if d == 0]
+        for i in order:
+            for j in self.succ[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    order.append(j)
+        return order
+
+    def is_acyclic(self) -> bool:
+        return len(self.topological_ids()) == len(self.keys)
+
+    def ancestors(self, key) -> List[Hashable]:
+        '''
+        key and every node with a path to it, in the breadth-first order of
+        networkx.single_source_shortest_path(G.reverse(), key), which visits the predecessors in node order.
+        '''
+        start = self.ids[key]
+        seen = {start}
+        order = [start]
+        for i in order:
+            for p in sorted(self.pred[i]):
+                if p not in seen:
+                    seen.add(p)
+                    order.append(p)
+        return [self.keys[i] for i in order]
+
+    def closure_edges(self) -> List[Tuple[Hashable, Hashable]]:
+        '''
+        the edges (u, v) of the transitive closure: v is reachable from u by a path of length >= 1.
+        '''
+        reach = [0] * len(self.keys)
+        for i in reversed(self.topological_ids()):
+            bits = self.succ_bits[i]
+            for j in self.succ[i]:
+                bits |= reach[j]
+            reach[i] = bits
+        keys = self.keys
+        edges = []
+        for i, bits in enumerate(reach):
+            while bits:
+                low = bits & -bits
+                edges.append((keys[i], keys[low.bit_length() - 1]))
+                bits ^= low
+        return edges
+
+    def to_networkx(self):
+        '''
+        a networkx.DiGraph with the same nodes (in the same order), attributes and edges.
+        '''
+        import networkx as nx
+        graph = nx.DiGraph()
+        for i, key in enumerate(self.keys):
+            graph.add_node(key, **{name: column[i] for name, column in self.columns.items()})
+        graph.add_edges_from(self.edges())
+        return graph
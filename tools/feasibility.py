@@ -0,0 +1,111 @@
+'''
+a feasibility oracle for IdGen_PT.gen_prob: drop the attempts which cannot end with a problem of op_ operations
+before their graph is built.
+
+An attempt draws the tuple (d, w0, w1, e, n, m, s) and is accepted only if Problem.gen finds a template and
+design settles on n_op == op_. Two rules reject a tuple up front:
+
+- provable (n_op_bound): n_op <= s, n_op_min <= min(m, e * (2d - 1)) (Graph.total <= e * (2d - 2), plus at most
+  e fixed parameters), and design adds at most 2 operations per instance parameter, i.e. per edge (max_param=4).
+  A tuple with op_ above the bound is never accepted, so dropping it does not change the accepted problems.
+- empirical: Problem.gen spends all try_num attempts of reasonable_sort on some graphs, e.g. a full graph
+  with n >= Graph.total. Every call of Problem.gen is tallied by its graph key (d, w0, w1, e, n, m); keys which failed
+  min_fails times and never succeeded are dropped. This is a bet on the observed rate, so it is opt-in.
+
+A persistent cache of the tallies is shared across runs:
+
+    oracle = FeasibilityOracle(load_doomed(path, skip_doomed=True)) # doomed_keys(load_cache(path), min_fails=3)
+    ... IdGen(..., oracle=oracle) in the workers ...
+    update_cache(path, stats["instrument"])
+
+The oracle is frozen for a run: what the workers observe only goes into the cache afterwards, so the output
+does not depend on the order in which workers finish. Pass the doomed keys with the sample args, so they are
+part of the config of run_streams and a resumed run uses the same ones.
+'''
+import os, json
+from typing import Any, Dict, Iterable, List, Optional
+from tools import instrument
+from tools.checkpoint import save_manifest
+
+def clip_e(d: int, w0: int, w1: int, e: int) -> int:
+    '''
+    the number of edges Graph actually uses for e.
+    '''
+    return min(max(e, (d-1) * w0), (d-1) * w1 ** 2)
+
+def graph_key(d: int, w0: int, w1: int, e: int, n: int, m: int) -> str:
+    return f"{d},{w0},{w1},{clip_e(d, w0, w1, e)},{n},{m}"
+
+def n_op_bound(d: int, w0: int, w1: int, e: int, m: int, s: int) -> int:
+    '''
+    an upper bound of the number of operations of a problem generated from the tuple with max_param=4.
+    '''
+    e = clip_e(d, w0, w1, e)
+    return min(s, min(m, e * (2*d - 1)) + 2 * e)
+
+class FeasibilityOracle(object):
+    def __init__(self, doomed: Iterable[str]=()):
+        '''
+        doomed: the graph keys to drop, see doomed_keys.
+        '''
+        self.doomed = set(doomed)
+
+    def skip(self, d: int, w0: int, w1: int, e: int, n: int, m: int, s: int, op: int) -> bool:
+        '''
+        whether the attempt with this tuple should be dropped before building its graph. Counts the saved attempts.
+        '''
+        if op > n_op_bound(d, w0, w1, e, m, s):
+            instrument.count("oracle.skip.bound")
+            return True
+        if self.doomed and graph_key(d, w0, w1, e, n, m) in self.doomed:
+            instrument.count("oracle.skip.cache")
+            return True
+        return False
+
+    def record(self, d: int, w0: int, w1: int, e: int, n: int, m: int, feasible: bool):
+        '''
+        tally a call of Problem.gen; feasible is whether it sorted a template.
+        '''
+        key = graph_key(d, w0, w1, e, n, m)
+        instrument.tally("feasibility.calls", key)
+        if feasible:
+            instrument.tally("feasibility.feasible", key)
+
+def load_cache(path: str) -> Dict[str, List[int]]:
+    '''
+    graph key -> [calls, feasible calls] of Problem.gen over the earlier runs, empty if there is no cache.
+    '''
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def update_cache(path: str, snap: Dict[str, Any]) -> Dict[str, List[int]]:
+    '''
+    add the tallies of an instrument snapshot (or the merged one of run_streams) to the cache at path.
+    '''
+    cache = load_cache(path)
+    tallies = snap.get("tallies", {})
+    feasible = tallies.get("feasibility.feasible", {})
+    for key, n in tallies.get("feasibility.calls", {}).items():
+        total = cache.setdefault(key, [0, 0])
+        total[0] += n
+        total[1] += feasible.get(key, 0)
+    save_manifest(path, cache)
+    return cache
+
+def doomed_keys(cache: Dict[str, List[int]], min_fails: Optional[int]=3) -> List[str]:
+    '''
+    the keys of the cache which failed at least min_fails times and never succeeded. None turns the rule off.
+    '''
+    if min_fails is None:
+        return []
+    return sorted(key for key, (calls, feasible) in cache.items() if feasible == 0 and calls >= min_fails)
+
+def load_doomed(path: str, skip_doomed: bool=False) -> List[str]:
+    '''
+    the doomed keys of the cache at path for the oracle of a run, none unless skip_doomed (--skip-doomed) opts in.
+    '''
+    if not skip_doomed:
+        return []
+    return doomed_keys(load_cache(path))
@@ -0,0 +1,83 @@
+import time
+import pytest
+from math_gen.problem_gen import Problem
+from data_gen.prototype.id_gen import IdGen_PT, GaveUp
+from const.params import dot
+from tools import instrument
+from tools.feasibility import FeasibilityOracle, n_op_bound, update_cache, load_cache, doomed_keys, load_doomed
+from tools.rng import Rng
+
+# the args gen_prob uses with perm_level=5, detail_level=0
+ARGS = {"rand_perm": "hard", "define_var": True, "define_detail": True, "inter_var": True, "name_omit": False,
+        "cal_omit": False, "dot": dot, "symbol_method": "rand", "sol_sort": False, "perm": True}
+
+def attempts(n_seed: int):
+    '''
+    the attempts of gen_prob without an oracle, feasible or not: (drawn tuple, problem, feasible).
+    '''
+    for seed in range(n_seed):
+        style = ("light", "uniform")[seed % 2]
+        max_op = (8, 15, 23)[seed % 3]
+        id_gen = IdGen_PT(style, style, max_op=max_op, max_edge=max_op + 5, perm_level=5, detail_level=0, rng=Rng.from_seed(seed))
+        id_gen.gen_param()
+        problem = Problem(id_gen.d, id_gen.w0, id_gen.w1, id_gen.e, id_gen.p, args=ARGS, rng=id_gen.rng)
+        feasible = problem.gen(id_gen.n, id_gen.m, id_gen.s)
+        yield (id_gen.d, id_gen.w0, id_gen.w1, id_gen.e, id_gen.n, id_gen.m, id_gen.s), problem, feasible
+
+def test_n_op_bound():
+    # the provable rule: no generated problem has more operations than the bound of its tuple
+    n_feasible = 0
+    for (d, w0, w1, e, n, m, s), problem, feasible in attempts(300):
+        if feasible:
+            assert problem.n_op <= n_op_bound(d, w0, w1, e, m, s)
+            assert not FeasibilityOracle().skip(d, w0, w1, e, n, m, s, problem.n_op)
+            n_feasible += 1
+    assert n_feasible >= 200
+
+def test_skip_never_drops_feasible(tmp_path):
+    # keys tallied from the attempts never doom a shape which was feasible in them, even with min_fails=1
+    instrument.reset()
+    recorder = FeasibilityOracle()
+    done = []
+    for (d, w0, w1, e, n, m, s), problem, feasible in attempts(300):
+        recorder.record(d, w0, w1, e, n, m, feasible)
+        done.append(((d, w0, w1, e, n, m, s), problem.n_op if feasible else None))
+    # a full graph asking for more internal operations than it has: never sorts a template
+    full = (3, 2, 2, 8, 20, 20, 20)
+    for seed in range(2):
+        assert not Problem(*full[:4], 0.5, args=ARGS, rng=Rng.from_seed(seed)).gen(*full[4:])
+        recorder.record(*full[:6], False)
+    cache = update_cache(str(tmp_path / "feasibility_cache.json"), instrument.snapshot())
+    oracle = FeasibilityOracle(doomed_keys(cache, min_fails=1))
+    assert oracle.skip(*full, 1)
+    for shape, n_op in done:
+        if n_op is not None:
+            assert not oracle.skip(*shape, n_op)
+
+def test_doomed_opt_in(tmp_path):
+    # the empirical rule only supplies keys with --skip-doomed
+    path = str(tmp_path / "feasibility_cache.json")
+    update_cache(path, {"tallies": {"feasibility.calls": {"2,2,2,1,1,1": 5, "3,2,2,2,1,1": 5},
+                                    "feasibility.feasible": {"3,2,2,2,1,1": 1}}})
+    assert load_cache(path) == {"2,2,2,1,1,1": [5, 0], "3,2,2,2,1,1": [5, 1]}
+    assert load_doomed(path) == []
+    assert load_doomed(path, skip_doomed=True) == ["2,2,2,1,1,1"]
+    assert doomed_keys(load_cache(path), min_fails=None) == []
+    assert load_doomed(str(tmp_path / "missing.json"), skip_doomed=True) == []
+
+def test_record_skips_cut_attempts(monkeypatch):
+    # an attempt cut short by the time budget is not tallied as an infeasible shape
+    now = [0.]
+    monkeypatch.setattr(time, "perf_counter", lambda: now[0])
+    gen = Problem.gen
+    def late_gen(self, *args, **kwargs):
+        now[0] = 100. # the deadline passes before the first try
+        return gen(self, *args, **kwargs)
+    monkeypatch.setattr(Problem, "gen", late_gen)
+    instrument.reset()
+    id_gen = IdGen_PT("light", "light", max_op=15, max_edge=20, op=1, perm_level=5, detail_level=0,
+                      oracle=FeasibilityOracle(), rng=Rng.from_seed(0))
+    with pytest.raises(GaveUp) as info:
+        id_gen.gen_prob([0], p_format="pq", time_budget=5.)
+    assert info.value.reason == "time" and info.value.attempts == 1
+    assert "feasibility.calls" not in instrument.snapshot()["tallies"]
@@ -0,0 +1,142 @@
+'''
+process-wide counters and stage timers of the generation pipeline.
+
+    from tools.instrument import count, timer
+    with timer("design"):
+        ...
+    count("reject.hash")
+    tally("feasibility.calls", key) # a counter per key, for tables that are read back rather than printed
+    observe("gen_prob.latency.op15", seconds) # a histogram, reported as p50 / p99 / max
+
+Every process keeps its own totals; workers send snapshot() back at exit and run_streams merges them.
+Set instrument.enabled = False to turn the bookkeeping off.
+'''
+import json, time, math
+from typing import Any, Dict, List
+
+enabled = True
+counters: Dict[str, int] = {}
+timers: Dict[str, List[float]] = {} # name -> [calls, seconds]
+tallies: Dict[str, Dict[str, int]] = {} # name -> key -> count
+histograms: Dict[str, List[Any]] = {} # name -> [count, sum, max, {bucket: count}]
+
+BUCKETS_PER_OCTAVE = 8 # bucket b of a histogram holds the values in (2 ** ((b-1) / 8), 2 ** (b / 8)]
+
+def count(name: str, n: int=1):
+    if enabled:
+        counters[name] = counters.get(name, 0) + n
+
+def tally(name: str, key: str, n: int=1):
+    if enabled:
+        t = tallies.get(name)
+        if t is None:
+            t = tallies[name] = {}
+        t[key] = t.get(key, 0) + n
+
+def observe(name: str, value: float):
+    if enabled:
+        h = histograms.get(name)
+        if h is None:
+            h = histograms[name] = [0, 0., 0., {}]
+        h[0] += 1
+        h[1] += value
+        h[2] = max(h[2], value)
+        b = math.ceil(math.log2(max(value, 1e-9)) * BUCKETS_PER_OCTAVE)
+        h[3][b] = h[3].get(b, 0) + 1
+
+def quantile(hist: Dict[str, Any], q: float) -> float:
+    '''
+    the q quantile of a histogram of snapshot(), up to the bucket width (9%). It never exceeds the max.
+    '''
+    rank = q * hist["count"]
+    seen = 0
+    for b, n in sorted((int(b), n) for b, n in hist["buckets"].items()):
+        seen += n
+        if seen >= rank:
+            return min(2 ** (b / BUCKETS_PER_OCTAVE), hist["max"])
+    return hist["max"]
+
+def summarize(hist: Dict[str, Any]) -> Dict[str, Any]:
+    hist["p50"] = quantile(hist, 0.5)
+    hist["p99"] = quantile(hist, 0.99)
+    return hist
+
+class timer(object):
+    '''
+    add the wall time of a with block to the timer name, also when the block raises.
+    '''
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if enabled:
+            elapsed = time.perf_counter() - self.start
+            t = timers.get(self.name)
+            if t is None:
+                timers[self.name] = [1, elapsed]
+            else:
+                t[0] += 1
+                t[1] += elapsed
+        return False
+
+def snapshot() -> Dict[str, Any]:
+    return {
+        "counters": dict(counters),
+        "timers": {name: {"calls": int(calls), "seconds": seconds} for name, (calls, seconds) in timers.items()},
+        "tallies": {name: dict(t) for name, t in tallies.items()},
+        "histograms": {name: summarize({"count": n, "sum": total, "max": top, "buckets": {str(b): c for b, c in buckets.items()}})
+                       for name, (n, total, top, buckets) in histograms.items()},
+    }
+
+def reset():
+    counters.clear()
+    timers.clear()
+    tallies.clear()
+    histograms.clear()
+
+def merge(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    sum the snapshots of several processes.
+    '''
+    merged = {"counters": {}, "timers": {}, "tallies": {}, "histograms": {}}
+    for snap in snapshots:
+        for name, n in snap["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + n
+        for name, t in snap["timers"].items():
+            total = merged["timers"].setdefault(name, {"calls": 0, "seconds": 0.})
+            total["calls"] += t["calls"]
+            total["seconds"] += t["seconds"]
+        for name, t in snap.get("tallies", {}).items():
+            total = merged["tallies"].setdefault(name, {})
+            for key, n in t.items():
+                total[key] = total.get(key, 0) + n
+        for name, hist in snap.get("histograms", {}).items():
+            total = merged["histograms"].setdefault(name, {"count": 0, "sum": 0., "max": 0., "buckets": {}})
+            total["count"] += hist["count"]
+            total["sum"] += hist["sum"]
+            total["max"] = max(total["max"], hist["max"])
+            for b, n in hist["buckets"].items():
+                total["buckets"][b] = total["buckets"].get(b, 0) + n
+    for hist in merged["histograms"].values():
+        summarize(hist)
+    return merged
+
+def print_snapshot(snap: Dict[str, Any]):
+    for name, t in sorted(snap["timers"].items(), key=lambda item: -item[1]["seconds"]):
+        print(f"  {name:<20} {t['seconds']:10.2f}s  {t['calls']:>9} calls  {t['seconds'] / max(t['calls'], 1) * 1000:8.3f} ms/call")
+    for name, n in sorted(snap["counters"].items()):
+        print(f"  {name:<20} {n:>10}")
+    for name, t in sorted(snap.get("tallies", {}).items()):
+        print(f"  {name:<20} {sum(t.values()):>10}  over {len(t)} keys")
+    for name, hist in sorted(snap.get("histograms", {}).items()):
+        print(f"  {name:<28} n={hist['count']:<8} mean={hist['sum'] / max(hist['count'], 1):<10.4g} p50={hist['p50']:<10.4g} p99={hist['p99']:<10.4g} max={hist['max']:.4g}")
+
+def write_summary(path: str, summary: Dict[str, Any]):
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
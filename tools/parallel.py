@@ -0,0 +1,315 @@
+import os, time, queue, json, hashlib
+import multiprocessing as mp
+from typing import Any, Callable, Dict, List, Tuple
+from tools.checkpoint import manifest_path, load_manifest, save_manifest, open_output, sync_output
+from tools import instrument
+
+SEEDING = "blake2b-64" # the scheme of sample_seed, part of the config of a run
+
+def sample_seed(base_seed: int, index: int) -> int:
+    '''
+    the seed of attempt index of the stream base_seed: a 64-bit hash of the pair, so every attempt has a seed of its own,
+    whatever the worker count, and streams with different base seeds never share a seed range.
+    '''
+    digest = hashlib.blake2b(f"{base_seed}:{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+def block_seeds(block_id: int, block_size: int, base_seed: int) -> List[int]:
+    '''
+    the seeds of a block. Block b owns the attempts [b * block_size, (b+1) * block_size).
+    '''
+    start = block_id * block_size
+    return [sample_seed(base_seed, i) for i in range(start, start + block_size)]
+
+def stream_block(block_id: int, n_stream: int) -> Tuple[int, int]:
+    '''
+    the global blocks interleave the streams round robin: block b is block b // n_stream of stream b % n_stream.
+    '''
+    return block_id % n_stream, block_id // n_stream
+
+def worker_loop(worker_id: int, streams: List[Tuple[Callable, tuple, int]], block_size: int,
+                task_queue: mp.Queue, result_queue: mp.Queue, stop_event, set_affinity: bool=True):
+    '''
+    pull block ids from task_queue until a None arrives.
+    streams is a list of (sample_fn, sample_args, base_seed). Every seed of a block is passed to
+    sample_fn(*sample_args, seed) of its stream, which returns a record or None.
+    the accepted records of a block are serialized here and sent back in one batch as
+    (worker_id, block_id, lines) with lines in seed order.
+    a block that is interrupted by stop_event is sent back with lines=None.
+    result_queue is bounded, so a worker waits when the writer falls behind.
+    at exit, the worker sends its busy/idle times and its instrument counters and timers.
+    '''
+    if set_affinity:
+        try:
+            import psutil
+            psutil.Process().cpu_affinity([worker_id % os.cpu_count()])
+        except Exception as e:
+            print(f"Failed to set CPU affinity for worker {worker_id}: {e}")
+
+    busy = 0.
+    idle = 0.
+    n_block = 0
+    while True:
+        t0 = time.time()
+        block_id = task_queue.get()
+        t1 = time.time()
+        idle += t1 - t0
+        if block_id is None:
+            break
+        stream_id, local_block = stream_block(block_id, len(streams))
+        sample_fn, sample_args, base_seed = streams[stream_id]
+        lines = []
+        for seed in block_seeds(local_block, block_size, base_seed):
+            if stop_event.is_set():
+                lines = None
+                break
+            record = sample_fn(*sample_args, seed)
+            if record is not None:
+                lines.append(json.dumps(record) + '\n')
+        t2 = time.time()
+        busy += t2 - t1
+        n_block += 1
+        result_queue.put((worker_id, block_id, lines))
+        idle += time.time() - t2
+    result_queue.put((worker_id, None, {"busy": busy, "idle": idle, "blocks": n_block, "instrument": instrument.snapshot()}))
+
+class FileSink(object):
+    '''
+    the output of a single stream: the first total_samples records in seed order go to output_file.
+
+    A sink receives the records of every block in global block order, decides where they are written
+    and tells run_streams which streams it still needs. state() commits the output and returns what
+    open(state) needs to restore it on resume.
+    '''
+    def __init__(self, output_file: str, total_samples: int):
+        self.output_file = output_file
+        self.total_samples = total_samples
+        self.written = 0
+        self.f = None
+
+    def config(self) -> Dict[str, Any]:
+        # absolute, so the manifest names the file it describes whatever the working directory was
+        return {"output_file": os.path.abspath(self.output_file), "total_samples": self.total_samples}
+
+    def open(self, state: Dict[str, Any]=None):
+        self.f = open_output(self.output_file, None if state is None else state["offset"])
+        if state is not None:
+            self.written = state["written"]
+
+    def state(self) -> Dict[str, Any]:
+        return {"written": self.written, "offset": sync_output(self.f)}
+
+    def full(self) -> bool:
+        return self.written >= self.total_samples
+
+    def needs(self, stream_id: int) -> bool:
+        return not self.full()
+
+    def write(self, stream_id: int, lines: List[str]):
+        lines = lines[:self.total_samples - self.written]
+        self.f.write("".join(lines))
+        self.written += len(lines)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def run_streams(streams: List[Tuple[Callable, tuple, int]], sink, num_workers: int, manifest_file: str,
+                block_size: int=8, prefetch: int=2, max_pending_blocks: int=None, set_affinity: bool=True,
+                progress=None, resume: bool=False, checkpoint_interval: float=30., summary_file: str=None) -> Dict[str, Any]:
+    '''
+    generate records from one or more seed streams with a pool of workers pulling small seed blocks
+    from a shared queue, until sink is full.
+
+    streams is a list of (sample_fn, sample_args, base_seed); sample_fn must be a top-level function
+    returning a record or None. Stream i runs through the seeds sample_seed(base_seed, 0), sample_seed(base_seed, 1), ...
+    in blocks of block_size, and the streams are interleaved round robin into one sequence of global blocks (see stream_block).
+    Blocks are handed out in increasing order, and this process is the single writer: it passes the records
+    of every finished block to sink in global block order as soon as all earlier blocks are written.
+    The output only depends on the streams and the sink, no matter how many workers there are
+    or which worker finishes first. As soon as the sink is full, the remaining blocks are cancelled.
+    Blocks of a stream which the sink does not need any more are skipped without being generated;
+    a sink only fills up, so it would have dropped their records anyway.
+
+    Memory is bounded: the result queue holds at most num_workers * prefetch batches, and no block is handed out
+    more than max_pending_blocks blocks ahead of the first unwritten one (default: num_workers * 4).
+    A killed run leaves a valid prefix of the output. If this loop fails, e.g. when a worker dies,
+    the workers are stopped or terminated before the error is raised.
+
+    Every checkpoint_interval seconds the state of the sink and the next block to write are committed
+    to manifest_file. With resume=True, a run continues from the manifest of an earlier run with the same
+    config: the output is truncated to the committed state and generation restarts at the next block, so the
+    final output is byte-identical to an uninterrupted run.
+
+    return the stats: attempts, busy, idle and straggler times of the workers, and the instrument counters and
+    timers of all workers (including the work on blocks which were cancelled or not needed).
+    With summary_file, the stats are also written there as JSON.
+    '''
+    if max_pending_blocks is None:
+        max_pending_blocks = num_workers * 4
+    max_pending_blocks = max(max_pending_blocks, num_workers * prefetch)
+
+    # everything that decides the seed sequence and the output
+    config = json.loads(json.dumps({
+        "streams": [(f"{fn.__module__}.{fn.__qualname__}", args, base_seed) for fn, args, base_seed in streams],
+        "block_size": block_size,
+        "seeding": SEEDING,
+        "sink": sink.config(),
+    }))
+    manifest = load_manifest(manifest_file, config) if resume else None
+    sink.open(None if manifest is None else manifest["sink"])
+    if manifest is None:
+        manifest = {"config": config, "cursor": 0, "attempts": 0}
+    cursor = manifest["cursor"] # the first block which is not written yet
+    attempts = manifest["attempts"]
+    if progress is not None:
+        progress.update(sink.written)
+
+    ctx = mp.get_context()
+    task_queue = ctx.Queue()
+    result_queue = ctx.Queue(maxsize=num_workers * prefetch)
+    stop_event = ctx.Event()
+
+    start_time = time.time()
+    processes = []
+    for worker_id in range(num_workers):
+        p = ctx.Process(
+            target=worker_loop,
+            args=(worker_id, streams, block_size, task_queue, result_queue, stop_event, set_affinity)
+        )
+        p.start()
+        processes.append(p)
+
+    pending: Dict[int, List[str]] = {} # finished blocks after the cursor, None if skipped
+    start_block = cursor
+    next_block = cursor
+    owed = num_workers * prefetch # blocks to hand out as soon as the window allows
+    n_skipped = 0
+    last_checkpoint = time.time()
+    worker_stats: Dict[int, Dict[str, float]] = {}
+    stop_time = None
+    max_pending = 0
+
+    def stop():
+        nonlocal stop_time
+        stop_time = time.time()
+        stop_event.set()
+        pending.clear()
+        for _ in range(num_workers):
+            task_queue.put(None)
+
+    def merge():
+        # pass the finished prefix to the sink
+        nonlocal cursor, attempts, last_checkpoint
+        n_before = sink.written
+        while cursor in pending and not sink.full():
+            lines = pending.pop(cursor)
+            if lines is not None:
+                sink.write(stream_block(cursor, len(streams))[0], lines)
+                attempts += block_size
+            cursor += 1
+        sink.flush()
+        if progress is not None:
+            progress.update(sink.written - n_before)
+        if sink.full() or time.time() - last_checkpoint >= checkpoint_interval:
+            manifest.update(cursor=cursor, attempts=attempts, sink=sink.state())
+            save_manifest(manifest_file, manifest)
+            last_checkpoint = time.time()
+        if sink.full():
+            stop()
+
+    if sink.full():
+        # nothing left to do
+        stop()
+
+    try:
+        while len(worker_stats) < num_workers:
+            while owed > 0 and stop_time is None and next_block < cursor + max_pending_blocks:
+                if sink.needs(stream_block(next_block, len(streams))[0]):
+                    task_queue.put(next_block)
+                    owed -= 1
+                else:
+                    pending[next_block] = None
+                    n_skipped += 1
+                next_block += 1
+            if stop_time is None and cursor in pending:
+                # skipped blocks at the cursor
+                merge()
+                continue
+
+            try:
+                worker_id, block_id, lines = result_queue.get(timeout=10)
+            except queue.Empty:
+                dead = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+                if dead:
+                    raise RuntimeError(f"{len(dead)} worker(s) exited with codes {dead}")
+                continue
+
+            if block_id is None:
+                worker_stats[worker_id] = lines
+                continue
+            if stop_time is not None or lines is None:
+                # cancelled, or finished after the sink is full
+                continue
+
+            owed += 1
+            pending[block_id] = lines
+            max_pending = max(max_pending, len(pending))
+            merge()
+    finally:
+        sink.close()
+        if len(worker_stats) < num_workers:
+            # left by an error: stop the workers, and kill the ones stuck in a sample or on the full result queue
+            stop_event.set()
+            for _ in range(num_workers):
+                task_queue.put(None)
+            for p in processes:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.terminate()
+                    p.join()
+            task_queue.cancel_join_thread()
+
+    for p in processes:
+        p.join()
+    end_time = time.time()
+
+    busy = [s["busy"] for s in worker_stats.values()]
+    idle = [s["idle"] for s in worker_stats.values()]
+    stats = {
+        "attempts": attempts,
+        "written": sink.written,
+        "blocks": cursor - start_block,
+        "blocks_handed_out": next_block - start_block - n_skipped,
+        "blocks_skipped": n_skipped,
+        "max_pending_blocks": max_pending,
+        "wall_time": end_time - start_time,
+        "straggler_time": end_time - stop_time if stop_time is not None else 0.,
+        "busy_time": sum(busy),
+        "idle_time": sum(idle),
+        "max_idle_time": max(idle) if idle else 0.,
+        "instrument": instrument.merge([s["instrument"] for s in worker_stats.values()]),
+    }
+    if summary_file is not None:
+        instrument.write_summary(summary_file, stats)
+    return stats
+
+def run_blocks(sample_fn: Callable, sample_args: tuple, total_samples: int, num_workers: int, output_file: str,
+               base_seed: int=0, **kwargs) -> Dict[str, Any]:
+    '''
+    write the first total_samples records of the seed stream base_seed (see sample_seed) as JSON lines to output_file.
+    the manifest for resuming and the JSON summary live next to output_file. See run_streams for the other arguments.
+    '''
+    return run_streams([(sample_fn, sample_args, base_seed)], FileSink(output_file, total_samples), num_workers,
+                       manifest_path(output_file), summary_file=output_file + ".summary.json", **kwargs)
+
+def print_stats(stats: Dict[str, Any]):
+    print(f"Attempts (seeds) merged: {stats['attempts']} in {stats['blocks']} blocks ({stats['blocks_handed_out']} handed out, {stats['blocks_skipped']} skipped)")
+    print(f"Samples written: {stats['written']}, acceptance rate: {stats['written'] / max(stats['attempts'], 1) * 100:.2f}%")
+    print(f"Most finished blocks waiting for an earlier block: {stats['max_pending_blocks']}")
+    print(f"Worker busy time: {stats['busy_time']/60:.2f} minutes, idle time: {stats['idle_time']/60:.2f} minutes (max {stats['max_idle_time']:.1f}s per worker)")
+    print(f"Straggler time after the target was met: {stats['straggler_time']:.1f}s")
+    print("Stages and rejections over all workers:")
+    instrument.print_snapshot(stats["instrument"])
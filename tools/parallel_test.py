@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import multiprocessing as mp
+import pytest
+from tools.parallel import run_blocks, sample_seed
+from tools.checkpoint import manifest_path
+
+crash_seed = None # the workers inherit it from the test which sets it
+
+def sample(keep: int, seed: int):
+    # a record for about keep out of 8 seeds, finishing in a seed dependent order
+    time.sleep((seed % 5) * 0.002)
+    if seed % 8 >= keep:
+        return None
+    return {"seed": seed, "value": seed % 1000}
+
+def crashing_sample(keep: int, seed: int):
+    if seed == crash_seed:
+        os._exit(1)
+    return sample(keep, seed)
+
+def raising_sample(bad_seed: int, seed: int):
+    if seed == bad_seed:
+        raise ValueError(f"bad seed {seed}")
+    time.sleep(0.01)
+    return {"seed": seed}
+
+def generate(path: str, num_workers: int) -> bytes:
+    run_blocks(sample, (5,), total_samples=50, num_workers=num_workers, output_file=path, base_seed=7,
+               block_size=3, max_pending_blocks=4, set_affinity=False)
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_worker_count(tmp_path):
+    # the output only depends on the seeds, not on how many workers there are or which one finishes first
+    outputs = [generate(str(tmp_path / f"out_{n}.jsonl"), n) for n in (1, 2, 4)]
+    assert outputs[0].count(b"\n") == 50
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert not mp.active_children()
+
+def test_failure_stops_workers(tmp_path):
+    # a worker dies on its sample: the run raises and no worker outlives it
+    bad_seed = sample_seed(3, 10)
+    with pytest.raises(RuntimeError):
+        run_blocks(raising_sample, (bad_seed,), total_samples=10 ** 6, num_workers=3, output_file=str(tmp_path / "out.jsonl"),
+                   base_seed=3, block_size=2, set_affinity=False)
+    assert not mp.active_children()
+
+def test_resume(tmp_path):
+    # a run killed partway and resumed gives the same file as an uninterrupted run
+    global crash_seed
+    kwargs = dict(total_samples=60, num_workers=2, base_seed=11, block_size=3, set_affinity=False, checkpoint_interval=0.)
+    full = str(tmp_path / "full.jsonl")
+    run_blocks(crashing_sample, (5,), output_file=full, **kwargs)
+    path = str(tmp_path / "out.jsonl")
+    crash_seed = sample_seed(11, 40)
+    try:
+        with pytest.raises(RuntimeError):
+            run_blocks(crashing_sample, (5,), output_file=path, **kwargs)
+    finally:
+        crash_seed = None
+    with open(manifest_path(path)) as f:
+        assert 0 < json.load(f)["sink"]["written"] < 60
+    with open(path, 'a') as f:
+        f.write('{"torn": ') # written after the last commit, dropped on resume
+    run_blocks(crashing_sample, (5,), output_file=path, resume=True, **kwargs)
+    with open(full, 'rb') as a, open(path, 'rb') as b:
+        assert a.read() == b.read()
+    # another config does not resume this manifest
+    kwargs["total_samples"] = 61
+    with pytest.raises(ValueError):
+        run_blocks(crashing_sample, (5,), output_file=path, resume=True, **kwargs)
@@ -0,0 +1,69 @@
+'''
+the random generators of a problem generator.
+
+Every component which draws random numbers (IdGen_PT, Graph and Problem, Data, Num, random_topological_sort,
+choose_from_softmax) takes an Rng: a python generator rng.py with the random.Random interface and a numpy generator
+rng.np with the numpy.random.RandomState interface. The default GLOBAL draws from the global random and np.random states
+as before, so fix_seed(seed) still decides everything. A generator with an Rng of its own does not touch the global state,
+so several of them can share a process, and reseeding is the construction of a new Rng:
+
+    id_gen = IdGen(..., rng=Rng.from_seed(seed)) # the same draws as fix_seed(seed) and IdGen(...)
+
+A numpy.random.Generator is accepted for rng.np as well, e.g. Rng(random.Random(seed), np.random.default_rng(seed)).
+It draws other numbers than a RandomState of the same seed.
+'''
+import random
+import numpy as np
+from typing import Optional
+
+class GeneratorView(object):
+    '''
+    the RandomState methods used by the generators, on top of a numpy.random.Generator.
+    '''
+    def __init__(self, gen: np.random.Generator):
+        self.gen = gen
+        self.randint = gen.integers # high is exclusive in both
+        self.random_sample = gen.random
+        self.randn = gen.standard_normal
+        self.choice = gen.choice
+        self.shuffle = gen.shuffle
+
+    def __reduce__(self):
+        return (GeneratorView, (self.gen,))
+
+class Rng(object):
+    def __init__(self, py=None, np_=None):
+        '''
+        py: a random.Random, default the global random state.
+        np_: a numpy.random.RandomState or numpy.random.Generator, default the global np.random state.
+        '''
+        self.py = random if py is None else py
+        if np_ is None:
+            np_ = np.random
+        elif isinstance(np_, np.random.Generator):
+            np_ = GeneratorView(np_)
+        self.np = np_
+
+    @classmethod
+    def from_seed(cls, seed: int) -> "Rng":
+        '''
+        the generators random.seed(seed) and np.random.seed(seed) would give, without setting the global ones.
+        numpy only takes 32-bit seeds; a larger one (e.g. of tools.parallel.sample_seed) seeds it with its 32-bit words.
+        '''
+        if seed < 2 ** 32:
+            return cls(random.Random(seed), np.random.RandomState(seed))
+        words = [(seed >> shift) & 0xffffffff for shift in range(0, seed.bit_length(), 32)]
+        return cls(random.Random(seed), np.random.RandomState(words))
+
+    def __reduce__(self):
+        # copies of a problem keep drawing from the global states; an Rng of its own is copied with its state
+        py = None if self.py is random else self.py
+        np_ = None if self.np is np.random else self.np
+        if py is None and np_ is None:
+            return (get_rng, (None,))
+        return (Rng, (py, np_))
+
+GLOBAL = Rng()
+
+def get_rng(rng: Optional[Rng]) -> Rng:
+    return GLOBAL if rng is None else rng
@@ -297,16 +297,20 @@ class Parser(object):
         '''
         wrong_cal = 0
         for sentence in self.sentence_lst:
+            if sentence.sign not in ("add", "sub", "mul"):
+                continue
+            # on the ints of the Nums, without building a Num per check
+            a, b = sentence.cal_part[0].a, sentence.cal_part[1].a
             if sentence.sign == "add":
-                if sentence.cal_part[0] + sentence.cal_part[1] != sentence.ans_part:
+                if (a + b) % mod != sentence.ans_part.a:
                     my_print(f"in {sentence.sentence}: {sentence.cal_part[0]} + {sentence.cal_part[1]} != {sentence.ans_part}")
                     wrong_cal += 1
             if sentence.sign == "sub":
-                if sentence.cal_part[0] - sentence.cal_part[1] != sentence.ans_part:
+                if (a - b) % mod != sentence.ans_part.a:
                     my_print(f"in {sentence.sentence}: {sentence.cal_part[0]} - {sentence.cal_part[1]} != {sentence.ans_part}")
                     wrong_cal += 1
             if sentence.sign == "mul":
-                if sentence.cal_part[0] * sentence.cal_part[1] != sentence.ans_part:
+                if (a * b) % mod != sentence.ans_part.a:
                     my_print(f"in {sentence.sentence}: {sentence.cal_part[0]} * {sentence.cal_part[1]} != {sentence.ans_part}")
                     wrong_cal += 1
         return wrong_cal, my_print
@@ -0,0 +1,45 @@
+import os
+from typing import List
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "gpt2")
+EOS = "<|endoftext|>"
+
+class GPT2BPE(object):
+    '''
+    the GPT-2 byte-level BPE, loaded from the vocab.json / merges.txt shipped in tools/assets/gpt2
+    (the files of OpenAI's GPT-2 release, MIT license), so no download is needed.
+    It gives the same ids as transformers' GPT2Tokenizer.from_pretrained('gpt2').
+
+    With the tokenizers package (a dependency of transformers) the BPE runs in Rust and encode_batch encodes
+    many texts in one call; otherwise it falls back to the pure Python GPT2Tokenizer built from the same files.
+    '''
+    def __init__(self, asset_dir: str=ASSET_DIR):
+        vocab_file = os.path.join(asset_dir, "vocab.json")
+        merges_file = os.path.join(asset_dir, "merges.txt")
+        try:
+            from tokenizers import Tokenizer, AddedToken, models, pre_tokenizers, decoders
+        except ImportError:
+            from transformers import GPT2Tokenizer
+            self.fast = None
+            self.slow = GPT2Tokenizer(vocab_file, merges_file)
+            return
+        self.fast = Tokenizer(models.BPE.from_file(vocab_file, merges_file))
+        self.fast.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+        self.fast.decoder = decoders.ByteLevel()
+        self.fast.add_special_tokens([AddedToken(EOS, special=True)])
+        self.slow = None
+
+    def encode(self, text: str) -> List[int]:
+        if self.fast is None:
+            return self.slow.encode(text)
+        return self.fast.encode(text, add_special_tokens=False).ids
+
+    def encode_batch(self, texts: List[str]) -> List[List[int]]:
+        if self.fast is None:
+            return [self.slow.encode(text) for text in texts]
+        return [e.ids for e in self.fast.encode_batch(texts, add_special_tokens=False)]
+
+    def decode(self, ids: List[int], skip_special_tokens: bool=False) -> str:
+        if self.fast is None:
+            return self.slow.decode(ids, skip_special_tokens=skip_special_tokens)
+        return self.fast.decode(list(ids), skip_special_tokens=skip_special_tokens)
@@ -3,19 +3,34 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-import os, re, torch, random, math, copy, base64
+import os, re, random, math, copy, base64
 import json
-import torch.nn.functional as F
-import torch.distributed as dist
-import pandas as pd
 from typing import Any, List, Union, Tuple, Dict
 import hashlib
 from const.params import mod
 import numpy as np
-import networkx as nx
-from transformers import GPT2Tokenizer
+from tools.dag import DAG
+from tools.rng import Rng, get_rng
 
-tokenizer = GPT2Tokenizer.from_pretrained('gpt2')
+# transformers, torch, pandas and networkx are only imported when they are needed,
+# so that the generation code (and every spawned worker) starts with numpy only
+_tokenizer = None
+
+def get_tokenizer():
+    '''
+    the GPT-2 tokenizer, loaded on first use from the files shipped in tools/assets/gpt2 (see tools.tokenizer).
+    '''
+    global _tokenizer
+    if _tokenizer is None:
+        from tools.tokenizer import GPT2BPE
+        _tokenizer = GPT2BPE()
+    return _tokenizer
+
+def __getattr__(name: str):
+    # keep `from tools.tools import tokenizer` working, it loads the tokenizer at that point
+    if name == "tokenizer":
+        return get_tokenizer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def fix_seed(seed: int):
     random.seed(seed)
@@ -50,33 +65,30 @@ def to_sketch(problem, prob: str=None, sol: str=None):
         # replace the numbers
         for i in range(mod-1, 0, -1):
             sol = sol.replace(str(i), "0")
-
-        # replace the symbols
-        sol = sol.replace(";", ".")
-        solution_sentences = sol.split(". ")
-        solution_grouped_parts = [solution_sentence.split(" ") for solution_sentence in solution_sentences]
-        ntns = []
-        for solution_group in solution_grouped_parts:
-            for part in solution_group:
-                if part in problem.all_symbols:
-                    if part not in ntns:
-                        ntns.append(part)
-        ntn_dict = {}
-        for i, ntn in enumerate(ntns):
-            ntn_dict[ntn] = problem.all_symbols[i]
-        
-        for i, solution_group in enumerate(solution_grouped_parts):
-            for j in range(len(solution_group)):
-                part = solution_group[j]
-                if part in problem.all_symbols:
-                    solution_grouped_parts[i][j] = ntn_dict[part]
-        
-        solution_sentences = [" ".join(solution_group) for solution_group in solution_grouped_parts]
-        sol = ". ".join(solution_sentences)
+        sol = rename_symbols(sol, problem.all_symbols)
         # print(f"sol:\n{sol}")
         sketch['sol'] = sol
     return sketch
 
+def rename_symbols(sol: str, symbols: List[str]) -> str:
+    '''
+    rename the symbols of a solution sketch to symbols[0], symbols[1], ... in the order they first appear.
+    '''
+    sol = sol.replace(";", ".")
+    solution_sentences = sol.split(". ")
+    solution_grouped_parts = [solution_sentence.split(" ") for solution_sentence in solution_sentences]
+    symbol_set = set(symbols)
+    ntn_dict = {}
+    for solution_group in solution_grouped_parts:
+        for j, part in enumerate(solution_group):
+            if part in symbol_set:
+                if part not in ntn_dict:
+                    ntn_dict[part] = symbols[len(ntn_dict)]
+                solution_group[j] = ntn_dict[part]
+    
+    solution_sentences = [" ".join(solution_group) for solution_group in solution_grouped_parts]
+    return ". ".join(solution_sentences)
+
 def to_hash(hash_string: str, mod_num=mod):
     '''
     return a hash value in [0, 1, ..., mod-1]
@@ -88,13 +100,14 @@ def to_hash(hash_string: str, mod_num=mod):
     # Return the hash value modulo a+1
     return hash_integer % (mod_num)
 
-def choose_from_softmax(lst: list, weight: list):
+def choose_from_softmax(lst: list, weight: list, rng: Rng=None):
     weight = np.array(weight)
     e_x = np.exp(weight - np.max(weight))
     p = e_x / np.sum(e_x)
-    return np.random.choice(lst, p=p)
+    return get_rng(rng).np.choice(lst, p=p)
 
 def show_info(output: List[int], problem, req_return=False):
+    tokenizer = get_tokenizer()
     print()
     problem.display()
     pre = 0
@@ -185,6 +198,7 @@ def idle_func(*args):
     pass
 
 def display_table(table: dict):
+    import pandas as pd
     pd.set_option('display.max_rows', None)
     pd.set_option('display.max_columns', None)
     def round_elems(x):
@@ -227,13 +241,14 @@ def display_table(table: dict):
         )
         print(row)
 
-def random_topological_sort(graph: nx.DiGraph):
+def random_topological_sort(graph: DAG, rng: Rng=None):
+    rng = get_rng(rng)
     # Make sure it's a directed acyclic graph
-    if not nx.is_directed_acyclic_graph(graph):
+    if not graph.is_acyclic():
         return None
 
     # Step 1: Compute the in-degree for each vertex
-    in_degree = dict(graph.in_degree())
+    in_degree = graph.in_degrees()
 
     # Step 1: Add vertices with in-degree 0 to the set
     zero_in_degree = [v for v, d in in_degree.items() if d == 0]
@@ -242,7 +257,7 @@ def random_topological_sort(graph: nx.DiGraph):
     topological_order = []
     while zero_in_degree:
         # Step 2a: Randomly remove a vertex u from the set
-        u = random.choice(zero_in_degree)
+        u = rng.py.choice(zero_in_degree)
         zero_in_degree.remove(u)
 
         # Step 2b: Add u to the topological order
@@ -256,15 +271,18 @@ def random_topological_sort(graph: nx.DiGraph):
 
     return topological_order
 
-def subgraph_with_paths_to_node(G: nx.DiGraph, target_node):
-    # Step 1: Reverse the graph
-    reversed_G = G.reverse()
-
-    # Step 2: Perform BFS or DFS to find nodes with a path to 'target_node'
-    reachable_nodes = set(nx.single_source_shortest_path(reversed_G, target_node))
+def subgraph_with_paths_to_node(G: DAG, target_node):
+    # Step 1: BFS on the reversed graph to find nodes with a path to 'target_node'
+    reachable_nodes = set(dict.fromkeys(G.ancestors(target_node)))
 
-    # Step 3: Create a subgraph with these nodes
-    subgraph = G.subgraph(reachable_nodes)
+    # Step 2: Create a subgraph with these nodes.
+    # The node order is the one networkx's G.subgraph(reachable_nodes) view iterates in, which
+    # random_topological_sort depends on: the order of its node set when that is less than half of G.
+    nodes = set(n for n in reachable_nodes if n in G)
+    if 2 * len(nodes) < len(G):
+        subgraph = G.subgraph(list(nodes))
+    else:
+        subgraph = G.subgraph([n for n in G if n in nodes])
 
     return subgraph
 
@@ -334,9 +352,10 @@ def mask_label2(label: List[int]):
     
     return label_new
 
-def shortest_path_lengths(G: nx.DiGraph) -> Dict[List[int], Dict[List[int], int]]:
+def shortest_path_lengths(G: DAG) -> Dict[List[int], Dict[List[int], int]]:
+    import networkx as nx
     # Compute shortest path lengths from each node
-    all_paths = dict(nx.all_pairs_shortest_path_length(G))
+    all_paths = dict(nx.all_pairs_shortest_path_length(G.to_networkx()))
 
     dist_dict = {}
     for i in G.nodes():
@@ -5,9 +5,8 @@
 
 from math_gen.problem_gen import Problem
 from tools.sol_parser import Parser
-from transformers import GPT2Config
-from tools.tools import subgraph_with_paths_to_node, tokenizer, MyPrint
-import torch, random, copy
+from tools.tools import subgraph_with_paths_to_node, get_tokenizer, MyPrint
+import copy
 from typing import Union, List, Tuple, TypeVar
 from data_gen.prototype.id_gen import IdGen_PT
 from const.params import test_bin
@@ -17,6 +16,7 @@ from const.params import mod
 TARGET = TypeVar("TARGET")
 
 def output_split(output: list, problem: Problem=None, skip_222=True):
+    tokenizer = get_tokenizer()
     my_print = MyPrint()
     if problem: prob_text = " " + ". ".join(problem.problem) + "."
     my_print("\n\n\n")
@@ -168,7 +168,7 @@ def re_ask(target: TARGET, param=None, ava_hash=test_bin, p_format="pq") -> TARG
         raise NotImplementedError
     
     if not param:
-        param = random.choice(problem.all_param)
+        param = problem.rng.py.choice(problem.all_param)
     
     # ask the param on the problem
     from tools.tools import random_topological_sort
@@ -183,11 +183,11 @@ def re_ask(target: TARGET, param=None, ava_hash=test_bin, p_format="pq") -> TARG
     original_problem_order = problem.problem_order
     original_problem = problem.problem
     problem.template = problem.whole_template
-    problem.problem_order = random_topological_sort(problem.template)
+    problem.problem_order = random_topological_sort(problem.template, problem.rng)
     for param_ in problem.problem_order:
         problem.parse(param=param_, inter_only=True)
     sol_template = subgraph_with_paths_to_node(problem.template, param)
-    problem.topological_order = random_topological_sort(sol_template)
+    problem.topological_order = random_topological_sort(sol_template, problem.rng)
     if (-1, 0, 0, 0) in problem.topological_order:
         problem.topological_order.remove((-1, 0, 0, 0))
     problem.solution = []
@@ -196,6 +196,7 @@ def re_ask(target: TARGET, param=None, ava_hash=test_bin, p_format="pq") -> TARG
     for param_ in problem.topological_order:
         problem.decode(param_)
     problem.ans = problem.lookup[problem.ques_idx].a
+    problem.hash_val = None # the solution changed
 
     problem.template = original_template
     problem.problem_order = original_problem_order
@@ -242,7 +243,7 @@ def lora_label_with_parser(problem: Problem, parser: Parser, keys: List[str], tr
             break
     labels = np.zeros((1+len(iter_list), len(problem.all_param), len(keys)), dtype=int)
 
-    in_degree = dict(problem.whole_template.in_degree())
+    in_degree = problem.whole_template.in_degrees()
 
     zero_in_degree = [v for v, d in in_degree.items() if d == 0]
     for i_, param in enumerate([(-1, 0, 0, 0)] + iter_list):